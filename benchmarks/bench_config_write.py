@@ -0,0 +1,97 @@
+"""
+Per-edit cost of the incremental config writer versus the full rewrite.
+
+    python benchmarks/bench_config_write.py [--peers 10000] [--edits 50]
+
+Times a rename/add/remove on a synthetic config through the patch
+operations (add_peer/rename_peer/remove_peer) and through the legacy
+parse_config() + write_config() round trip, and checks that unchanged
+bytes survive the incremental path.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wg_manager import WireGuardManager
+import wg_keys
+
+
+def synthetic_config(peers):
+    lines = [
+        "[Interface]",
+        "# Hub for the benchmark",
+        "PrivateKey = " + wg_keys.generate_private_key(),
+        "Address = 10.0.0.1/16",
+        "ListenPort = 51820",
+        "",
+    ]
+    pub = wg_keys.generate_keypair()[1]
+    for i in range(peers):
+        lines += [
+            "[Peer]",
+            f"# Name: client-{i}",
+            f"PublicKey = {pub[:-8]}{i:07d}=",
+            f"AllowedIPs = 10.0.{(i + 2) // 256}.{(i + 2) % 256}/32",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def timed(fn, count):
+    start = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return (time.perf_counter() - start) / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peers", type=int, default=10000)
+    parser.add_argument("--edits", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("LOCALAPPDATA", tmp)
+        conf_path = os.path.join(tmp, "wg0.conf")
+        with open(conf_path, "w", newline="") as f:
+            f.write(synthetic_config(args.peers))
+
+        manager = WireGuardManager()
+        manager.settings = dict(manager.settings, conf_path=conf_path)
+        model = manager.get_config()
+        keys = [peer.public_key for peer in model.peers[:args.edits]]
+
+        def legacy_rename(i):
+            data = manager.parse_config()
+            for p in data['peers']:
+                if p.get('PublicKey') == keys[i]:
+                    p['name'] = f"legacy-{i}"
+                    break
+            manager.write_config(data['interface'], data['peers'])
+
+        legacy_ms = timed(legacy_rename, args.edits)
+
+        with open(conf_path, newline="") as f:
+            before = f.read()
+        patch_ms = timed(lambda i: manager.rename_peer(keys[i], f"patched-{i}"), args.edits)
+        add_ms = timed(lambda i: manager.add_peer(f"new-{i}", f"NEW{i:040d}=", f"10.1.0.{i}/32"), args.edits)
+        remove_ms = timed(lambda i: manager.remove_peer(f"NEW{i:040d}="), args.edits)
+
+        with open(conf_path, newline="") as f:
+            after = f.read()
+        changed = sum(1 for a, b in zip(before.splitlines(), after.splitlines()) if a != b)
+
+        print(f"peers                 : {args.peers}")
+        print(f"legacy rewrite        : {legacy_ms:8.2f} ms/edit")
+        print(f"rename_peer           : {patch_ms:8.2f} ms/edit ({legacy_ms / patch_ms:.1f}x)")
+        print(f"add_peer              : {add_ms:8.2f} ms/edit")
+        print(f"remove_peer           : {remove_ms:8.2f} ms/edit")
+        print(f"lines changed on disk : {changed} (expected {args.edits})")
+
+
+if __name__ == "__main__":
+    main()
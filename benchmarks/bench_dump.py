@@ -0,0 +1,89 @@
+"""
+Compare the streaming `wg show dump` parser (wg_dump) with the previous
+dict-per-peer parser on synthetic dump output.
+
+    python benchmarks/bench_dump.py [--peers 50000] [--chunk 65536] [--runs 3]
+
+Reports the best time per parse, the peak traced memory while parsing and
+the memory and number of allocated blocks still held by the result.
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_dump
+from wg_dump import DumpParser
+
+
+def legacy_parse(output):
+    # What WireGuardManager.get_wg_show_dump() did before wg_dump
+    lines = output.decode('utf-8').strip().split('\n')
+    peers = []
+    for line in lines[1:]:
+        parts = line.split('\t')
+        if len(parts) >= 8:
+            peers.append({
+                "public_key": parts[0],
+                "preshared_key": parts[1],
+                "endpoint": parts[2],
+                "allowed_ips": parts[3],
+                "latest_handshake": int(parts[4]),
+                "transfer_rx": int(parts[5]),
+                "transfer_tx": int(parts[6]),
+                "persistent_keepalive": parts[7]
+            })
+    return peers
+
+
+def streaming_parse(output, chunk):
+    parser = DumpParser()
+    for i in range(0, len(output), chunk):
+        parser.feed(output[i:i + chunk])
+    return parser.close()
+
+
+def measure(label, fn, runs):
+    best = min(_timed(fn) for _ in range(runs))
+
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    result = fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    held_blocks = sys.getallocatedblocks() - blocks
+    print(f"{label:10}: {best * 1000:8.1f} ms  peak {peak / 2**20:6.1f} MiB  "
+          f"held {current / 2**20:6.1f} MiB in {held_blocks:,} blocks")
+    return result
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peers", type=int, default=50000)
+    parser.add_argument("--chunk", type=int, default=65536)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    output = make_dump(args.peers).encode()
+    print(f"{args.peers} peers, {len(output) / 2**20:.1f} MiB of dump output")
+    legacy = measure("legacy", lambda: legacy_parse(output), args.runs)
+    interface, table = measure("streaming", lambda: streaming_parse(output, args.chunk), args.runs)
+
+    assert table.as_dicts() == legacy, "parsers disagree"
+    assert interface is not None and interface.listen_port == "51820"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Load test for the Gatekeeper verify path on a fake wg.
+
+    python benchmarks/bench_gatekeeper.py [--requests 20000] [--concurrency 50]
+                                          [--mode core|asgi|http]
+
+--requests whitelisted users get a code, then every code is verified once,
+--concurrency requests at a time. Each successful verify starts a session
+(a `wg set` on the in-process fake wg). Modes:
+
+  core  call wg_gatekeeper.Gatekeeper.verify() directly
+  asgi  go through the FastAPI app in-process (httpx ASGI transport)
+  http  run the app under uvicorn on localhost and send real HTTP requests;
+        client and server share the process, so this is the one-core case
+
+Reports requests per second, latency percentiles and how many requests
+succeeded (all of them should).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from bench_sessions import make_manager, set_calls
+from synthetic import peer_address, peer_key
+from wg_gatekeeper import Gatekeeper, OtpStore, RateLimiter, StubMailSender
+
+
+def make_gatekeeper(workdir, users):
+    manager, fake = make_manager(workdir)
+    whitelist_path = os.path.join(workdir, "whitelist.json")
+    with open(whitelist_path, "w") as f:
+        json.dump({f"user{i}@example.com": {"public_key": peer_key(i), "address": peer_address(i)}
+                   for i in range(users)}, f)
+    manager.settings["whitelist_path"] = whitelist_path
+    # Limits out of the way: every request comes from the same address here
+    unlimited = RateLimiter(1e9, 1e9)
+    gatekeeper = Gatekeeper(manager, otps=OtpStore(ttl=3600, max_entries=users), sender=StubMailSender(quiet=True),
+                            email_limiter=unlimited, ip_limiter=unlimited)
+    assert len(gatekeeper.whitelist) == users
+    codes = [(f"user{i}@example.com", gatekeeper.otps.issue(f"user{i}@example.com")) for i in range(users)]
+    return gatekeeper, fake, codes
+
+
+async def drive(send, codes, concurrency):
+    latencies = []
+    ok = 0
+    queue = iter(codes)
+
+    async def worker():
+        nonlocal ok
+        for email, code in queue:
+            start = time.perf_counter()
+            if await send(email, code):
+                ok += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, ok
+
+
+class RawClient:
+    """ Minimal keep-alive HTTP/1.1 client, so the load generator costs less CPU than the server """
+
+    def __init__(self, port, connections):
+        self.port = port
+        self.connections = connections
+        self._idle = asyncio.Queue()
+
+    async def connect(self):
+        for _ in range(self.connections):
+            self._idle.put_nowait(await asyncio.open_connection("127.0.0.1", self.port))
+
+    async def post(self, path, data):
+        body = json.dumps(data).encode()
+        reader, writer = await self._idle.get()
+        try:
+            writer.write(b"POST %s HTTP/1.1\r\nHost: gatekeeper\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (path.encode(), len(body), body))
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            return status
+        finally:
+            self._idle.put_nowait((reader, writer))
+
+    async def close(self):
+        while not self._idle.empty():
+            _, writer = self._idle.get_nowait()
+            writer.close()
+
+
+async def run(mode, gatekeeper, codes, concurrency, port):
+    if mode == "core":
+        async def send(email, code):
+            await gatekeeper.verify(email, code, "127.0.0.1")
+            return True
+        return await drive(send, codes, concurrency)
+
+    from gatekeeper import create_app
+
+    app = create_app(gatekeeper)
+    if mode == "asgi":
+        import httpx
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://gatekeeper")
+
+        async def send(email, code):
+            response = await client.post("/otp/verify", json={"email": email, "code": code})
+            return response.status_code == 200
+        try:
+            return await drive(send, codes, concurrency)
+        finally:
+            await client.aclose()
+
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    client = RawClient(port, concurrency)
+    await client.connect()
+
+    async def send(email, code):
+        return await client.post("/otp/verify", {"email": email, "code": code}) == 200
+    try:
+        return await drive(send, codes, concurrency)
+    finally:
+        await client.close()
+        server.should_exit = True
+        await serving
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--mode", choices=("core", "asgi", "http"), default="http")
+    parser.add_argument("--port", type=int, default=18443)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="wgbench-gatekeeper-") as workdir:
+        gatekeeper, fake, codes = make_gatekeeper(workdir, args.requests)
+        elapsed, latencies, ok = asyncio.run(run(args.mode, gatekeeper, codes, args.concurrency, args.port))
+        gatekeeper.close()
+
+        latencies.sort()
+        pct = lambda p: latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)] * 1000
+        print(f"{args.mode}: {len(latencies)} verify requests in {elapsed:.2f}s = {len(latencies) / elapsed:,.0f}/s "
+              f"(p50 {pct(50):.1f} ms, p99 {pct(99):.1f} ms, concurrency {args.concurrency})")
+        print(f"succeeded: {ok}, sessions: {len(gatekeeper.sessions)}, "
+              f"peers on the fake wg: {len(fake.wg.interfaces['wg0']['peers'])}, "
+              f"wg set invocations: {set_calls(fake)}")
+        assert ok == len(codes) == len(gatekeeper.sessions)
+
+
+if __name__ == "__main__":
+    main()
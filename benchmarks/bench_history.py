@@ -0,0 +1,142 @@
+"""
+Config history growth and cost on a large config.
+
+    python benchmarks/bench_history.py [--peers 10000] [--edits 300] [--keep 100]
+
+Makes --edits renames/adds/removes through WireGuardManager on a synthetic
+--peers config and reports how much the history directory grew, next to
+what a full copy per edit (the old .bak scheme, kept) would take and the size
+of the changed sections. Then checks that sampled revisions read back byte
+for byte, times listing and restoring, and repeats the edits with retention
+at --keep revisions to show the pack being rewritten.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import synthetic
+from wg_manager import WireGuardManager
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def make_manager(workdir, peers, keep=None):
+    os.environ["LOCALAPPDATA"] = workdir
+    conf_path, _ = synthetic.write_fixture(os.path.join(workdir, "conf"), peers)
+    manager = WireGuardManager(app_name="bench")
+    settings = dict(manager.settings, conf_path=conf_path)
+    if keep:
+        settings["history_max_revisions"] = keep
+    manager.settings = settings
+    return manager, conf_path
+
+
+def edit(manager, rng, i, peers):
+    # Mostly renames, some adds and removes, like a day of admin work
+    kind = rng.random()
+    if kind < 0.6:
+        public_key = synthetic.peer_key(rng.randrange(peers))
+        manager.rename_peer(public_key, f"renamed-{i}")
+        return 2 * len(f"# Name: renamed-{i}\n")
+    if kind < 0.8 or i < 10:
+        manager.add_peer(f"added-{i}", f"ADDED{i:038d}=", f"10.200.{i // 250}.{i % 250 + 1}/32")
+        return 80
+    config = manager.get_config()
+    added = [p for p in config.peers if p.public_key.startswith("ADDED")]
+    if not added:
+        return 0
+    manager.remove_peer(rng.choice(added).public_key)
+    return 80
+
+
+def read_file(path):
+    with open(path, newline="") as f:
+        return f.read()
+
+
+def run(workdir, peers, edits, keep=None, samples=20):
+    manager, conf_path = make_manager(workdir, peers, keep)
+    history = manager.get_history()
+    rng = random.Random(0)
+    full_copies = diff_bytes = 0
+    snapshots = {}
+    sample_at = set(rng.sample(range(edits), min(samples, edits)))
+
+    start = time.perf_counter()
+    for i in range(edits):
+        diff_bytes += edit(manager, rng, i, peers)
+        full_copies += os.path.getsize(conf_path)
+        if i == 0:
+            baseline = directory_size(history.directory)
+        if i in sample_at:
+            snapshots[history.latest().id] = read_file(conf_path)
+    per_edit = (time.perf_counter() - start) / edits * 1000
+
+    start = time.perf_counter()
+    revisions = manager.get_history().revisions()
+    list_ms = (time.perf_counter() - start) * 1000
+    kept = {r.id for r in revisions}
+    checked = 0
+    start = time.perf_counter()
+    for revision_id, text in snapshots.items():
+        if revision_id in kept:
+            assert history.read(revision_id) == text, f"revision {revision_id} differs"
+            checked += 1
+    read_ms = (time.perf_counter() - start) / max(checked, 1) * 1000
+
+    oldest = revisions[-1].id
+    start = time.perf_counter()
+    restored = manager.restore_revision(oldest)
+    restore_ms = (time.perf_counter() - start) * 1000
+    assert read_file(conf_path) == restored
+    size = directory_size(history.directory)
+    return {"per_edit": per_edit, "history": size, "growth": (size - baseline) / (edits - 1), "full": full_copies,
+            "diff": diff_bytes, "revisions": len(revisions), "list_ms": list_ms, "read_ms": read_ms,
+            "restore_ms": restore_ms, "checked": checked, "conf": os.path.getsize(conf_path),
+            "stats": history.stats()}
+
+
+def report(title, result):
+    print(title)
+    print(f"  config size          : {result['conf'] / 1024:10.1f} KiB")
+    print(f"  edit + record        : {result['per_edit']:10.2f} ms/edit")
+    print(f"  history on disk      : {result['history'] / 1024:10.1f} KiB ({result['stats']['objects']} objects, "
+          f"{result['revisions']} revisions kept)")
+    print(f"  growth per edit      : {result['growth']:10.0f} B (after the first edit)")
+    print(f"  full copy per edit   : {result['full'] / 1024:10.1f} KiB")
+    print(f"  changed sections     : {result['diff'] / 1024:10.1f} KiB (lines touched by the edits)")
+    print(f"  list revisions       : {result['list_ms']:10.2f} ms")
+    print(f"  read a revision      : {result['read_ms']:10.2f} ms ({result['checked']} checked byte for byte)")
+    print(f"  restore the oldest   : {result['restore_ms']:10.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peers", type=int, default=10000)
+    parser.add_argument("--edits", type=int, default=300)
+    parser.add_argument("--keep", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="wgbench-history-") as workdir:
+        result = run(workdir, args.peers, args.edits)
+        report(f"{args.peers} peers, {args.edits} edits, default retention", result)
+        # One section and a node per tree level per edit, nowhere near a copy
+        assert result["growth"] < 4096
+    with tempfile.TemporaryDirectory(prefix="wgbench-history-") as workdir:
+        result = run(workdir, args.peers, args.edits, keep=args.keep)
+        report(f"{args.peers} peers, {args.edits} edits, keeping {args.keep} revisions", result)
+        assert result["revisions"] <= args.keep
+        assert result["history"] < 2 * result["conf"] + 2 * 1024 * 1024
+
+
+if __name__ == "__main__":
+    main()
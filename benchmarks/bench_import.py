@@ -0,0 +1,88 @@
+"""
+Measure how long the headless modules take to import, in a fresh interpreter.
+
+    python benchmarks/bench_import.py [--runs 10] [--budget-ms 15]
+
+Each module is imported in a new `python -c` process and compared with an
+interpreter that imports nothing. Fails (exit 1) when a module pulls in a GUI
+or heavy dependency, or when --budget-ms is given and the median import cost
+exceeds it. The module-level imports of main.py, without customtkinter and
+tkinter, are measured too: they run before the window is painted, so they
+must not load what only one view needs.
+"""
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["wg_manager", "wg_cli"]
+# Must never be imported just by importing the headless modules
+HEAVY = ["customtkinter", "tkinter", "qrcode", "PIL", "cryptography"]
+# Imported by main.py on first use of a view, never before the window appears
+DEFERRED = ["wg_monitor", "wg_render", "wg_provision", "multiprocessing", "concurrent.futures"]
+GUI = ("customtkinter", "tkinter")
+
+PROBE = """
+import sys, time
+t = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - t
+loaded = [m for m in {heavy!r} if m in sys.modules]
+print(elapsed, ",".join(loaded))
+"""
+
+
+def main_imports():
+    # The import statements at the top level of main.py, minus the GUI toolkit
+    with open(os.path.join(ROOT, "main.py")) as f:
+        tree = ast.parse(f.read())
+    lines = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            names = [node.module] if isinstance(node, ast.ImportFrom) else [a.name for a in node.names]
+            if not any(name.split(".")[0] in GUI for name in names):
+                lines.append(ast.unparse(node))
+    return "\n".join(lines)
+
+
+def probe(module, heavy=HEAVY):
+    imports = "pass" if module is None else main_imports() if module == "main.py" else f"import {module}"
+    code = PROBE.format(imports=imports, heavy=heavy)
+    t = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT).decode().split()
+    total = time.perf_counter() - t
+    return total, float(output[0]), output[1].split(",") if len(output) > 1 else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, help="fail when a module's median import exceeds this")
+    args = parser.parse_args()
+
+    baseline = statistics.median(probe(None)[0] for _ in range(args.runs))
+    print(f"{'bare python':12}: {baseline * 1000:7.1f} ms process")
+
+    failed = False
+    for module in MODULES + ["main.py"]:
+        runs = [probe(module, HEAVY + DEFERRED if module == "main.py" else HEAVY) for _ in range(args.runs)]
+        process = statistics.median(r[0] for r in runs)
+        imported = statistics.median(r[1] for r in runs)
+        heavy = sorted(set(m for r in runs for m in r[2]))
+        print(f"{module:12}: {process * 1000:7.1f} ms process (+{(process - baseline) * 1000:.1f}), "
+              f"import {imported * 1000:.1f} ms")
+        if heavy:
+            print(f"  FAIL: imports {', '.join(heavy)}")
+            failed = True
+        if args.budget_ms is not None and imported * 1000 > args.budget_ms:
+            print(f"  FAIL: over the {args.budget_ms:.0f} ms budget")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Compare the in-process key engine against the `wg genkey` / `wg pubkey`
+subprocess path that WireGuardManager used before.
+
+    python benchmarks/bench_keys.py [--count 200] [--wg PATH]
+
+When a `wg` executable is available the script also checks that every
+in-process public key matches `wg pubkey` byte for byte.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wg_keys
+
+
+def subprocess_keypair(wg_exe):
+    priv_key = subprocess.check_output([wg_exe, "genkey"], shell=False).decode().strip()
+    pub_key = subprocess.check_output([wg_exe, "pubkey"], input=priv_key.encode(), shell=False).decode().strip()
+    return priv_key, pub_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--wg", default=shutil.which("wg") or shutil.which("wg.exe"))
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pairs = wg_keys.generate_keypairs(args.count)
+    in_process = time.perf_counter() - start
+    print(f"in-process batch : {args.count} keypairs in {in_process:.3f}s "
+          f"({in_process / args.count * 1000:.2f} ms/keypair)")
+
+    if not args.wg:
+        print("subprocess path  : skipped (no wg executable found, use --wg)")
+        return
+
+    start = time.perf_counter()
+    for _ in range(args.count):
+        subprocess_keypair(args.wg)
+    sub_elapsed = time.perf_counter() - start
+    print(f"subprocess path  : {args.count} keypairs in {sub_elapsed:.3f}s "
+          f"({sub_elapsed / args.count * 1000:.2f} ms/keypair)")
+    print(f"speedup          : {sub_elapsed / in_process:.1f}x")
+
+    mismatches = 0
+    for priv_key, pub_key in pairs:
+        expected = subprocess.check_output([args.wg, "pubkey"], input=priv_key.encode()).decode().strip()
+        if expected != pub_key:
+            mismatches += 1
+    print(f"wg pubkey check  : {len(pairs) - mismatches}/{len(pairs)} identical")
+
+
+if __name__ == "__main__":
+    main()
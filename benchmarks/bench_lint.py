@@ -0,0 +1,100 @@
+"""
+Config lint and AllowedIPs lookups on a large synthetic config.
+
+    python benchmarks/bench_lint.py [--peers 100000] [--budget-ms 1000]
+
+Times the full lint pass (wg_lint) and building the radix tree (wg_prefix),
+then "which peer owns this IP" and "does this new range overlap anyone"
+through the tree next to a linear scan over all peers with ipaddress, the way
+it would be done by hand. Planted problems (a duplicate key, an overlapping
+range, a malformed key) must all be reported; fails if linting takes longer
+than --budget-ms.
+"""
+import argparse
+import ipaddress
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import synthetic
+from wg_config import ConfigDocument
+from wg_lint import lint_document
+from wg_prefix import PrefixIndex, parse_network
+
+
+def planted(peers):
+    # Problems appended to a clean config; each must come out of the lint pass
+    return (f"\n[Peer]\n# Name: copy\nPublicKey = {synthetic.peer_key(1)}\nAllowedIPs = 10.250.0.1/32\n"
+            f"\n[Peer]\n# Name: wide\nPublicKey = {synthetic.peer_key(peers + 1)}\n"
+            f"AllowedIPs = {synthetic.peer_address(peers // 2).split('/')[0]}/30\n"
+            f"\n[Peer]\n# Name: broken\nPublicKey = not-a-key\nAllowedIPs = 10.250.0.2/32\n")
+
+
+def best_of(fn, runs=3):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def linear_owner(model, address):
+    ip = ipaddress.ip_address(address)
+    best = None
+    for peer in model.peers:
+        for entry in peer.allowed_ips.split(','):
+            network = ipaddress.ip_network(entry.strip(), strict=False)
+            if ip in network and (best is None or network.prefixlen > best[0]):
+                best = (network.prefixlen, peer)
+    return best[1] if best else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peers", type=int, default=100000)
+    parser.add_argument("--budget-ms", type=float, default=1000)
+    args = parser.parse_args()
+
+    document = ConfigDocument.parse(synthetic.make_config(args.peers) + planted(args.peers))
+    model = document.model
+
+    lint_s, issues = best_of(lambda: lint_document(document))
+    codes = {issue.code for issue in issues}
+    print(f"{args.peers} peers")
+    print(f"lint                 : {lint_s * 1000:10.1f} ms, {len(issues)} issues ({', '.join(sorted(codes))})")
+    assert {"duplicate-public-key", "overlap", "invalid-key"} <= codes, codes
+
+    build_s, index = best_of(lambda: PrefixIndex.from_config(model), runs=1)
+    print(f"radix tree build     : {build_s * 1000:10.1f} ms, {index.count} prefixes")
+
+    target = synthetic.peer_address(args.peers - 1).split('/')[0]
+    lookups = 10000
+    start = time.perf_counter()
+    for _ in range(lookups):
+        owner = index.owner(target)
+    tree_us = (time.perf_counter() - start) / lookups * 1e6
+    scan_s, scanned = best_of(lambda: linear_owner(model, target), runs=1)
+    assert owner is not None and owner is scanned, (owner, scanned)
+    print(f"owner(ip), tree      : {tree_us:10.1f} us")
+    print(f"owner(ip), scan      : {scan_s * 1e6:10.1f} us")
+
+    start = time.perf_counter()
+    for _ in range(lookups):
+        conflicts = index.overlaps(parse_network(target + "/31"))
+    print(f"overlap check, tree  : {(time.perf_counter() - start) / lookups * 1e6:10.1f} us, "
+          f"{len(conflicts)} conflicting prefixes")
+    assert conflicts
+
+    budget_ok = lint_s * 1000 <= args.budget_ms
+    print(f"lint budget {args.budget_ms:.0f} ms: {'ok' if budget_ok else 'EXCEEDED'}")
+    sys.exit(0 if budget_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
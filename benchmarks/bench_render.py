@@ -0,0 +1,75 @@
+"""
+Compare the QR display path main.py used before (make_image -> PNG ->
+Image.open) with wg_render, and time batch artifact writing.
+
+    python benchmarks/bench_render.py [--count 50] [--batch 200]
+
+Requires qrcode and Pillow.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wg_render
+
+CONF = ("[Interface]\nPrivateKey = {key}\nAddress = 10.0.{hi}.{lo}/32\nDNS = 1.1.1.1\n\n[Peer]\n"
+        "PublicKey = hSDwCYkwp1R0i33ctD73Wg2/Og0mOBr066SpjqqbTmo=\nEndpoint = vpn.example.com:51820\nAllowedIPs = 0.0.0.0/0")
+
+
+def make_conf(i):
+    import wg_keys
+
+    return CONF.format(key=wg_keys.generate_private_key(), hi=i // 250, lo=i % 250 + 2)
+
+
+def legacy_image(conf_text):
+    import qrcode
+    from PIL import Image
+
+    qr = qrcode.QRCode(version=1, box_size=5, border=2)
+    qr.add_data(conf_text)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    photo = Image.open(io.BytesIO(buf.getvalue()))
+    photo.load()
+    return photo
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=200)
+    args = parser.parse_args()
+
+    confs = [make_conf(i) for i in range(args.count)]
+    renderer = wg_render.ArtifactRenderer()
+    print(f"legacy display   : {timed(legacy_image, confs):.2f} ms/config")
+    print(f"renderer (cold)  : {timed(renderer.image, confs):.2f} ms/config")
+    print(f"renderer (cached): {timed(renderer.image, confs):.3f} ms/config")
+
+    items = [(f"client{i}", make_conf(i)) for i in range(args.batch)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for output in (os.path.join(tmp, "out"), os.path.join(tmp, "out.zip")):
+            start = time.perf_counter()
+            files = wg_render.write_artifacts(items, output)
+            elapsed = time.perf_counter() - start
+            print(f"batch {os.path.basename(output):7}: {files} files in {elapsed:.2f}s "
+                  f"({args.batch / elapsed:.1f} clients/s)")
+
+
+if __name__ == "__main__":
+    main()
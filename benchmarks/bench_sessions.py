@@ -0,0 +1,104 @@
+"""
+Gatekeeper session scheduler (wg_sessions) on a fake wg.
+
+    python benchmarks/bench_sessions.py [--sessions 100000] [--burst 10000]
+
+Starts --sessions sessions one at a time with expiries spread over 8-12
+hours, then expires them all by stepping the clock one second at a time,
+then expires --burst sessions that run out at the same moment. Reports the
+cost per activation, the number of `wg set` invocations per expiry sweep,
+the journal size and how long replaying it takes. The fake wg state is
+checked at each step, so this doubles as an end-to-end test.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from synthetic import peer_address, peer_key
+from wg_fake import FakeBackend
+from wg_manager import WireGuardManager
+from wg_runner import CommandRunner
+from wg_sessions import SessionScheduler
+
+START = 1700000000
+
+
+def make_manager(workdir):
+    os.environ["LOCALAPPDATA"] = workdir
+    fake = FakeBackend()
+    fake.wg.interfaces["wg0"] = {"private_key": "(none)", "listen_port": "51820", "fwmark": "off", "peers": {}}
+    manager = WireGuardManager(app_name="bench", runner=CommandRunner(backend=fake, timeout=60))
+    manager.settings = {"wg_path": "wg", "wg_backend": "wg", "interface_name": "wg0"}
+    return manager, fake
+
+
+def set_calls(fake):
+    return sum(1 for call in fake.calls if call[1:2] == ["set"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--burst", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory(prefix="wgbench-sessions-") as workdir:
+        manager, fake = make_manager(workdir)
+        live = fake.wg.interfaces["wg0"]["peers"]
+        journal = os.path.join(workdir, "sessions.journal")
+        sessions = SessionScheduler(manager, journal)
+
+        # Whole seconds, so several sessions share an expiry like real logins do
+        expiries = [START + rng.randrange(8 * 3600, 12 * 3600) for _ in range(args.sessions)]
+        start = time.perf_counter()
+        for i, expires_at in enumerate(expiries):
+            sessions.activate(peer_key(i), peer_address(i), label=f"user{i}@example.com", expires_at=expires_at)
+        elapsed = time.perf_counter() - start
+        print(f"activate: {args.sessions} sessions in {elapsed:.2f}s "
+              f"({elapsed / args.sessions * 1e6:.1f} us each, including the fake wg set)")
+        assert len(live) == len(sessions) == args.sessions
+
+        size = os.path.getsize(journal)
+        start = time.perf_counter()
+        replayed = SessionScheduler(manager, journal)
+        print(f"journal: {size / 2**20:.1f} MiB, replayed in {(time.perf_counter() - start) * 1000:.0f} ms")
+        assert len(replayed) == args.sessions and replayed.next_expiry() == min(expiries)
+
+        calls = set_calls(fake)
+        sweeps = expired = 0
+        start = time.perf_counter()
+        now = min(expiries)
+        while len(sessions):
+            batch = sessions.expire_due(now)
+            sweeps += bool(batch)
+            expired += len(batch)
+            now += 1
+        elapsed = time.perf_counter() - start
+        invocations = set_calls(fake) - calls
+        print(f"expire: {expired} sessions in {sweeps} sweeps, {invocations} wg set invocations, {elapsed:.2f}s")
+        assert expired == args.sessions and not live and invocations == len(set(expiries))
+
+        # Everyone logged in at the same second: one sweep, split only by command line length
+        sessions.activate_many([(peer_key(i), peer_address(i), "") for i in range(args.burst)], expires_at=now)
+        calls = set_calls(fake)
+        start = time.perf_counter()
+        batch = sessions.expire_due(now)
+        elapsed = time.perf_counter() - start
+        print(f"burst: {len(batch)} simultaneous expiries, {set_calls(fake) - calls} wg set invocations, "
+              f"{elapsed * 1000:.0f} ms")
+        assert len(batch) == args.burst and not live
+        sessions.close()
+        print(f"journal after compaction: {os.path.getsize(journal)} bytes")
+
+
+if __name__ == "__main__":
+    main()
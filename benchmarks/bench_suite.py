@@ -0,0 +1,191 @@
+"""
+Benchmark suite for WireGuardManager on synthetic tunnels.
+
+    python benchmarks/bench_suite.py [--sizes 10,1000,10000,100000] [--runs 5]
+                                     [--backend process|inprocess]
+                                     [--output results.json] [--compare old.json]
+
+For every size a wg0.conf and a `wg show dump` output are generated
+(synthetic.py), and the manager is pointed at them with fake_wg.py and
+fake_sc.py as the wg/sc executables (--backend process, spawns real
+processes) or with wg_fake.FakeBackend (--backend inprocess). Results are
+written as JSON so runs can be compared with --compare.
+
+The Clients and Monitor rows time the data work behind those views
+(search index and snapshot building); creating the widgets needs a display
+and is not included.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import synthetic
+import wg_keys
+from wg_allocator import AddressAllocator
+from wg_config import PeerSearchIndex
+from wg_manager import WireGuardManager
+from wg_monitor import build_snapshot
+from wg_runner import CommandRunner
+from wg_service import ScServiceBackend
+from wg_stats import ThroughputEngine
+
+DEFAULT_SIZES = "10,1000,10000,100000"
+# Stop repeating an operation once it has used this much time
+TIME_BUDGET = 3.0
+KEYGEN_COUNT = 100
+
+
+def time_op(fn, runs, setup=None):
+    samples = []
+    spent = 0.0
+    while len(samples) < runs and (not samples or spent < TIME_BUDGET):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed)
+        spent += elapsed
+    return {
+        "runs": len(samples),
+        "min_ms": round(min(samples) * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def make_manager(workdir, conf_path, dump_path, backend):
+    # Settings live in the work directory, never in the user's AppData
+    os.environ["LOCALAPPDATA"] = workdir
+    state_path = os.path.join(workdir, "fake_wg_state.json")
+    if backend == "process":
+        os.environ["FAKE_WG_STATE"] = state_path
+        os.environ["FAKE_WG_DUMP"] = dump_path
+        runner = CommandRunner(timeout=60)
+        wg_path = os.path.join(HERE, "fake_wg.py")
+    else:
+        from wg_fake import FakeBackend
+
+        fake = FakeBackend(installed=("wg0",))
+        fake.wg.interfaces["wg0"] = {}
+        with open(dump_path, "rb") as f:
+            dump = f.read().decode()
+        fake_wg = fake.handlers["wg"]
+        fake.handlers["wg"] = lambda argv, stdin: (0, dump, "") if argv[2:] == ["dump"] else fake_wg(argv, stdin)
+        runner = CommandRunner(backend=fake, timeout=60)
+        wg_path = "wg"
+
+    manager = WireGuardManager(app_name="bench", runner=runner)
+    manager.settings = {"wg_path": wg_path, "wg_backend": "wg", "conf_path": conf_path, "interface_name": "wg0",
+                        "endpoint": "vpn.example.com:51820", "service_backend": "sc"}
+    watcher = manager.get_service_watcher()
+    if backend == "process":
+        watcher.backend = ScServiceBackend(runner, sc_exe=os.path.join(HERE, "fake_sc.py"))
+        with open(state_path, "w") as f:
+            json.dump({"interfaces": {"wg0": {}}, "calls": []}, f)
+    return manager
+
+
+def bench_size(size, runs, backend):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix=f"wgbench-{size}-") as workdir:
+        t = time.perf_counter()
+        conf_path, dump_path = synthetic.write_fixture(workdir, size)
+        print(f"[{size} peers] fixture written in {time.perf_counter() - t:.1f}s", file=sys.stderr)
+        manager = make_manager(workdir, conf_path, dump_path, backend)
+
+        def cold():
+            manager.config_cache.invalidate()
+
+        results["parse_config"] = time_op(manager.parse_config, runs, setup=cold)
+        results["get_config (cached)"] = time_op(manager.get_config, runs)
+
+        data = manager.parse_config()
+        results["write_config"] = time_op(lambda: manager.write_config(data["interface"], data["peers"]), runs)
+        first_key = manager.get_config().peers[0].public_key
+        names = iter(range(10 ** 9))
+        results["rename_peer"] = time_op(lambda: manager.rename_peer(first_key, f"renamed-{next(names)}"), runs)
+
+        model = manager.get_config()
+        results["get_next_ip (cold)"] = time_op(lambda: AddressAllocator.from_config(model).next_free(4), runs)
+        manager.get_next_ip()
+        results["get_next_ip"] = time_op(manager.get_next_ip, runs)
+
+        results["get_wg_show_dump"] = time_op(manager.get_wg_show_dump, runs)
+        results["read_wg_dump"] = time_op(manager.read_wg_dump, runs)
+        results["get_service_status"] = time_op(lambda: manager.get_service_status(max_age=0), runs)
+
+        def clients_view():
+            # What search_clients() does (on a task worker) on opening the view and typing a query
+            index = PeerSearchIndex(manager.get_config())
+            for query in ("", "c", "cl", "client-0", "client-00012"):
+                index.search(query)
+        results["clients_view_data"] = time_op(clients_view, runs)
+
+        engine = ThroughputEngine(capacity=720)
+        results["monitor_snapshot"] = time_op(lambda: build_snapshot(manager, engine), runs)
+    return results
+
+
+def compare(current, previous):
+    old = {(r["size"], r["op"]): r for r in previous["results"]}
+    print(f"\n{'size':>7} {'operation':24} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    for r in current["results"]:
+        before = old.get((r["size"], r["op"]))
+        if before is None or not before["median_ms"]:
+            continue
+        ratio = r["median_ms"] / before["median_ms"]
+        print(f"{r['size']:>7} {r['op']:24} {before['median_ms']:>10.2f} {r['median_ms']:>10.2f} {ratio:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated peer counts")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", choices=("process", "inprocess"), default="process")
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "runs": args.runs,
+        },
+        "results": [],
+    }
+    keygen = time_op(lambda: wg_keys.generate_keypairs(KEYGEN_COUNT), args.runs)
+    report["results"].append(dict(size=KEYGEN_COUNT, op="generate_keypairs", **keygen))
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        for op, timing in bench_size(size, args.runs, args.backend).items():
+            report["results"].append(dict(size=size, op=op, **timing))
+            print(f"{size:>7} {op:24} {timing['median_ms']:>10.2f} ms (min {timing['min_ms']:.2f}, "
+                  f"{timing['runs']} runs)", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
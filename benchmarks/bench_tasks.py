@@ -0,0 +1,131 @@
+"""
+Blocking manager calls from the GUI, on the UI thread versus on wg_tasks.TaskRunner.
+
+    python benchmarks/bench_tasks.py [--peers 5000] [--edits 5] [--delay 0.05]
+
+Replays what a user does in the Clients and Status views: --edits quick
+client adds on wg0, each answered with "apply now", three clicks on Restart
+and a status check of wg1. The UI thread is simulated by a loop that ticks
+every 10 ms and calls pump(), like App's after() loop. Reports the longest
+tick gap (how long the window would freeze) for both ways, and checks that
+the applies and restarts were coalesced, that every add landed before the
+apply and that a cancelled task never runs.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import synthetic
+from bench_tunnels import make_manager
+from wg_tasks import TaskRunner, CANCELLED
+
+TICK = 0.01
+
+
+class Counter:
+    # Wraps what the session submits and counts the calls that really ran
+    def __init__(self, fn):
+        self.fn = fn
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        return self.fn(*args)
+
+
+def user_session(manager, submit, first_key, edits, counters):
+    # submit(fn, *args, lane, key) like App.run_task
+    wg0, wg1 = manager.tunnel("wg0"), manager.tunnel("wg1")
+    applies, restarts = counters
+    for i in range(edits):
+        n = first_key + i
+        submit(wg0.add_peer, f"new-{n}", synthetic.peer_key(n), f"10.200.{n // 250}.{n % 250 + 1}/32", lane="wg0")
+        submit(applies, lane="wg0", key="apply")
+    for _ in range(3):
+        submit(restarts, "restart", lane="wg0", key="service")
+    submit(wg1.get_service_status, lane="wg1", key="status")
+
+
+def on_ui_thread(manager, first_key, edits, counters):
+    worst = 0.0
+
+    def submit(fn, *args, lane=None, key=None):
+        nonlocal worst
+        start = time.perf_counter()
+        fn(*args)
+        worst = max(worst, time.perf_counter() - start)
+    start = time.perf_counter()
+    user_session(manager, submit, first_key, edits, counters)
+    return worst, time.perf_counter() - start
+
+
+def on_runner(manager, first_key, edits, counters):
+    runner = TaskRunner()
+    results = []
+
+    def submit(fn, *args, lane=None, key=None):
+        runner.submit(fn, *args, lane=lane, key=key, on_done=results.append)
+    start = time.perf_counter()
+    user_session(manager, submit, first_key, edits, counters)
+    worst = 0.0
+    last = time.perf_counter()
+    while runner.active():
+        time.sleep(TICK)
+        runner.pump()
+        now = time.perf_counter()
+        worst = max(worst, now - last - TICK)
+        last = now
+    runner.pump()
+    elapsed = time.perf_counter() - start
+
+    # A task cancelled while it waits is dropped without running
+    blocker = runner.submit(time.sleep, 0.2, lane="wg0")
+    ran = []
+    waiting = runner.submit(ran.append, 1, lane="wg0")
+    waiting.cancel()
+    runner.wait()
+    runner.pump()
+    assert blocker.state != CANCELLED and waiting.state == CANCELLED and not ran
+    runner.shutdown()
+    return worst, elapsed, runner.coalesced, len(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peers", type=int, default=5000)
+    parser.add_argument("--edits", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="wgbench-tasks-") as workdir:
+        manager = make_manager(workdir, 2, args.peers, args.delay)
+        wg0 = manager.tunnel("wg0")
+        applies, restarts = counters = Counter(wg0.apply_changes), Counter(wg0.control_service)
+        print(f"{args.edits} adds + applies, 3 restarts and a status check on {args.peers}-peer tunnels, "
+              f"{args.delay * 1000:.0f} ms per command")
+
+        sync_worst, sync_total = on_ui_thread(manager, args.peers + 1, args.edits, counters)
+        print(f"UI thread  : longest freeze {sync_worst * 1000:8.1f} ms, {sync_total * 1000:8.1f} ms frozen in total, "
+              f"{applies.calls} applies, {restarts.calls} restarts")
+
+        applies.calls = restarts.calls = 0
+        worst, total, coalesced, delivered = on_runner(manager, args.peers + 1 + args.edits, args.edits, counters)
+        print(f"TaskRunner : longest freeze {worst * 1000:8.1f} ms, done after {total * 1000:8.1f} ms, "
+              f"{applies.calls} applies, {restarts.calls} restarts ({coalesced} requests coalesced)")
+
+        # All adds are written before the single apply that follows them
+        assert applies.calls == 1 and restarts.calls == 1, (applies.calls, restarts.calls)
+        assert len(wg0.get_config().peers) == args.peers + 2 * args.edits
+        # One result per task that ran: callers passing the same callback are told once
+        assert delivered == args.edits + 3, delivered
+        assert worst < sync_worst, (worst, sync_worst)
+
+
+if __name__ == "__main__":
+    main()
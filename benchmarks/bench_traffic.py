@@ -0,0 +1,134 @@
+"""
+Traffic history (wg_traffic) for a year of samples on a large tunnel.
+
+    python benchmarks/bench_traffic.py [--peers 5000] [--days 400] [--interval 21600] [--active 0.2]
+
+Records --days of counter samples every --interval seconds for --peers
+peers, --active of them with traffic in each sample and the occasional
+counter reset, then one hour of 10 s samples. Checks the size on disk
+against wg_traffic.store_size() and the range queries against totals
+kept on the side. Also times a sample, "last 30 days" for one client and
+for all clients, and a CSV export, with its peak memory (the export
+streams, so it stays flat however big the file gets).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import synthetic
+from wg_traffic import TrafficStore, store_size
+
+DAY = 86400
+TRACKED = 20
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peers", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=400)
+    parser.add_argument("--interval", type=int, default=21600)
+    parser.add_argument("--active", type=float, default=0.2)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    keys = [synthetic.peer_key(i) for i in range(args.peers)]
+    counters = [0] * args.peers
+    # (time, bytes received) of every delta for the first TRACKED peers
+    deltas = [[] for _ in range(TRACKED)]
+    now = int(time.time()) // DAY * DAY
+    t = now - args.days * DAY
+
+    def sample(t, active):
+        for i in rng.sample(range(args.peers), int(args.peers * active)):
+            delta = rng.randint(1, 10 ** 7)
+            if rng.random() < 0.001:
+                # Tunnel restart: counting starts over
+                counters[i] = delta
+            else:
+                counters[i] += delta
+            if i < TRACKED:
+                deltas[i].append((t, delta))
+        return [(key, rx, rx // 2, 0) for key, rx in zip(keys, counters)]
+
+    with tempfile.TemporaryDirectory(prefix="wgbench-traffic-") as workdir:
+        store = TrafficStore(workdir)
+        store.record(sample(t, 0), t)
+        start = time.perf_counter()
+        ticks = 0
+        while t < now:
+            t += args.interval
+            store.record(sample(t, args.active), t)
+            ticks += 1
+        year_s = time.perf_counter() - start
+        live = []
+        for _ in range(360):
+            t += 10
+            counters_now = sample(t, args.active)
+            seconds, _ = timed(lambda: store.record(counters_now, t))
+            live.append(seconds)
+        live.sort()
+
+        size = store.disk_usage()
+        expected = store_size(args.peers)
+        print(f"{args.peers} peers, {args.days} days every {args.interval} s ({ticks} samples in {year_s:.1f} s), "
+              f"then 1 hour every 10 s")
+        print(f"sample (record)       : {live[len(live) // 2] * 1000:8.1f} ms median, {live[-1] * 1000:.1f} ms max")
+        print(f"size on disk          : {size / 1e6:8.1f} MB (store_size: {expected / 1e6:.1f} MB + keys)")
+        assert expected <= size <= expected + args.peers * 50, (size, expected)
+
+        month = t - 30 * DAY
+        month -= month % 3600
+        one_s, usage = timed(lambda: store.usage(keys[0], month, t + 1))
+        reference = sum(d for when, d in deltas[0] if when >= month)
+        assert usage[0] == reference, (usage, reference)
+        print(f"one client, 30 days   : {one_s * 1000:8.1f} ms")
+
+        all_s, totals = timed(lambda: store.totals(month, t + 1))
+        print(f"all clients, 30 days  : {all_s * 1000:8.1f} ms, {len(totals)} with traffic")
+        year = t - 365 * DAY
+        year -= year % DAY
+        for i in range(TRACKED):
+            reference = sum(d for when, d in deltas[i] if when >= year)
+            assert store.usage(keys[i], year, t + 1)[0] == reference, i
+            reference = sum(d for when, d in deltas[i] if when > t - 3600)
+            assert store.usage(keys[i], t - 3599, t + 1, "raw")[0] == reference, i
+            assert totals.get(keys[i], (0, 0))[0] == sum(d for when, d in deltas[i] if when >= month)
+
+        path = os.path.join(workdir, "export.csv")
+        with open(path, "w", newline="") as f:
+            export_s, rows = timed(lambda: store.export_csv(f, month, t + 1, "1h"))
+        size = os.path.getsize(path)
+
+        # Again for the memory, tracing slows it down too much to time it.
+        # A day's export against 30 days': the peak shouldn't grow with the file.
+        def export_peak(since):
+            tracemalloc.start()
+            with open(path, "w", newline="") as f:
+                store.export_csv(f, since, t + 1, "1h")
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return peak
+        day_peak = export_peak(t - DAY - (t - DAY) % 3600)
+        peak = export_peak(month)
+        print(f"CSV export, 30 days/1h: {export_s * 1000:8.1f} ms, {rows} rows, {size / 1e6:.1f} MB, "
+              f"peak {peak / 1e6:.1f} MB traced ({day_peak / 1e6:.1f} MB for 1 day)")
+        assert peak < day_peak + 256 * 1024, (peak, day_peak)
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
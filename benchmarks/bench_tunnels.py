@@ -0,0 +1,82 @@
+"""
+Status and `wg show dump` collection for several tunnels: one after the
+other versus WireGuardManager.collect_tunnel_states().
+
+    python benchmarks/bench_tunnels.py [--tunnels 4] [--peers 1000] [--delay 0.05]
+
+Each tunnel gets a synthetic config of --peers peers on the in-process fake
+wg/sc, and every fake command takes --delay seconds, standing in for the
+process startup of wg.exe and sc.exe.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import synthetic
+from wg_fake import FakeBackend, new_interface
+from wg_manager import WireGuardManager
+from wg_runner import CommandRunner
+
+
+def make_manager(workdir, tunnels, peers, delay):
+    os.environ["LOCALAPPDATA"] = workdir
+    names = [f"wg{i}" for i in range(tunnels)]
+    fake = FakeBackend(installed=names, delay=delay)
+    specs = []
+    for name in names:
+        conf_path, _ = synthetic.write_fixture(os.path.join(workdir, name), peers)
+        fake.wg.interfaces[name] = new_interface()
+        fake.wg.load_conf(fake.wg.interfaces[name], conf_path, True)
+        specs.append({"interface_name": name, "conf_path": conf_path})
+    manager = WireGuardManager(app_name="bench", runner=CommandRunner(backend=fake, timeout=60))
+    manager.settings = dict(specs[0], wg_path="wg", wg_backend="wg", service_backend="sc", tunnels=specs[1:])
+    return manager
+
+
+def sequential(manager):
+    states = []
+    for name in manager.tunnel_names():
+        tunnel = manager.tunnel(name)
+        states.append((tunnel.get_service_status(max_age=0), tunnel.read_wg_dump()))
+    return states
+
+
+def best_of(fn, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tunnels", type=int, default=4)
+    parser.add_argument("--peers", type=int, default=1000)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="wgbench-tunnels-") as workdir:
+        manager = make_manager(workdir, args.tunnels, args.peers, args.delay)
+        print(f"{args.tunnels} tunnels x {args.peers} peers, {args.delay * 1000:.0f} ms per command, "
+              f"{manager.runner.max_concurrent} commands at a time")
+        one_by_one, _ = best_of(lambda: sequential(manager), args.runs)
+        parallel, states = best_of(lambda: manager.collect_tunnel_states(max_age=0), args.runs)
+        print(f"sequential: {one_by_one * 1000:8.1f} ms")
+        print(f"parallel  : {parallel * 1000:8.1f} ms")
+        for state in states:
+            print(f"  {state.name}: {state.status}, {len(state.peers)} peers, {state.duration * 1000:.0f} ms")
+        assert all(state.status == "Running" and len(state.peers) == args.peers for state in states)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Reading a tunnel over UAPI (wg_uapi) versus spawning `wg show <iface> dump`.
+
+    python benchmarks/bench_uapi.py [--peers 10000] [--runs 20]
+
+Both ways serve the same pre-rendered peer state: fake_wg.py prints it as
+dump output from a new process per poll (FAKE_WG_DUMP), and
+wg_fake.FakeUapiServer answers get=1 with it over one Unix socket that
+stays open. Times read_wg_dump() (what the Monitor polls) and
+get_wg_show_dump() both ways, and parsing alone. Then checks, against a
+stand-in server backed by the fake state, that a config edit is applied
+in one UAPI request without spawning wg, that both backends then see the
+same peers and that the manager falls back to wg when the socket goes away.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import synthetic
+from wg_dump import DumpParser
+from wg_fake import FakeBackend, FakeUapiServer, new_interface
+from wg_manager import WireGuardManager
+from wg_runner import CommandRunner
+from wg_uapi import UapiParser
+
+
+def make_state(fake, conf_path, seed=1, now=1700000000):
+    iface = fake.interfaces["wg0"] = new_interface()
+    fake.load_conf(iface, conf_path, True)
+    rng = random.Random(seed)
+    for i, peer in enumerate(iface["peers"].values()):
+        if rng.random() < 0.7:
+            peer["latest_handshake"] = now - rng.randrange(0, 600)
+            peer["endpoint"] = f"198.51.{i >> 8 & 255}.{i & 255}:{rng.randrange(1024, 65535)}"
+            peer["transfer_rx"] = rng.randrange(0, 1 << 34)
+            peer["transfer_tx"] = rng.randrange(0, 1 << 34)
+    return iface
+
+
+def manager_for(workdir, conf_path, runner, **settings):
+    manager = WireGuardManager(app_name="bench", runner=runner)
+    manager.settings = dict({"wg_path": "wg", "conf_path": conf_path, "interface_name": "wg0"}, **settings)
+    return manager
+
+
+def median_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def check_apply(workdir, conf_path):
+    # A stand-in serving the live fake state, and a manager that could also spawn (fake) wg
+    fake = FakeBackend()
+    make_state(fake.wg, conf_path)
+    sock = os.path.join(workdir, "state.sock")
+    server = FakeUapiServer(fake.wg, "wg0", sock).start()
+    manager = manager_for(workdir, conf_path, CommandRunner(backend=fake, timeout=60), uapi_path=sock)
+
+    model = manager.get_config()
+    peers = len(model.peers)
+    edits = min(100, peers // 2)
+    for peer in model.peers[:edits]:
+        manager.remove_peer(peer.public_key)
+    manager.add_peers([(f"new-{i}", {"PublicKey": synthetic.peer_key(peers + i),
+                                      "AllowedIPs": f"10.250.{i // 250}.{i % 250 + 1}/32",
+                                      "PresharedKey": synthetic.peer_key(10 ** 6 + i)}) for i in range(edits)])
+    result = manager.apply_changes()
+    assert result["mode"] == "delta" and result["ok"] and result["invocations"] == 1, result
+    assert result["added"] == edits and result["removed"] == edits, result
+    assert manager.apply_changes()["mode"] == "noop"
+    print(f"apply over UAPI: +{result['added']} -{result['removed']} peers in {result['invocations']} request, "
+          f"{len(fake.calls)} wg processes")
+    assert not fake.calls, fake.calls
+
+    # wg sees the same tunnel
+    over_uapi = manager.read_wg_dump()[1].as_dicts()
+    manager.settings["wg_backend"] = "wg"
+    assert manager.apply_changes()["mode"] == "noop"
+    assert manager.read_wg_dump()[1].as_dicts() == over_uapi
+
+    # Tunnel gone: auto falls back to wg
+    manager.settings["wg_backend"] = "auto"
+    server.close()
+    calls = len(fake.calls)
+    assert len(manager.read_wg_dump()[1]) == peers and len(fake.calls) == calls + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peers", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="wgbench-uapi-") as workdir:
+        os.environ["LOCALAPPDATA"] = workdir
+        conf_path, dump_path = synthetic.write_fixture(workdir, args.peers)
+        fake = FakeBackend()
+        iface = make_state(fake.wg, conf_path)
+        dump = fake.wg.dump(iface).encode()
+        answer = fake.wg.uapi_get(iface).encode()
+        with open(dump_path, "wb") as f:
+            f.write(dump)
+        os.environ["FAKE_WG_DUMP"] = dump_path
+
+        spawning = manager_for(workdir, conf_path, CommandRunner(timeout=60), wg_backend="wg",
+                               wg_path=os.path.join(HERE, "fake_wg.py"))
+        sock = os.path.join(workdir, "wg0.sock")
+        server = FakeUapiServer(fake.wg, "wg0", sock, answer=answer).start()
+        uapi = manager_for(workdir, conf_path, None, wg_backend="uapi", uapi_path=sock)
+
+        expected = spawning.read_wg_dump()
+        live = uapi.read_wg_dump()
+        assert live[1].as_dicts() == expected[1].as_dicts()
+        assert live[0].public_key == expected[0].public_key and live[0].listen_port == expected[0].listen_port
+
+        print(f"{args.peers} peers: dump {len(dump) / 1e6:.1f} MB, UAPI answer {len(answer) / 1e6:.1f} MB; "
+              f"median of {args.runs}")
+        rows = [
+            ("read_wg_dump", spawning.read_wg_dump, uapi.read_wg_dump),
+            ("get_wg_show_dump", spawning.get_wg_show_dump, uapi.get_wg_show_dump),
+        ]
+        for label, by_process, by_uapi in rows:
+            process_ms, uapi_ms = median_ms(by_process, args.runs), median_ms(by_uapi, args.runs)
+            print(f"{label:17}: wg process {process_ms:7.1f} ms, UAPI {uapi_ms:7.1f} ms")
+
+        def parse_dump():
+            p = DumpParser()
+            p.feed(dump)
+            return p.close()
+
+        keys = UapiParser()
+        keys.feed(answer)
+        keys.close()
+
+        def parse_answer():
+            p = UapiParser(keys.keys)
+            p.feed(answer)
+            return p.close()
+        print(f"{'parse only':17}: dump       {median_ms(parse_dump, args.runs):7.1f} ms, "
+              f"UAPI {median_ms(parse_answer, args.runs):7.1f} ms")
+
+        # Every poll went over the one connection
+        assert server.connections == 1, server.connections
+        server.close()
+        check_apply(workdir, conf_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Stand-in for `sc` (query/start/stop of WireGuardTunnel$<name> services),
+sharing fake_wg.py's state file: a tunnel is running while its interface
+exists there. FAKE_SC_CONFIG names a .conf loaded on start.
+
+    fake_sc.py query|start|stop WireGuardTunnel$wg0
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_wg import load_state, save_state
+from wg_fake import FakeServices, FakeWireGuard
+
+
+def main(argv):
+    wg = FakeWireGuard(load_state())
+    services = FakeServices(wg, installed=wg.interfaces.keys() | {"wg0"})
+    if len(argv) == 2 and os.environ.get("FAKE_SC_CONFIG"):
+        services.configs[services.interface_for(argv[1])] = os.environ["FAKE_SC_CONFIG"]
+    returncode, stdout, stderr = services.sc(argv)
+    if argv[:1] != ["query"]:
+        save_state(wg.state)
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the `wg` executable, for exercising WireGuardManager on a
+machine without WireGuard. Point the `wg_path` setting at this script.
+
+Interface state is kept in a JSON file (FAKE_WG_STATE, default
+fake_wg_state.json in the temp directory). Every invocation is appended
+to its "calls" list so callers can check how many processes were spawned.
+FAKE_WG_DELAY adds a fixed delay in seconds to each call. When
+FAKE_WG_DUMP names a file, `show <iface> dump` prints that file instead
+(for benchmarks with pre-generated output, see synthetic.py).
+
+Supported: genkey, pubkey, show <iface> [dump], set, setconf, syncconf.
+The emulation itself is wg_fake.FakeWireGuard, which can also be plugged
+into the manager in-process (see wg_fake.FakeBackend).
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wg_fake import FakeWireGuard
+
+STATE_PATH = os.environ.get("FAKE_WG_STATE", os.path.join(tempfile.gettempdir(), "fake_wg_state.json"))
+
+
+def load_state():
+    try:
+        with open(STATE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"interfaces": {}, "calls": []}
+
+
+def save_state(state):
+    tmp = STATE_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, STATE_PATH)
+
+
+def main(argv):
+    if os.environ.get("FAKE_WG_DELAY"):
+        time.sleep(float(os.environ["FAKE_WG_DELAY"]))
+
+    if os.environ.get("FAKE_WG_DUMP") and argv[:1] == ["show"] and argv[2:] == ["dump"]:
+        with open(os.environ["FAKE_WG_DUMP"], "rb") as f:
+            while True:
+                chunk = f.read(65536)
+                if not chunk:
+                    break
+                sys.stdout.buffer.write(chunk)
+        return 0
+
+    stateless = argv[:1] in (["genkey"], ["pubkey"])
+    wg = FakeWireGuard({} if stateless else load_state())
+    try:
+        returncode, stdout, stderr = wg.handle(argv, sys.stdin.read() if argv[:1] == ["pubkey"] else "")
+    finally:
+        if not stateless:
+            save_state(wg.state)
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,102 @@
+"""
+Synthetic wg0.conf files and `wg show dump` output for benchmarks.
+
+    python benchmarks/synthetic.py --peers 10000 --out DIR
+
+writes DIR/wg0.conf and DIR/wg0.dump. Output is deterministic for a given
+peer count and seed, so runs can be compared.
+"""
+import argparse
+import base64
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Fixed interface key so the fake wg reports the same public key as the config
+INTERFACE_PRIVATE_KEY = "dwdtCnMYpX08FsFyUbJmRd9ML4frwJkqsXf7pR25LCo="
+LISTEN_PORT = 51820
+
+
+def peer_key(i):
+    return base64.b64encode(i.to_bytes(32, "little")).decode()
+
+
+def peer_address(i):
+    # Hosts from 10.0.0.2 upwards; 10.0.0.1 is the interface
+    n = i + 2
+    return f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}/32"
+
+
+def interface_network(peers):
+    return "10.0.0.1/24" if peers < 250 else "10.0.0.1/16" if peers < 60000 else "10.0.0.1/8"
+
+
+def peer_addresses(peers, seed=0, gaps=0.01):
+    # A fraction `gaps` of the addresses is skipped so allocation has holes to find
+    rng = random.Random(seed)
+    addresses = []
+    slot = 0
+    for _ in range(peers):
+        if rng.random() < gaps:
+            slot += 1
+        addresses.append(peer_address(slot))
+        slot += 1
+    return addresses
+
+
+def make_config(peers, seed=0):
+    """ wg0.conf text with `peers` named peers """
+    lines = ["[Interface]", f"PrivateKey = {INTERFACE_PRIVATE_KEY}",
+             f"Address = {interface_network(peers)}", f"ListenPort = {LISTEN_PORT}", ""]
+    for i, address in enumerate(peer_addresses(peers, seed)):
+        lines += ["[Peer]", f"# Name: client-{i:06d}", f"PublicKey = {peer_key(i)}", f"AllowedIPs = {address}"]
+        if i % 5 == 0:
+            lines.append("PersistentKeepalive = 25")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def make_dump(peers, seed=0, now=1700000000):
+    """ `wg show wg0 dump` output for the peers of make_config(peers) """
+    import wg_keys
+
+    rng = random.Random(seed + 1)
+    public_key = wg_keys.derive_public_key(INTERFACE_PRIVATE_KEY)
+    lines = [f"{INTERFACE_PRIVATE_KEY}\t{public_key}\t{LISTEN_PORT}\toff"]
+    for i, address in enumerate(peer_addresses(peers, seed)):
+        connected = rng.random() < 0.7
+        handshake = now - rng.randrange(0, 600) if connected else 0
+        endpoint = f"198.51.{i >> 8 & 255}.{i & 255}:{rng.randrange(1024, 65535)}" if connected else "(none)"
+        rx = rng.randrange(0, 1 << 34) if connected else 0
+        tx = rng.randrange(0, 1 << 34) if connected else 0
+        keepalive = "25" if i % 5 == 0 else "off"
+        lines.append(f"{peer_key(i)}\t(none)\t{endpoint}\t{address}\t{handshake}\t{rx}\t{tx}\t{keepalive}")
+    return "\n".join(lines) + "\n"
+
+
+def write_fixture(directory, peers, seed=0):
+    """ Write wg0.conf and wg0.dump into directory; returns their paths """
+    os.makedirs(directory, exist_ok=True)
+    conf_path = os.path.join(directory, "wg0.conf")
+    dump_path = os.path.join(directory, "wg0.dump")
+    with open(conf_path, "w", newline="\n") as f:
+        f.write(make_config(peers, seed))
+    with open(dump_path, "w", newline="\n") as f:
+        f.write(make_dump(peers, seed))
+    return conf_path, dump_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peers", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    for path in write_fixture(args.out, args.peers, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
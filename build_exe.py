@@ -3,7 +3,7 @@ import subprocess
 import sys
 import customtkinter
 
-def build():
+def build(onedir=False):
     # Get customtkinter directory
     ctk_path = os.path.dirname(customtkinter.__file__)
     
@@ -11,7 +11,9 @@ def build():
     
     # Construct PyInstaller command
     # --noconsole: hide terminal
-    # --onefile: single executable
+    # --onefile: single executable, unpacked to a temp directory on every launch
+    # --onedir: a folder with the executable and its files, starts without unpacking
+    # --noupx: DLLs stay uncompressed, so they load without being unpacked either
     # --add-data: include customtkinter files (needed for themes/etc)
     # --uac-admin: request admin privileges on windows
     # --name: output name
@@ -19,7 +21,7 @@ def build():
     cmd = [
         "pyinstaller",
         "--noconsole",
-        "--onefile",
+        "--onedir" if onedir else "--onefile",
         f"--add-data={ctk_path};customtkinter",
         "--add-data=icon.ico;.",
         "--uac-admin",
@@ -28,16 +30,22 @@ def build():
         "--clean", # Clean cache before building
         "main.py"
     ]
+    if onedir:
+        cmd.insert(-1, "--noupx")
     
     print("Running command:", " ".join(cmd))
     
     try:
         subprocess.run(cmd, check=True)
-        print("\nBuild successful! Look in the 'dist' folder for WireGuardManager.exe")
+        if onedir:
+            print("\nBuild successful! Ship the whole 'dist\\WireGuardManager' folder, it contains WireGuardManager.exe")
+        else:
+            print("\nBuild successful! Look in the 'dist' folder for WireGuardManager.exe")
     except subprocess.CalledProcessError as e:
         print(f"\nBuild failed: {e}")
     except FileNotFoundError:
         print("\nError: PyInstaller not found. Please run 'pip install pyinstaller' first.")
 
 if __name__ == "__main__":
-    build()
+    # --onedir for the fast-starting folder build, default is the single exe
+    build(onedir="--onedir" in sys.argv[1:])
@@ -0,0 +1,89 @@
+"""
+Gatekeeper API: emailed one-time codes in front of WireGuard sessions.
+
+    python gatekeeper.py [--host 0.0.0.0] [--port 8443]
+                         [--ssl-certfile cert.pem --ssl-keyfile key.pem]
+
+POST /otp/request {"email"}          mails a code to whitelisted addresses
+POST /otp/verify  {"email", "code"}  switches the user's peer on for a session
+GET  /health
+
+Reads the WireGuard Manager settings.json (whitelist_path, otp_ttl_seconds,
+session_hours, mail_sender and the graph_* settings). The logic lives in
+wg_gatekeeper; this module only maps it to HTTP. Needs fastapi and uvicorn
+(requirements-gatekeeper.txt).
+"""
+import contextlib
+
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel
+
+from wg_gatekeeper import Gatekeeper, GatekeeperError
+from wg_manager import WireGuardManager
+
+
+class OtpRequest(BaseModel):
+    email: str
+
+
+class VerifyRequest(BaseModel):
+    email: str
+    code: str
+
+
+def create_app(gatekeeper=None):
+    gatekeeper = gatekeeper or Gatekeeper(WireGuardManager())
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        # Live sessions are switched back on and expired from here on
+        gatekeeper.start()
+        try:
+            yield
+        finally:
+            gatekeeper.close()
+
+    app = FastAPI(title="WireGuard Gatekeeper", lifespan=lifespan)
+    app.state.gatekeeper = gatekeeper
+
+    async def call(method, *args):
+        try:
+            return await method(*args)
+        except GatekeeperError as e:
+            headers = {"Retry-After": str(int(e.retry_after) + 1)} if e.retry_after else None
+            raise HTTPException(e.status, str(e), headers=headers)
+
+    @app.post("/otp/request", status_code=202)
+    async def request_otp(body: OtpRequest, request: Request):
+        return await call(gatekeeper.request_otp, body.email, request.client.host if request.client else "")
+
+    @app.post("/otp/verify")
+    async def verify(body: VerifyRequest, request: Request):
+        return await call(gatekeeper.verify, body.email, body.code, request.client.host if request.client else "")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "sessions": len(gatekeeper.sessions), "pending_codes": len(gatekeeper.otps)}
+
+    return app
+
+
+def main():
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--ssl-certfile")
+    parser.add_argument("--ssl-keyfile")
+    args = parser.parse_args()
+    if not args.ssl_certfile:
+        print("Warning: serving plain HTTP; the specification requires HTTPS in production")
+    # One process: the OTP store, rate limits and session scheduler live in memory
+    uvicorn.run(create_app(), host=args.host, port=args.port, workers=1,
+                ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_keyfile)
+
+
+if __name__ == "__main__":
+    main()
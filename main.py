@@ -1,15 +1,19 @@
+from wg_instrument import instrument, PROFILER, STARTUP
+STARTUP.begin()
+
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import messagebox, filedialog
 from wg_manager import WireGuardManager
-import qrcode
-from PIL import Image
+from wg_tasks import TaskRunner, current_task
 import os
-import io
 import ctypes
 import sys
 import time
 
+# Modules only one view needs (wg_monitor, wg_render, wg_provision) are
+# imported when that view is first opened, not before the window appears.
+
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
     try:
@@ -26,6 +30,169 @@ def is_admin():
     except:
         return False
 
+MONITOR_INTERVALS = [2, 5, 10, 30, 60]
+MONITOR_POLL_MS = 200
+STATUS_POLL_SECONDS = 2
+TASK_POLL_MS = 50
+# The client search runs once typing pauses this long
+SEARCH_DELAY_MS = 250
+
+
+class MonitorCard:
+    """ Widgets for one peer in the Monitor view, only changed labels are reconfigured """
+
+    def __init__(self, parent):
+        self.frame = ctk.CTkFrame(parent)
+        self.frame.pack(fill="x", pady=5, padx=5)
+
+        # Row 1: Name and Endpoint
+        row1 = ctk.CTkFrame(self.frame, fg_color="transparent")
+        row1.pack(fill="x", padx=10, pady=(10, 5))
+        name = ctk.CTkLabel(row1, text="", font=ctk.CTkFont(weight="bold", size=16))
+        name.pack(side="left")
+        endpoint = ctk.CTkLabel(row1, text="", text_color="gray")
+        endpoint.pack(side="right")
+
+        # Row 2: Stats
+        row2 = ctk.CTkFrame(self.frame, fg_color="transparent")
+        row2.pack(fill="x", padx=10, pady=(5, 10))
+        transfer = ctk.CTkLabel(row2, text="")
+        transfer.pack(side="left")
+        handshake = ctk.CTkLabel(row2, text="")
+        handshake.pack(side="right")
+        rate = ctk.CTkLabel(row2, text="", text_color="#2ecc71")
+        rate.pack(side="right", padx=10)
+
+        # pubkey truncated
+        key = ctk.CTkLabel(row2, text="", text_color="gray")
+        key.pack(side="left", padx=5)
+
+        self.labels = {"name": name, "endpoint": endpoint, "transfer": transfer, "handshake": handshake, "key": key, "rate": rate}
+        self.values = {}
+
+    def update(self, row):
+        for field, label in self.labels.items():
+            text = row[field]
+            if self.values.get(field) != text:
+                label.configure(text=text)
+                self.values[field] = text
+
+    def destroy(self):
+        self.frame.destroy()
+
+
+class ClientRow:
+    """ One reusable row of the Clients list """
+
+    def __init__(self, parent, on_qr, on_edit, on_delete):
+        self.peer = None
+        self.frame = ctk.CTkFrame(parent)
+
+        self.name_label = ctk.CTkLabel(self.frame, text="", font=ctk.CTkFont(weight="bold"), width=150, anchor="w")
+        self.name_label.pack(side="left", padx=10)
+        self.ips_label = ctk.CTkLabel(self.frame, text="", width=150)
+        self.ips_label.pack(side="left", padx=10)
+        self.key_label = ctk.CTkLabel(self.frame, text="", width=200)
+        self.key_label.pack(side="left", padx=10)
+
+        ctk.CTkButton(self.frame, text="QR", width=50, command=lambda: on_qr(self.peer)).pack(side="right", padx=5)
+        ctk.CTkButton(self.frame, text="Edit", width=50, command=lambda: on_edit(self.peer)).pack(side="right", padx=5)
+        ctk.CTkButton(self.frame, text="Delete", width=50, fg_color="#c0392b", command=lambda: on_delete(self.peer)).pack(side="right", padx=5)
+        self.values = (None, None, None)
+
+    def bind(self, item):
+        # item: (tunnel name or None, PeerRecord); callbacks get the whole item
+        self.peer = item
+        tunnel, peer = item
+        name = f"{peer.display_name()} [{tunnel}]" if tunnel else peer.display_name()
+        values = (name, peer.allowed_ips or 'N/A', f"{(peer.public_key or 'N/A')[:20]}...")
+        if values != self.values:
+            self.name_label.configure(text=values[0])
+            self.ips_label.configure(text=values[1])
+            self.key_label.configure(text=values[2])
+            self.values = values
+
+
+class VirtualPeerList(ctk.CTkFrame):
+    """ Scrollable list that only creates widgets for the rows currently on screen """
+
+    ROW_HEIGHT = 46
+
+    def __init__(self, parent, on_qr, on_edit, on_delete):
+        super().__init__(parent)
+        self.callbacks = (on_qr, on_edit, on_delete)
+        self.items = []
+        self.offset = 0
+        self.rows = []
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        self.body = ctk.CTkFrame(self, fg_color="transparent")
+        self.body.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self.body.bind("<Configure>", lambda e: self.render())
+        self.bind_scroll(self)
+        self.bind_scroll(self.body)
+
+    def bind_scroll(self, widget):
+        widget.bind("<MouseWheel>", self.on_mousewheel)
+        # X11 reports the wheel as buttons 4/5
+        widget.bind("<Button-4>", lambda e: self.scroll_to(self.offset - 3))
+        widget.bind("<Button-5>", lambda e: self.scroll_to(self.offset + 3))
+
+    def visible_count(self):
+        height = max(self.body.winfo_height(), self.ROW_HEIGHT)
+        return height // self.ROW_HEIGHT
+
+    def set_items(self, items):
+        self.items = items
+        self.scroll_to(self.offset)
+
+    def scroll_to(self, offset):
+        max_offset = max(len(self.items) - self.visible_count(), 0)
+        self.offset = min(max(offset, 0), max_offset)
+        self.render()
+
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * len(self.items)))
+        elif args[0] == "scroll":
+            step = self.visible_count() if args[2] == "pages" else 1
+            self.scroll_to(self.offset + int(args[1]) * step)
+
+    def on_mousewheel(self, event):
+        self.scroll_to(self.offset - int(event.delta / 120) * 3)
+
+    def ensure_rows(self, count):
+        # Grow the pool when the list gets taller, rows are never destroyed
+        while len(self.rows) < count:
+            row = ClientRow(self.body, *self.callbacks)
+            for widget in [row.frame] + row.frame.winfo_children():
+                self.bind_scroll(widget)
+            self.rows.append(row)
+
+    def render(self):
+        count = self.visible_count()
+        self.ensure_rows(count)
+        for i, row in enumerate(self.rows):
+            index = self.offset + i
+            if i < count and index < len(self.items):
+                row.bind(self.items[index])
+                row.frame.place(x=5, y=i * self.ROW_HEIGHT + 3, relwidth=1, width=-10, height=self.ROW_HEIGHT - 6)
+            else:
+                row.peer = None
+                row.frame.place_forget()
+
+        if self.items:
+            first = self.offset / len(self.items)
+            last = min((self.offset + count) / len(self.items), 1.0)
+            self.scrollbar.set(first, last)
+        else:
+            self.scrollbar.set(0, 1)
+
+
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -44,10 +211,20 @@ class App(ctk.CTk):
         except:
             pass
 
-        if not is_admin():
-            messagebox.showwarning("Admin Required", "This application requires Administrator privileges to manage WireGuard services and configurations. Some features may not work as expected.")
-
+        # Nothing here reads settings or runs a command: the window is painted
+        # first, finish_startup() does the rest (see STARTUP for the timings)
         self.manager = WireGuardManager()
+        # Tunnel the Status view and new clients go to, when several are configured; set by finish_startup
+        self.selected_tunnel = None
+        self.watched_tunnels = set()
+        self.polling_watcher = None
+        # Created by the first Monitor view / new client window
+        self.monitor_sampler = None
+        self.renderer = None
+        # Pending after() of the debounced client search
+        self.search_after = None
+        # sc, wg and config writes run here; results come back through pump_tasks
+        self.tasks = TaskRunner(on_change=self.on_task_change)
 
         # Grid layout
         self.grid_columnconfigure(1, weight=1)
@@ -73,28 +250,158 @@ class App(ctk.CTk):
         self.settings_button = ctk.CTkButton(self.sidebar_frame, text="Settings", command=self.show_settings_view)
         self.settings_button.grid(row=4, column=0, padx=20, pady=10)
 
+        self.diagnostics_button = ctk.CTkButton(self.sidebar_frame, text="Diagnostics", command=self.show_diagnostics_view,
+                                                fg_color="transparent", border_width=1)
+        self.diagnostics_button.grid(row=5, column=0, padx=20, pady=(10, 20))
+
+        # What the background tasks are doing, with a way to stop them
+        self.task_label = ctk.CTkLabel(self.sidebar_frame, text="", text_color="gray", wraplength=180)
+        self.task_label.grid(row=6, column=0, padx=20)
+        self.task_cancel_button = ctk.CTkButton(self.sidebar_frame, text="Cancel", width=80, fg_color="transparent",
+                                                border_width=1, command=self.tasks.cancel_all)
+
         # Main Content Area
         self.main_content = ctk.CTkFrame(self, corner_radius=0, fg_color="transparent")
         self.main_content.grid(row=0, column=1, sticky="nsew", padx=20, pady=20)
         self.main_content.grid_columnconfigure(0, weight=1)
         self.main_content.grid_rowconfigure(0, weight=1)
-
+        ctk.CTkLabel(self.main_content, text="Loading...", text_color="gray").pack(pady=20)
+
+        STARTUP.mark("window")
+        self.started = False
+        self.bind("<Map>", self.on_first_map, add="+")
+        self.after(TASK_POLL_MS, self.pump_tasks)
+
+    def on_first_map(self, event):
+        # Queued behind the redraw of the window that was just mapped
+        if event.widget is self and not self.started:
+            self.started = True
+            self.after_idle(self.finish_startup)
+
+    def finish_startup(self):
+        STARTUP.mark("first paint")
+        self.manager.configure_instrumentation()
+        self.selected_tunnel = self.manager.settings.get("interface_name", "wg0")
+        STARTUP.mark("settings")
+        # The service status is filled in by a background task, see on_service_status
         self.show_status_view()
+        STARTUP.mark("status view")
+        if not is_admin():
+            messagebox.showwarning("Admin Required", "This application requires Administrator privileges to manage WireGuard services and configurations. Some features may not work as expected.")
+
+    def get_monitor_sampler(self):
+        from wg_monitor import MonitorSampler, DEFAULT_INTERVAL
+
+        if self.monitor_sampler is None:
+            self.monitor_sampler = MonitorSampler(self.manager, self.manager.settings.get("monitor_interval", DEFAULT_INTERVAL))
+        return self.monitor_sampler
+
+    def get_renderer(self):
+        from wg_render import ArtifactRenderer
+
+        if self.renderer is None:
+            self.renderer = ArtifactRenderer()
+        return self.renderer
+
+    def pump_tasks(self):
+        # Task results and progress are handed to the Tk loop here, never from the workers
+        self.tasks.pump()
+        self.after(TASK_POLL_MS, self.pump_tasks)
+
+    def run_task(self, fn, *args, tunnel=None, key=None, label="", on_done=None, on_error=None):
+        """
+        Run fn(*args) off the Tk thread. Tasks for one tunnel run in order;
+        a task with the same key as one still waiting replaces it.
+        """
+        lane = tunnel.settings.get("interface_name", "wg0") if tunnel is not None else None
+        task = self.tasks.submit(fn, *args, lane=lane, key=key, label=label, on_done=on_done,
+                                 on_error=on_error or self.on_task_error)
+        self.on_task_change(task)
+        return task
+
+    def on_task_error(self, error):
+        messagebox.showerror("Error", str(error))
+
+    def on_task_change(self, task=None):
+        active = self.tasks.active()
+        if not active:
+            self.task_label.configure(text="")
+            self.task_cancel_button.grid_remove()
+            return
+        text = active[0].describe() + "..."
+        if len(active) > 1:
+            text += f"\n{len(active) - 1} more queued"
+        self.task_label.configure(text=text)
+        self.task_cancel_button.grid(row=7, column=0, padx=20, pady=(5, 10))
 
     def clear_view(self):
+        if self.monitor_sampler is not None:
+            self.monitor_sampler.stop()
+        if self.polling_watcher is not None:
+            self.polling_watcher.stop_polling()
+            self.polling_watcher = None
         for widget in self.main_content.winfo_children():
             widget.destroy()
 
+    def current_tunnel(self):
+        try:
+            return self.manager.tunnel(self.selected_tunnel)
+        except KeyError:
+            # Removed from settings in the meantime
+            self.selected_tunnel = self.manager.settings.get("interface_name", "wg0")
+            return self.manager
+
+    def watch_tunnel(self, name):
+        # Status changes can be reported from worker threads; Tk must not be
+        # touched there, so they are queued for pump_tasks
+        if name not in self.watched_tunnels:
+            self.watched_tunnels.add(name)
+            self.manager.tunnel(name).get_service_watcher().subscribe(
+                lambda status: self.tasks.post(self.on_service_status, status, name))
+
+    def tunnel_menu(self, parent, refresh):
+        # Tunnel picker, only when there is more than one tunnel
+        names = self.manager.tunnel_names()
+        if len(names) < 2:
+            return None
+
+        def select(name):
+            self.selected_tunnel = name
+            refresh()
+        menu = ctk.CTkOptionMenu(parent, width=90, values=names, command=select)
+        menu.set(self.current_tunnel().settings.get("interface_name", "wg0"))
+        return menu
+
+    @instrument("view status")
     def show_status_view(self):
         self.clear_view()
-        status = self.manager.get_service_status()
-        
+        tunnel = self.current_tunnel()
+        name = self.selected_tunnel
+        self.watch_tunnel(name)
+
         title = ctk.CTkLabel(self.main_content, text="Service Status", font=ctk.CTkFont(size=24, weight="bold"))
         title.pack(pady=20)
 
-        color = "#2ecc71" if status == "Running" else "#e74c3c" if status == "Stopped" else "#95a5a6"
-        status_label = ctk.CTkLabel(self.main_content, text=status, font=ctk.CTkFont(size=40), text_color=color)
-        status_label.pack(pady=20)
+        menu = self.tunnel_menu(self.main_content, self.show_status_view)
+        if menu is not None:
+            menu.pack()
+
+        self.status_label = ctk.CTkLabel(self.main_content, text="...", font=ctk.CTkFont(size=40))
+        self.status_label.pack(pady=20)
+        # Queued behind any start/stop of this tunnel, so it shows the outcome
+        self.run_task(tunnel.get_service_status, tunnel=tunnel, key="status", label=f"Checking {name}",
+                      on_done=lambda status: self.on_service_status(status, name))
+
+        if menu is not None:
+            # All tunnels at a glance, queried in parallel
+            overview = ctk.CTkLabel(self.main_content, text="", text_color="gray")
+            overview.pack()
+
+            def show_overview(states):
+                if overview.winfo_exists():
+                    overview.configure(text="    ".join(f"{state.name}: {state.status or state.error}" for state in states))
+            self.run_task(lambda: self.manager.collect_tunnel_states(dumps=False), label="Checking tunnels",
+                          on_done=show_overview)
 
         btn_frame = ctk.CTkFrame(self.main_content, fg_color="transparent")
         btn_frame.pack(pady=20)
@@ -102,14 +409,56 @@ class App(ctk.CTk):
         ctk.CTkButton(btn_frame, text="Start", command=lambda: self.service_action("start"), fg_color="#27ae60").pack(side="left", padx=10)
         ctk.CTkButton(btn_frame, text="Stop", command=lambda: self.service_action("stop"), fg_color="#c0392b").pack(side="left", padx=10)
         ctk.CTkButton(btn_frame, text="Restart", command=lambda: self.service_action("restart")).pack(side="left", padx=10)
+        ctk.CTkButton(btn_frame, text="Apply Config", command=self.apply_config_changes).pack(side="left", padx=10)
+
+        # Keeps the label current, including changes made outside the app
+        self.polling_watcher = tunnel.get_service_watcher()
+        self.polling_watcher.start_polling(STATUS_POLL_SECONDS)
+
+    def on_service_status(self, status, tunnel):
+        if not hasattr(self, 'status_label') or not self.status_label.winfo_exists():
+            return
+        if tunnel != self.selected_tunnel:
+            return
+        color = "#2ecc71" if status == "Running" else "#e74c3c" if status == "Stopped" else "#95a5a6"
+        self.status_label.configure(text=status, text_color=color)
+        # The first status on screen ends startup
+        STARTUP.finish("service status", os.path.join(self.manager.app_data_dir, "logs"))
 
     def service_action(self, action):
-        if self.manager.control_service(action):
+        # Clicks that pile up while sc is busy collapse into the last one
+        tunnel = self.current_tunnel()
+        name = tunnel.settings.get("interface_name", "wg0")
+        self.run_task(lambda: (action, tunnel.control_service(action)), tunnel=tunnel, key="service",
+                      label=f"{action.capitalize()} {name}", on_done=self.on_service_action)
+
+    def on_service_action(self, outcome):
+        action, ok = outcome
+        if ok:
             messagebox.showinfo("Success", f"Service {action}ed successfully.")
         else:
             messagebox.showerror("Error", f"Failed to {action} service. Make sure you are running as Admin.")
-        self.show_status_view()
+        if hasattr(self, 'status_label') and self.status_label.winfo_exists():
+            self.show_status_view()
+
+    def apply_config_changes(self, tunnel=None):
+        # Pushes only the peer changes to the running tunnel, restarting only if it has to.
+        # Several edits asking for an apply get one, after the last edit
+        tunnel = tunnel or self.current_tunnel()
+        self.run_task(tunnel.apply_changes, tunnel=tunnel, key="apply",
+                      label=f"Apply {tunnel.settings.get('interface_name', 'wg0')}", on_done=self.on_apply_result)
+
+    def on_apply_result(self, result):
+        if not result["ok"]:
+            messagebox.showerror("Error", "Failed to apply changes. Make sure you are running as Admin.")
+        elif result["mode"] == "restart":
+            messagebox.showinfo("Success", f"Service restarted to apply changes ({result['reason']}).")
+        elif result["mode"] == "delta":
+            messagebox.showinfo("Success", f"Applied without restart: {result['added']} added, {result['removed']} removed, {result['changed']} changed.")
+        else:
+            messagebox.showinfo("Success", "The tunnel is already up to date.")
 
+    @instrument("view monitor")
     def show_monitor_view(self):
         self.clear_view()
         
@@ -123,123 +472,175 @@ class App(ctk.CTk):
         
         if not hasattr(self, 'auto_refresh_var'):
             self.auto_refresh_var = ctk.BooleanVar(value=False)
-            
-        self.auto_refresh_switch = ctk.CTkSwitch(right_frame, text="Auto-Refresh (5s)", variable=self.auto_refresh_var, command=self.toggle_auto_refresh)
+
+        interval = self.get_monitor_sampler().interval
+        self.auto_refresh_switch = ctk.CTkSwitch(right_frame, text="Auto-Refresh", variable=self.auto_refresh_var, command=self.toggle_auto_refresh)
         self.auto_refresh_switch.pack(side="left", padx=(0, 10))
 
+        interval_menu = ctk.CTkOptionMenu(right_frame, width=70, values=[f"{i}s" for i in MONITOR_INTERVALS], command=self.set_monitor_interval)
+        interval_menu.set(f"{interval}s")
+        interval_menu.pack(side="left", padx=(0, 10))
+
         ctk.CTkButton(right_frame, text="Refresh", command=self.refresh_monitor_data).pack(side="left")
 
+        self.monitor_status_label = ctk.CTkLabel(self.main_content, text="Loading...", text_color="gray", anchor="w")
+        self.monitor_status_label.pack(fill="x")
+
         self.monitor_scrollable_frame = ctk.CTkScrollableFrame(self.main_content)
         self.monitor_scrollable_frame.pack(fill="both", expand=True)
+        # One persistent card per PublicKey, updated in place on every snapshot
+        self.monitor_cards = {}
+        self.monitor_message = None
 
+        self.monitor_sampler.set_auto(self.auto_refresh_var.get())
         self.refresh_monitor_data()
+        self.poll_monitor_snapshots()
 
     def toggle_auto_refresh(self):
-        if self.auto_refresh_var.get():
-            self.refresh_monitor_data()
+        self.monitor_sampler.set_auto(self.auto_refresh_var.get())
+
+    def set_monitor_interval(self, value):
+        interval = int(value.rstrip("s"))
+        self.monitor_sampler.set_interval(interval)
+        self.manager.save_settings(dict(self.manager.settings, monitor_interval=interval))
 
+    @instrument("view monitor.refresh")
     def refresh_monitor_data(self):
-        if not hasattr(self, 'monitor_scrollable_frame') or not self.monitor_scrollable_frame.winfo_exists():
-            return
-            
-        for widget in self.monitor_scrollable_frame.winfo_children():
-            widget.destroy()
+        # Sampling happens on the sampler thread, results arrive via poll_monitor_snapshots
+        self.monitor_sampler.request_refresh()
 
-        dump_data = self.manager.get_wg_show_dump()
-        if dump_data is None:
-            ctk.CTkLabel(self.monitor_scrollable_frame, text="Could not retrieve WireGuard data.\nIs the service running and is WireGuard in your PATH?").pack(pady=20)
-        elif not dump_data:
-            ctk.CTkLabel(self.monitor_scrollable_frame, text="No active connections or peers found.").pack(pady=20)
+    def monitor_view_active(self):
+        return hasattr(self, 'monitor_scrollable_frame') and self.monitor_scrollable_frame.winfo_exists()
+
+    def poll_monitor_snapshots(self):
+        if not self.monitor_view_active():
+            return
+        snapshot = self.monitor_sampler.latest()
+        if snapshot is not None:
+            self.apply_monitor_snapshot(snapshot)
+        self.monitor_scrollable_frame.after(MONITOR_POLL_MS, self.poll_monitor_snapshots)
+
+    def show_monitor_message(self, text):
+        for card in self.monitor_cards.values():
+            card.destroy()
+        self.monitor_cards = {}
+        if self.monitor_message is None:
+            self.monitor_message = ctk.CTkLabel(self.monitor_scrollable_frame, text=text)
+            self.monitor_message.pack(pady=20)
         else:
-            config_data = self.manager.parse_config()
-            peers_conf = {p.get('PublicKey', ''): p.get('name', 'Unknown') for p in config_data['peers']}
-
-            for peer in dump_data:
-                pubkey = peer['public_key']
-                name = peers_conf.get(pubkey, "Unknown Client")
-                endpoint = peer['endpoint'] if peer['endpoint'] != '(none)' else 'Disconnected'
-                handshake = peer['latest_handshake']
-                rx = peer['transfer_rx']
-                tx = peer['transfer_tx']
-
-                # Format handshake
-                if handshake == 0:
-                    handshake_str = "Never"
-                else:
-                    diff = int(time.time()) - handshake
-                    if diff < 60:
-                        handshake_str = f"{diff} sec ago"
-                    elif diff < 3600:
-                        handshake_str = f"{diff // 60} min ago"
-                    elif diff < 86400:
-                        handshake_str = f"{diff // 3600} hr ago"
-                    else:
-                        handshake_str = f"{diff // 86400} days ago"
-
-                # Format transfer
-                def format_bytes(b):
-                    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-                        if b < 1024.0:
-                            return f"{b:.2f} {unit}"
-                        b /= 1024.0
-                    return f"{b:.2f} PB"
-
-                rx_str = format_bytes(rx)
-                tx_str = format_bytes(tx)
-
-                card = ctk.CTkFrame(self.monitor_scrollable_frame)
-                card.pack(fill="x", pady=5, padx=5)
-
-                # Row 1: Name and Endpoint
-                row1 = ctk.CTkFrame(card, fg_color="transparent")
-                row1.pack(fill="x", padx=10, pady=(10, 5))
-                ctk.CTkLabel(row1, text=name, font=ctk.CTkFont(weight="bold", size=16)).pack(side="left")
-                ctk.CTkLabel(row1, text=f"Endpoint: {endpoint}", text_color="gray").pack(side="right")
-
-                # Row 2: Stats
-                row2 = ctk.CTkFrame(card, fg_color="transparent")
-                row2.pack(fill="x", padx=10, pady=(5, 10))
-                ctk.CTkLabel(row2, text=f"Rx: {rx_str} | Tx: {tx_str}").pack(side="left")
-                ctk.CTkLabel(row2, text=f"Handshake: {handshake_str}").pack(side="right")
-                
-                # pubkey truncated
-                ctk.CTkLabel(row2, text=f" ({pubkey[:8]}...)", text_color="gray").pack(side="left", padx=5)
+            self.monitor_message.configure(text=text)
 
-        if self.auto_refresh_var.get():
-            self.monitor_scrollable_frame.after(5000, self.refresh_monitor_data)
+    @instrument("view monitor.apply_snapshot")
+    def apply_monitor_snapshot(self, snapshot):
+        from wg_monitor import format_bytes
 
+        start = time.perf_counter()
+        if snapshot.rows is None:
+            self.show_monitor_message(snapshot.error)
+        elif not snapshot.rows:
+            self.show_monitor_message("No active connections or peers found.")
+        else:
+            if self.monitor_message is not None:
+                self.monitor_message.destroy()
+                self.monitor_message = None
+
+            seen = set()
+            for row in snapshot.rows:
+                pubkey = row['public_key']
+                seen.add(pubkey)
+                card = self.monitor_cards.get(pubkey)
+                if card is None:
+                    card = MonitorCard(self.monitor_scrollable_frame)
+                    self.monitor_cards[pubkey] = card
+                card.update(row)
+
+            for pubkey in [k for k in self.monitor_cards if k not in seen]:
+                self.monitor_cards.pop(pubkey).destroy()
+
+        # Time spent on the Tk thread for this snapshot, the sampling itself runs elsewhere
+        ui_ms = (time.perf_counter() - start) * 1000
+        status = (f"Updated {time.strftime('%H:%M:%S', time.localtime(snapshot.taken_at))}"
+                  f"  |  sample {snapshot.duration * 1000:.0f} ms, UI {ui_ms:.0f} ms")
+        if snapshot.rows is not None and snapshot.error:
+            status += f"  |  {snapshot.error}"
+        if snapshot.top_talkers:
+            top = ", ".join(f"{name} ({format_bytes(rx + tx)}/s)" for name, rx, tx in snapshot.top_talkers)
+            status += f"  |  Top: {top}"
+        self.monitor_status_label.configure(text=status)
+
+    @instrument("view clients")
     def show_clients_view(self):
         self.clear_view()
-        data = self.manager.parse_config()
         
         top_frame = ctk.CTkFrame(self.main_content, fg_color="transparent")
         top_frame.pack(fill="x", pady=(0, 20))
         
         ctk.CTkLabel(top_frame, text="Connected Clients", font=ctk.CTkFont(size=24, weight="bold")).pack(side="left")
         ctk.CTkButton(top_frame, text="Add Client", command=self.add_client_dialog).pack(side="right")
-
-        scrollable_frame = ctk.CTkScrollableFrame(self.main_content)
-        scrollable_frame.pack(fill="both", expand=True)
-
-        for peer in data['peers']:
-            peer_frame = ctk.CTkFrame(scrollable_frame)
-            peer_frame.pack(fill="x", pady=5, padx=5)
-            
-            name = peer.get('name', 'Unnamed')
-            pubkey = peer.get('PublicKey', 'N/A')
-            ips = peer.get('AllowedIPs', 'N/A')
-            
-            ctk.CTkLabel(peer_frame, text=f"{name}", font=ctk.CTkFont(weight="bold"), width=150).pack(side="left", padx=10)
-            ctk.CTkLabel(peer_frame, text=f"{ips}", width=150).pack(side="left", padx=10)
-            ctk.CTkLabel(peer_frame, text=f"{pubkey[:20]}...", width=200).pack(side="left", padx=10)
-            
-            ctk.CTkButton(peer_frame, text="QR", width=50, command=lambda p=peer: self.show_qr(p)).pack(side="right", padx=5)
-            ctk.CTkButton(peer_frame, text="Edit", width=50, command=lambda p=peer: self.edit_client_dialog(p)).pack(side="right", padx=5)
-            ctk.CTkButton(peer_frame, text="Delete", width=50, fg_color="#c0392b", command=lambda p=peer: self.delete_client(p)).pack(side="right", padx=5)
+        ctk.CTkButton(top_frame, text="Bulk Import (CSV)", command=self.bulk_import_dialog).pack(side="right", padx=10)
+        # New clients go to the selected tunnel
+        menu = self.tunnel_menu(top_frame, lambda: None)
+        if menu is not None:
+            menu.pack(side="right")
+
+        search_frame = ctk.CTkFrame(self.main_content, fg_color="transparent")
+        search_frame.pack(fill="x", pady=(0, 10))
+
+        self.clients_search_entry = ctk.CTkEntry(search_frame, width=300, placeholder_text="Search name, IP or key...")
+        self.clients_search_entry.pack(side="left")
+        self.clients_search_entry.bind("<KeyRelease>", lambda e: self.schedule_clients_search())
+        self.clients_count_label = ctk.CTkLabel(search_frame, text="", text_color="gray")
+        self.clients_count_label.pack(side="right")
+
+        # Only the visible rows exist as widgets, they are re-bound while scrolling
+        self.clients_list = VirtualPeerList(self.main_content, on_qr=self.show_qr, on_edit=self.edit_client_dialog, on_delete=self.delete_client)
+        self.clients_list.pack(fill="both", expand=True)
+
+        self.refresh_clients_list()
+
+    def clients_view_active(self):
+        return hasattr(self, 'clients_list') and self.clients_list.winfo_exists()
+
+    def schedule_clients_search(self):
+        if self.search_after is not None:
+            self.after_cancel(self.search_after)
+        self.search_after = self.after(SEARCH_DELAY_MS, self.refresh_clients_list)
+
+    def refresh_clients_list(self):
+        # The search reads (and may re-parse) the configs, so it runs on the main
+        # tunnel's lane, after any edit queued there; a newer search replaces a waiting one
+        self.search_after = None
+        if not self.clients_view_active():
+            return
+        query = self.clients_search_entry.get()
+        self.run_task(self.search_clients, query, tunnel=self.manager, key="search clients",
+                      label="Search clients", on_done=self.show_clients)
+
+    def search_clients(self, query):
+        # On a task worker. Items are (tunnel, peer); the tunnel is None when there is only one
+        names = self.manager.tunnel_names()
+        items = []
+        total = 0
+        for name in names:
+            tunnel = self.manager.tunnel(name)
+            label = name if len(names) > 1 else None
+            items.extend((label, peer) for peer in tunnel.search_peers(query))
+            total += len(tunnel.get_config().peers)
+        return items, total
+
+    @instrument("view clients.refresh")
+    def show_clients(self, result):
+        # Re-binds the visible rows, no widgets are rebuilt
+        if not self.clients_view_active():
+            return
+        items, total = result
+        self.clients_list.set_items(items)
+        self.clients_count_label.configure(text=f"{len(items)} of {total} clients")
 
     def add_client_dialog(self):
+        tunnel = self.current_tunnel()
         dialog = ctk.CTkToplevel(self)
-        dialog.title("Add New Client")
+        dialog.title(f"Add New Client ({tunnel.settings.get('interface_name', 'wg0')})")
         dialog.geometry("400x300")
         dialog.attributes("-topmost", True)
 
@@ -248,54 +649,106 @@ class App(ctk.CTk):
         name_entry.pack(pady=5)
 
         ctk.CTkLabel(dialog, text="Allowed IP (e.g. 10.0.0.2/32):").pack(pady=(10, 0))
-        ip_entry = ctk.CTkEntry(dialog, width=250)
-        next_ip = self.manager.get_next_ip()
-        ip_entry.insert(0, next_ip)
+        ip_entry = ctk.CTkEntry(dialog, width=250, placeholder_text="Finding a free address...")
         ip_entry.pack(pady=5)
 
+        def suggest(next_ip):
+            # Unless the user typed an address in the meantime
+            if dialog.winfo_exists() and not ip_entry.get():
+                ip_entry.configure(placeholder_text="")
+                ip_entry.insert(0, next_ip or "")
+
+        def no_suggestion(error):
+            print(f"Could not find a free address: {error}")
+            if dialog.winfo_exists():
+                ip_entry.configure(placeholder_text="")
+
+        # Scanning a large config for a free address stays off the Tk thread
+        self.run_task(tunnel.get_next_ip, tunnel=tunnel, label="Find a free address",
+                      on_done=suggest, on_error=no_suggestion)
+
+        def add(name, ip):
+            # On a task worker: overlap check, wg genkey and the config write
+            problems = tunnel.check_allowed_ips(ip)
+            if problems:
+                more = f"\n... and {len(problems) - 10} more" if len(problems) > 10 else ""
+                return "\n".join(problems[:10]) + more, None
+            priv, pub = tunnel.generate_keys()
+            if not priv:
+                return "Could not generate keys. Check WG path.", None
+            tunnel.add_peer(name, pub, ip)
+            return None, (name, priv, ip, tunnel.get_config().interface)
+
+        def added(outcome):
+            error, client = outcome
+            if error:
+                if dialog.winfo_exists():
+                    save_button.configure(state="normal")
+                messagebox.showerror("Error", error)
+                return
+
+            # Show the private key info for client setup
+            self.show_new_client_info(*client, tunnel)
+            if dialog.winfo_exists():
+                dialog.destroy()
+            self.refresh_clients_list()
+
+            # Prompt to apply to the running tunnel
+            if messagebox.askyesno("Apply Changes", "Client added successfully. Would you like to apply the changes to the running tunnel now?"):
+                self.apply_config_changes(tunnel)
+
+        def failed(error):
+            if dialog.winfo_exists():
+                save_button.configure(state="normal")
+            messagebox.showerror("Error", f"Failed to add client: {error}")
+
         def save():
             name = name_entry.get()
             ip = ip_entry.get()
             if not name:
                 messagebox.showerror("Error", "Name is required")
                 return
-            
-            priv, pub = self.manager.generate_keys()
-            if not priv:
-                messagebox.showerror("Error", "Could not generate keys. Check WG path.")
-                return
+            save_button.configure(state="disabled")
+            self.run_task(add, name, ip, tunnel=tunnel, label=f"Add {name}", on_done=added, on_error=failed)
 
-            config_data = self.manager.parse_config()
-            new_peer = {
-                "name": name,
-                "PublicKey": pub,
-                "AllowedIPs": ip
-            }
-            config_data['peers'].append(new_peer)
-            self.manager.write_config(config_data['interface'], config_data['peers'])
-            
-            # Show the private key info for client setup
-            self.show_new_client_info(name, priv, ip, config_data['interface'])
-            dialog.destroy()
-            self.show_clients_view()
+        save_button = ctk.CTkButton(dialog, text="Generate & Save", command=save)
+        save_button.pack(pady=20)
+
+    def bulk_import_dialog(self):
+        from wg_provision import provision_from_csv, ProvisionError
 
-            # Prompt to restart service
-            if messagebox.askyesno("Apply Changes", "Client added successfully. Would you like to restart the WireGuard service now to apply changes?"):
-                self.service_action("restart")
+        csv_path = filedialog.askopenfilename(title="Clients CSV (name, optional address)", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not csv_path:
+            return
+        output = filedialog.asksaveasfilename(title="Save client configurations", defaultextension=".zip", filetypes=[("Zip archive", "*.zip")])
+        if not output:
+            return
+        apply = messagebox.askyesno("Apply Changes", "Apply the new clients to the running tunnel once they are added?")
+        tunnel = self.current_tunnel()
+
+        def done(result):
+            self.refresh_clients_list()
+            messagebox.showinfo("Success", f"{result.summary()}\n\nConfigurations saved to {output}")
 
-        ctk.CTkButton(dialog, text="Generate & Save", command=save).pack(pady=20)
+        def failed(error):
+            if isinstance(error, ProvisionError):
+                messagebox.showerror("Error", str(error))
+            else:
+                messagebox.showerror("Error", f"Bulk import failed: {error}")
+
+        # Progress per phase in the sidebar; Cancel stops it before the config is written
+        self.run_task(lambda: provision_from_csv(tunnel, csv_path, output, apply=apply, progress=current_task().report),
+                      tunnel=tunnel, label="Bulk import", on_done=done, on_error=failed)
+
+    def show_new_client_info(self, name, priv_key, ip, interface_data, tunnel=None):
+        from wg_render import qr_available
 
-    def show_new_client_info(self, name, priv_key, ip, interface_data):
         info_win = ctk.CTkToplevel(self)
         info_win.title(f"Client Config: {name}")
         info_win.geometry("500x600")
         info_win.attributes("-topmost", True)
 
-        server_pub_key = interface_data.get('PublicKey', '')
-        if not server_pub_key and interface_data.get('PrivateKey'):
-            server_pub_key = self.manager.get_public_key(interface_data.get('PrivateKey'))
-
-        client_conf = f"[Interface]\nPrivateKey = {priv_key}\nAddress = {ip}\nDNS = 1.1.1.1\n\n[Peer]\nPublicKey = {server_pub_key}\nEndpoint = {self.manager.settings.get('endpoint', 'YOUR_SERVER_IP:51820')}\nAllowedIPs = 0.0.0.0/0"
+        client_conf = (tunnel or self.manager).build_client_config(priv_key, ip, interface_data)
         
         ctk.CTkLabel(info_win, text="Client Configuration", font=ctk.CTkFont(size=18, weight="bold")).pack(pady=10)
         
@@ -303,22 +756,24 @@ class App(ctk.CTk):
         textbox.pack(pady=10)
         textbox.insert("0.0", client_conf)
 
-        # QR Code
-        qr = qrcode.QRCode(version=1, box_size=5, border=2)
-        qr.add_data(client_conf)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert PIL image to Tkinter image
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-        photo = Image.open(io.BytesIO(img_byte_arr))
-        ctk_image = ctk.CTkImage(light_image=photo, dark_image=photo, size=(250, 250))
-        
-        qr_label = ctk.CTkLabel(info_win, text="", image=ctk_image)
+        # QR Code, rendered off the UI thread and cached per config
+        has_qr = qr_available()
+        qr_label = ctk.CTkLabel(info_win, text="Rendering QR code..." if has_qr else "QR code unavailable (qrcode not installed)",
+                                width=250, height=250)
         qr_label.pack(pady=10)
 
+        def show_image(image, error):
+            if not qr_label.winfo_exists():
+                return
+            if error is not None:
+                qr_label.configure(text=f"QR code error: {error}")
+                return
+            ctk_image = ctk.CTkImage(light_image=image, dark_image=image, size=(250, 250))
+            qr_label.configure(text="", image=ctk_image)
+
+        if has_qr:
+            self.get_renderer().render_async(client_conf, lambda image, error: self.tasks.post(show_image, image, error))
+
         def download_conf():
             try:
                 desktop = os.path.join(os.path.join(os.environ['USERPROFILE']), 'Desktop')
@@ -334,19 +789,26 @@ class App(ctk.CTk):
 
         ctk.CTkButton(info_win, text="Download Configuration (.conf)", command=download_conf, fg_color="#27ae60").pack(pady=10)
 
-    def show_qr(self, peer):
+    def show_qr(self, item):
         # This would need the private key which we don't store for security
         # But for this manager, we can provide a way to rebuild if known or just show public info
         messagebox.showinfo("Note", "Private keys are only shown during creation for security. QR codes for existing clients require their specific private key.")
 
-    def delete_client(self, peer):
-        if messagebox.askyesno("Confirm", f"Delete client {peer.get('name')}?"):
-            config_data = self.manager.parse_config()
-            config_data['peers'] = [p for p in config_data['peers'] if p.get('PublicKey') != peer.get('PublicKey')]
-            self.manager.write_config(config_data['interface'], config_data['peers'])
-            self.show_clients_view()
+    def delete_client(self, item):
+        name, peer = item
+        tunnel = self.manager.tunnel(name)
+        if not messagebox.askyesno("Confirm", f"Delete client {peer.name}?"):
+            return
+
+        def deleted(_):
+            self.refresh_clients_list()
+            if messagebox.askyesno("Apply Changes", "Client deleted. Would you like to apply the changes to the running tunnel now?"):
+                self.apply_config_changes(tunnel)
+        self.run_task(tunnel.remove_peer, peer.public_key, tunnel=tunnel, label=f"Delete {peer.name}", on_done=deleted)
 
-    def edit_client_dialog(self, peer):
+    def edit_client_dialog(self, item):
+        name, peer = item
+        tunnel = self.manager.tunnel(name)
         dialog = ctk.CTkToplevel(self)
         dialog.title("Edit Client")
         dialog.geometry("400x200")
@@ -354,7 +816,7 @@ class App(ctk.CTk):
 
         ctk.CTkLabel(dialog, text="Client Name:").pack(pady=(20, 0))
         name_entry = ctk.CTkEntry(dialog, width=250)
-        name_entry.insert(0, peer.get('name', ''))
+        name_entry.insert(0, peer.name or '')
         name_entry.pack(pady=5)
 
         def save():
@@ -363,20 +825,14 @@ class App(ctk.CTk):
                 messagebox.showerror("Error", "Name is required")
                 return
             
-            # Update name
-            config_data = self.manager.parse_config()
-            # Find the peer to update. We rely on PublicKey as unique ID.
-            for p in config_data['peers']:
-                if p.get('PublicKey') == peer.get('PublicKey'):
-                    p['name'] = new_name
-                    break
-            
-            self.manager.write_config(config_data['interface'], config_data['peers'])
+            # Update name. We rely on PublicKey as unique ID.
+            self.run_task(tunnel.rename_peer, peer.public_key, new_name, tunnel=tunnel, label=f"Rename {peer.name}",
+                          on_done=lambda _: self.refresh_clients_list())
             dialog.destroy()
-            self.show_clients_view()
             
         ctk.CTkButton(dialog, text="Save", command=save).pack(pady=20)
 
+    @instrument("view settings")
     def show_settings_view(self):
         self.clear_view()
         
@@ -416,11 +872,71 @@ class App(ctk.CTk):
                 "endpoint": endpoint_entry.get(),
                 "interface_name": interface_entry.get()
             }
-            self.manager.save_settings(new_settings)
+            # Keep settings this form doesn't show (monitor interval, backends, ...)
+            self.manager.save_settings(dict(self.manager.settings, **new_settings))
+            self.manager.configure_instrumentation()
             messagebox.showinfo("Success", "Settings saved.")
 
         ctk.CTkButton(self.main_content, text="Save Settings", command=save_settings).pack(pady=20)
 
+    @instrument("view diagnostics")
+    def show_diagnostics_view(self):
+        self.clear_view()
+        ctk.CTkLabel(self.main_content, text="Diagnostics", font=ctk.CTkFont(size=24, weight="bold")).pack(pady=(0, 10))
+
+        btn_frame = ctk.CTkFrame(self.main_content, fg_color="transparent")
+        btn_frame.pack(fill="x", pady=(0, 10))
+        textbox = ctk.CTkTextbox(self.main_content, font=ctk.CTkFont(family="Consolas", size=12), wrap="none")
+        textbox.pack(fill="both", expand=True)
+        footer = ctk.CTkLabel(self.main_content, text="", text_color="gray", anchor="w")
+        footer.pack(fill="x", pady=(5, 0))
+
+        def render():
+            data = self.manager.diagnostics()
+            lines = [f"{'operation':44} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+            rows = list(data["operations"].items())
+            rows.sort(key=lambda item: item[1]["p95_ms"], reverse=True)
+            for name, op in rows:
+                lines.append(f"{name:44} {op['count']:>7} {op['p50_ms']:>9.1f} {op['p95_ms']:>9.1f} "
+                             f"{op['p99_ms']:>9.1f} {op['max_ms']:>9.1f}")
+            textbox.configure(state="normal")
+            textbox.delete("0.0", "end")
+            textbox.insert("0.0", "\n".join(lines))
+            textbox.configure(state="disabled")
+            footer.configure(text=f"Operations over {data['slow_threshold_ms']} ms are logged to {data['slow_log'] or '(no log)'}")
+
+        def toggle_profiling():
+            if PROFILER.active:
+                path, summary = PROFILER.stop(os.path.join(self.manager.app_data_dir, "logs"))
+                profile_button.configure(text="Start Profiling")
+                textbox.configure(state="normal")
+                textbox.delete("0.0", "end")
+                textbox.insert("0.0", f"Profile saved to {path}\n\n{summary}")
+                textbox.configure(state="disabled")
+            else:
+                PROFILER.start()
+                profile_button.configure(text="Stop Profiling")
+
+        def export():
+            try:
+                path = self.manager.export_diagnostics()
+                messagebox.showinfo("Diagnostics", f"Saved to {path}")
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to save diagnostics: {e}")
+
+        ctk.CTkButton(btn_frame, text="Refresh", command=render).pack(side="left")
+        profile_button = ctk.CTkButton(btn_frame, text="Stop Profiling" if PROFILER.active else "Start Profiling",
+                                       command=toggle_profiling)
+        profile_button.pack(side="left", padx=10)
+        ctk.CTkButton(btn_frame, text="Export JSON", command=export).pack(side="left")
+        render()
+
 if __name__ == "__main__":
+    # Bulk provisioning renders artifacts on a process pool, which needs this in the frozen exe
+    import multiprocessing
+
+    multiprocessing.freeze_support()
+    STARTUP.mark("imports")
     app = App()
     app.mainloop()
+    app.tasks.shutdown()
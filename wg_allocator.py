@@ -0,0 +1,230 @@
+import bisect
+import ipaddress
+
+# Free-address bookkeeping for client IPs.
+# Each pool is one interface Address CIDR, stored as a sorted set of free
+# [start, end] integer intervals. The lowest free host is always the first
+# interval, marking/releasing an address is a bisect plus a local split or
+# merge, so cost depends on fragmentation, not on the number of peers.
+
+DEFAULT_INTERFACE_ADDRESS = "10.0.0.1/24"
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class AddressPool:
+    def __init__(self, network):
+        self.network = ipaddress.ip_network(network, strict=False)
+        self.version = self.network.version
+        self.host_prefix = 32 if self.version == 4 else 128
+        first = int(self.network.network_address)
+        last = int(self.network.broadcast_address)
+        self._starts = [first]
+        self._ends = [last]
+        # Ranges that stay reserved even when a peer covering them is released
+        self._permanent = []
+        # Network and broadcast addresses are not usable hosts on IPv4, and the
+        # all-zeros host is the subnet-router anycast address on IPv6
+        if self.version == 4 and self.network.prefixlen < 31:
+            self.reserve_permanent(first, first)
+            self.reserve_permanent(last, last)
+        elif self.version == 6 and self.network.prefixlen < 127:
+            self.reserve_permanent(first, first)
+
+    def __contains__(self, address):
+        return ipaddress.ip_address(address) in self.network
+
+    def free_count(self):
+        return sum(e - s + 1 for s, e in zip(self._starts, self._ends))
+
+    def is_free(self, value):
+        i = bisect.bisect_right(self._starts, value) - 1
+        return i >= 0 and value <= self._ends[i]
+
+    def reserve_range(self, lo, hi):
+        # Remove [lo, hi] from the free set
+        lo = max(lo, int(self.network.network_address))
+        hi = min(hi, int(self.network.broadcast_address))
+        if lo > hi:
+            return
+        i = max(bisect.bisect_right(self._starts, lo) - 1, 0)
+        new_starts = []
+        new_ends = []
+        j = i
+        while j < len(self._starts) and self._starts[j] <= hi:
+            s, e = self._starts[j], self._ends[j]
+            if e >= lo:
+                if s < lo:
+                    new_starts.append(s)
+                    new_ends.append(lo - 1)
+                if e > hi:
+                    new_starts.append(hi + 1)
+                    new_ends.append(e)
+            else:
+                new_starts.append(s)
+                new_ends.append(e)
+            j += 1
+        self._starts[i:j] = new_starts
+        self._ends[i:j] = new_ends
+
+    def reserve_permanent(self, lo, hi):
+        self._permanent.append((lo, hi))
+        self.reserve_range(lo, hi)
+
+    def release_range(self, lo, hi):
+        # Return [lo, hi] to the free set, merging with neighbours
+        lo = max(lo, int(self.network.network_address))
+        hi = min(hi, int(self.network.broadcast_address))
+        if lo > hi:
+            return
+        i = bisect.bisect_left(self._starts, lo)
+        if i > 0 and self._ends[i - 1] >= lo - 1:
+            i -= 1
+            lo = min(lo, self._starts[i])
+            hi = max(hi, self._ends[i])
+        j = i
+        while j < len(self._starts) and self._starts[j] <= hi + 1:
+            hi = max(hi, self._ends[j])
+            j += 1
+        self._starts[i:j] = [lo]
+        self._ends[i:j] = [hi]
+        for p_lo, p_hi in self._permanent:
+            if p_lo <= hi and p_hi >= lo:
+                self.reserve_range(p_lo, p_hi)
+
+    def reserve(self, cidr):
+        net = ipaddress.ip_network(cidr, strict=False)
+        if net.version == self.version:
+            self.reserve_range(int(net.network_address), int(net.broadcast_address))
+
+    def release(self, cidr):
+        net = ipaddress.ip_network(cidr, strict=False)
+        if net.version == self.version:
+            self.release_range(int(net.network_address), int(net.broadcast_address))
+
+    def peek(self):
+        if not self._starts:
+            return None
+        return self._starts[0]
+
+    def allocate(self):
+        value = self.peek()
+        if value is None:
+            raise PoolExhausted(f"No free addresses left in {self.network}")
+        self.reserve_range(value, value)
+        return value
+
+    def allocate_many(self, count):
+        # Walks the free intervals once instead of calling allocate() N times
+        if count > self.free_count():
+            raise PoolExhausted(f"Only {self.free_count()} free addresses left in {self.network}")
+        values = []
+        while len(values) < count:
+            s, e = self._starts[0], self._ends[0]
+            take = min(e - s + 1, count - len(values))
+            values.extend(range(s, s + take))
+            if s + take > e:
+                del self._starts[0]
+                del self._ends[0]
+            else:
+                self._starts[0] = s + take
+        return values
+
+    def format(self, value):
+        return f"{ipaddress.ip_address(value)}/{self.host_prefix}"
+
+
+class AddressAllocator:
+    """ One AddressPool per interface Address CIDR, IPv4 and IPv6 """
+
+    def __init__(self, interface_address=None, reserved=None):
+        self.pools = []
+        for cidr in (interface_address or DEFAULT_INTERFACE_ADDRESS).split(','):
+            cidr = cidr.strip()
+            if not cidr:
+                continue
+            try:
+                pool = AddressPool(cidr)
+            except ValueError:
+                continue
+            self.pools.append(pool)
+            # The interface's own address is never handed out
+            own = int(ipaddress.ip_address(cidr.split('/')[0]))
+            pool.reserve_permanent(own, own)
+        for entry in reserved or []:
+            self.reserve(entry)
+
+    @classmethod
+    def from_config(cls, model, reserved=None):
+        allocator = cls(model.interface.get('Address'), reserved)
+        for peer in model.peers:
+            allocator.mark_used(peer.allowed_ips)
+        return allocator
+
+    def _pool_for(self, network):
+        for pool in self.pools:
+            if network.version == pool.version and network.overlaps(pool.network):
+                return pool
+        return None
+
+    def _networks(self, allowed_ips):
+        for entry in allowed_ips.split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+            try:
+                yield ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                continue
+
+    def mark_used(self, allowed_ips):
+        for net in self._networks(allowed_ips):
+            pool = self._pool_for(net)
+            if pool:
+                pool.reserve_range(int(net.network_address), int(net.broadcast_address))
+
+    def release(self, allowed_ips):
+        for net in self._networks(allowed_ips):
+            pool = self._pool_for(net)
+            if pool:
+                pool.release_range(int(net.network_address), int(net.broadcast_address))
+
+    def reserve(self, entry):
+        # Accepts a CIDR ("10.0.0.0/28") or an inclusive range ("10.0.0.10-10.0.0.20")
+        if '-' in entry:
+            lo, hi = (ipaddress.ip_address(p.strip()) for p in entry.split('-', 1))
+            for pool in self.pools:
+                if pool.version == lo.version:
+                    pool.reserve_permanent(int(lo), int(hi))
+        else:
+            for net in self._networks(entry):
+                pool = self._pool_for(net)
+                if pool:
+                    pool.reserve_permanent(int(net.network_address), int(net.broadcast_address))
+
+    def pool(self, version=4):
+        for pool in self.pools:
+            if pool.version == version:
+                return pool
+        return None
+
+    def next_free(self, version=4):
+        # Lowest free host address without reserving it
+        pool = self.pool(version)
+        if pool is None or pool.peek() is None:
+            return None
+        return pool.format(pool.peek())
+
+    def allocate(self, version=4):
+        pool = self.pool(version)
+        if pool is None:
+            raise PoolExhausted(f"No IPv{version} address configured on the interface")
+        return pool.format(pool.allocate())
+
+    def allocate_many(self, count, version=4):
+        pool = self.pool(version)
+        if pool is None:
+            raise PoolExhausted(f"No IPv{version} address configured on the interface")
+        return [pool.format(v) for v in pool.allocate_many(count)]
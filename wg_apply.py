@@ -0,0 +1,144 @@
+import ipaddress
+
+import wg_keys
+
+# Computing the difference between wg0.conf and the running tunnel, so
+# changes can be applied with one `wg set` call instead of restarting the
+# tunnel service (which drops every connected client).
+
+MAX_COMMAND_LENGTH = 30000
+# Room for the wg.exe path itself and "set"
+COMMAND_OVERHEAD = 300
+
+
+class PeerDelta:
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.changed = []
+        # Set when interface-level settings differ and only a restart applies them
+        self.restart_reason = None
+
+    def is_empty(self):
+        return not (self.added or self.removed or self.changed)
+
+    def summary(self):
+        return {"added": len(self.added), "removed": len(self.removed), "changed": len(self.changed)}
+
+
+def _normalize_ips(value):
+    networks = set()
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry or entry == '(none)':
+            continue
+        try:
+            networks.add(str(ipaddress.ip_network(entry, strict=False)))
+        except ValueError:
+            networks.add(entry)
+    return networks
+
+
+def _keepalive(value):
+    value = (value or '').strip()
+    return '0' if value in ('', 'off', '0') else value
+
+
+def _preshared(value):
+    value = (value or '').strip()
+    return '' if value in ('', '(none)') else value
+
+
+def compute_delta(model, live_interface, live_peers):
+    """
+    model: ConfigModel from disk. live_interface: wg_dump.DumpInterface (or
+    None), live_peers: wg_dump.PeerTable of the running tunnel.
+    """
+    delta = PeerDelta()
+    interface = model.interface
+
+    if live_interface is not None:
+        private_key = interface.get('PrivateKey', '')
+        if private_key:
+            try:
+                public_key = wg_keys.derive_public_key(private_key)
+            except ValueError:
+                public_key = ''
+            if public_key != live_interface.public_key:
+                delta.restart_reason = "interface key changed"
+        listen_port = interface.get('ListenPort', '').strip()
+        if listen_port and listen_port != live_interface.listen_port:
+            delta.restart_reason = delta.restart_reason or "listen port changed"
+
+    live = live_peers.index()
+    desired = {}
+    for peer in model.peers:
+        if peer.public_key:
+            desired.setdefault(peer.public_key, peer)
+
+    for public_key, peer in desired.items():
+        row = live.get(public_key)
+        if row is None:
+            delta.added.append(peer)
+            continue
+        values = peer.values
+        if (_normalize_ips(values.get('AllowedIPs', '')) != _normalize_ips(live_peers.allowed_ips[row])
+                or _keepalive(values.get('PersistentKeepalive')) != _keepalive(live_peers.keepalives[row])
+                or _preshared(values.get('PresharedKey')) != _preshared(live_peers.preshared_keys[row])):
+            delta.changed.append(peer)
+
+    delta.removed = [key for key in live_peers.public_keys if key not in desired]
+    return delta
+
+
+def set_groups(delta, psk_file=None):
+    """
+    Per-peer `wg set` argument groups applying the delta. wg only reads
+    preshared keys from files, so psk_file(key) -> path is called for every
+    added/changed peer; an empty key gives an empty file, which clears the
+    peer's preshared key. Without psk_file the keys themselves are used (UAPI).
+    """
+    groups = []
+    for public_key in delta.removed:
+        groups.append(["peer", public_key, "remove"])
+
+    for peer in delta.added + delta.changed:
+        values = peer.values
+        group = ["peer", peer.public_key]
+        # An empty value clears the peer's allowed IPs
+        group += ["allowed-ips", ",".join(sorted(_normalize_ips(values.get('AllowedIPs', ''))))]
+        group += ["persistent-keepalive", _keepalive(values.get('PersistentKeepalive'))]
+        if values.get('Endpoint'):
+            group += ["endpoint", values['Endpoint']]
+        preshared = _preshared(values.get('PresharedKey'))
+        group += ["preshared-key", psk_file(preshared) if psk_file else preshared]
+        groups.append(group)
+    return groups
+
+
+def build_set_commands(interface_name, delta, psk_file, max_length=MAX_COMMAND_LENGTH):
+    """
+    Argument lists for `wg set` applying the delta, normally just one. Peers are
+    only split over several invocations when a single command line would
+    exceed max_length (Windows caps command lines at 32767 characters).
+    """
+    return pack_commands(interface_name, set_groups(delta, psk_file), max_length)
+
+
+def pack_commands(interface_name, groups, max_length=MAX_COMMAND_LENGTH):
+    """
+    Join per-peer argument groups into as few `wg set <interface>` argument
+    lists as fit under max_length.
+    """
+    commands = []
+    current = None
+    length = 0
+    for group in groups:
+        group_length = sum(len(arg) + 3 for arg in group)
+        if current is None or length + group_length > max_length:
+            current = ["set", interface_name]
+            length = COMMAND_OVERHEAD + len(interface_name)
+            commands.append(current)
+        current += group
+        length += group_length
+    return commands
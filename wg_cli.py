@@ -0,0 +1,440 @@
+"""
+Headless command line for WireGuard Manager.
+
+    python wg_cli.py list [--json]
+    python wg_cli.py add NAME [--ip ADDRESS] [--output FILE] [--apply] [--force]
+    python wg_cli.py remove KEY_OR_NAME [--apply]
+    python wg_cli.py status
+    python wg_cli.py tunnels [--json]
+    python wg_cli.py dump [--json]
+    python wg_cli.py next-ip [-6]
+    python wg_cli.py owner ADDRESS
+    python wg_cli.py lint [--json]
+    python wg_cli.py apply
+    python wg_cli.py provision CSV OUTPUT [--no-qr] [--no-apply]
+    python wg_cli.py session list [--json]
+    python wg_cli.py session start PUBLIC_KEY ADDRESS [--hours H] [--label TEXT]
+    python wg_cli.py session end PUBLIC_KEY
+    python wg_cli.py session expire
+    python wg_cli.py session run
+    python wg_cli.py history [--json] [--limit N]
+    python wg_cli.py restore REVISION [--apply]
+    python wg_cli.py traffic record
+    python wg_cli.py traffic show [--peer KEY_OR_NAME] [--since 30d] [--until DATE] [--resolution 1h] [--json]
+    python wg_cli.py traffic export FILE [--since 30d] [--until DATE] [--resolution 1h]
+
+Uses the same settings.json as the GUI; --conf, --interface, --wg and
+--service-backend override it for a single run without saving. --tunnel
+picks one of the tunnels in settings["tunnels"] instead of the main one.
+--diagnostics PATH writes the timings of the run as JSON. Nothing from
+the GUI (customtkinter, tkinter, qrcode, PIL) is imported.
+"""
+import sys
+
+from wg_manager import WireGuardManager
+
+
+def _print_json(data):
+    import json
+
+    print(json.dumps(data, indent=2))
+
+
+def cmd_list(manager, args):
+    peers = manager.get_config().peers
+    if args.json:
+        _print_json([{"name": p.name, "public_key": p.public_key, "allowed_ips": p.allowed_ips} for p in peers])
+        return 0
+    for peer in peers:
+        print(f"{peer.display_name()}\t{peer.allowed_ips}\t{peer.public_key}")
+    return 0
+
+
+def _apply(manager):
+    result = manager.apply_changes()
+    detail = result.get("reason") or ", ".join(f"{k} {result[k]}" for k in ("added", "removed", "changed") if k in result)
+    print(f"apply: {result['mode']}{' (' + detail + ')' if detail else ''} {'ok' if result['ok'] else 'FAILED'}",
+          file=sys.stderr)
+    return 0 if result["ok"] else 1
+
+
+def cmd_add(manager, args):
+    if manager.get_config().peer_by_name(args.name) is not None:
+        print(f"Client already exists: {args.name}", file=sys.stderr)
+        return 1
+    address = args.ip or manager.get_next_ip(6 if args.ipv6 else 4)
+    if not address:
+        print("No free address", file=sys.stderr)
+        return 1
+    problems = manager.check_allowed_ips(address) if args.ip and not args.force else []
+    if problems:
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        return 1
+    priv_key, pub_key = manager.generate_keys()
+    if not priv_key:
+        return 1
+    manager.add_peer(args.name, pub_key, address)
+    client_conf = manager.build_client_config(priv_key, address)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(client_conf)
+        print(f"Added {args.name} ({address}), config written to {args.output}", file=sys.stderr)
+    else:
+        print(client_conf)
+    return _apply(manager) if args.apply else 0
+
+
+def cmd_remove(manager, args):
+    config = manager.get_config()
+    peer = config.peer_by_public_key(args.peer) or config.peer_by_name(args.peer)
+    if peer is None:
+        print(f"No such client: {args.peer}", file=sys.stderr)
+        return 1
+    if not manager.remove_peer(peer.public_key):
+        return 1
+    print(f"Removed {peer.display_name()}", file=sys.stderr)
+    return _apply(manager) if args.apply else 0
+
+
+def cmd_status(manager, args):
+    print(manager.get_service_status())
+    return 0
+
+
+def cmd_tunnels(manager, args):
+    # Status and peer counts of every tunnel, collected in parallel
+    states = manager.collect_tunnel_states(max_age=0)
+    if args.json:
+        _print_json([state.summary() for state in states])
+        return 0
+    for state in states:
+        info = state.summary()
+        peers = f"{info['connected']}/{info['peers']} peers connected" if info["peers"] is not None else info["error"]
+        print(f"{state.name}\t{state.status}\t{peers}")
+    return 0
+
+
+def cmd_dump(manager, args):
+    dump = manager.read_wg_dump()
+    if dump is None:
+        return 1
+    interface, peers = dump
+    if args.json:
+        _print_json({"interface": interface.as_dict() if interface else None, "peers": peers.as_dicts()})
+        return 0
+    from wg_monitor import format_bytes, format_handshake
+
+    if interface is not None:
+        print(f"interface {interface.public_key}\tport {interface.listen_port}\tfwmark {interface.fwmark}")
+    config = manager.get_config()
+    for i, public_key in enumerate(peers.public_keys):
+        print(f"{config.name_for(public_key)}\t{peers.endpoints[i]}\t{format_bytes(peers.rx[i])} rx\t"
+              f"{format_bytes(peers.tx[i])} tx\t{format_handshake(peers.handshakes[i])}")
+    return 0
+
+
+def cmd_next_ip(manager, args):
+    address = manager.get_next_ip(6 if args.ipv6 else 4)
+    if not address:
+        return 1
+    print(address)
+    return 0
+
+
+def cmd_owner(manager, args):
+    try:
+        peer = manager.peer_for_address(args.address)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if peer is None:
+        print(f"No peer routes {args.address}", file=sys.stderr)
+        return 1
+    print(f"{peer.display_name()}\t{peer.allowed_ips}\t{peer.public_key}")
+    return 0
+
+
+def cmd_lint(manager, args):
+    issues = manager.lint_config()
+    if args.json:
+        _print_json([issue.as_dict() for issue in issues])
+    else:
+        for issue in issues:
+            print(issue)
+    return 1 if any(issue.level == "error" for issue in issues) else 0
+
+
+def cmd_apply(manager, args):
+    return _apply(manager)
+
+
+def cmd_provision(manager, args):
+    from wg_provision import provision_from_csv, ProvisionError
+
+    try:
+        result = provision_from_csv(manager, args.csv, args.output, with_qr=not args.no_qr, apply=not args.no_apply)
+    except (ProvisionError, OSError) as e:
+        print(f"Provisioning failed: {e}", file=sys.stderr)
+        return 1
+    print(result.summary(), file=sys.stderr)
+    return 0 if result.applied is not False else 1
+
+
+def cmd_session(manager, args):
+    import time
+
+    sessions = manager.get_session_scheduler()
+    if args.action == "list":
+        if args.json:
+            _print_json([s.as_dict() for s in sessions.sessions()])
+            return 0
+        now = time.time()
+        for s in sessions.sessions():
+            print(f"{s.label or '-'}\t{s.address}\t{max(s.expires_at - now, 0) / 3600:.1f}h left\t{s.public_key}")
+        return 0
+    if args.action == "start":
+        session = sessions.activate(args.public_key, args.address, hours=args.hours, label=args.label or "")
+        if session is None:
+            return 1
+        print(f"Session for {args.public_key} until {time.strftime('%Y-%m-%d %H:%M', time.localtime(session.expires_at))}",
+              file=sys.stderr)
+        return 0
+    if args.action == "end":
+        if not sessions.revoke(args.public_key):
+            print(f"No session ended for {args.public_key}", file=sys.stderr)
+            return 1
+        return 0
+    if args.action == "expire":
+        expired = sessions.expire_due()
+        print(f"Expired {len(expired)} session(s), {len(sessions)} active", file=sys.stderr)
+        return 0
+    # run: re-activate live sessions and expire them as they run out, until Ctrl+C
+    sessions.start()
+    print(f"{len(sessions)} session(s) active, expiring in the background (Ctrl+C to stop)", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        sessions.close()
+    return 0
+
+
+def cmd_history(manager, args):
+    import time
+
+    revisions = manager.get_history().revisions()[:args.limit or None]
+    if args.json:
+        _print_json([r.as_dict() for r in revisions])
+        return 0
+    for r in revisions:
+        print(f"{r.id}\t{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(r.timestamp))}\t{r.size}\t{r.message}")
+    return 0
+
+
+def cmd_restore(manager, args):
+    try:
+        manager.restore_revision(args.revision)
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        return 1
+    print(f"Restored revision {args.revision}", file=sys.stderr)
+    return _apply(manager) if args.apply else 0
+
+
+def _parse_time(text):
+    # "30d", "12h", "90m" ago, or a local date/time "2024-05-01" / "2024-05-01 12:00"
+    import time
+
+    if text is None:
+        return None
+    units = {"m": 60, "h": 3600, "d": 86400}
+    if text[-1:] in units and text[:-1].isdigit():
+        return time.time() - int(text[:-1]) * units[text[-1]]
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(text, fmt))
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid time: {text} (use e.g. 30d, 12h or 2024-05-01)")
+
+
+def cmd_traffic(manager, args):
+    from wg_monitor import format_bytes
+
+    if args.action == "record":
+        # For a scheduled task, e.g. every minute
+        active = manager.record_traffic()
+        if active is None:
+            return 1
+        print(f"Recorded, {active} peer(s) with traffic", file=sys.stderr)
+        return 0
+    try:
+        start, end = _parse_time(args.since), _parse_time(args.until)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    store = manager.get_traffic_store()
+    config = manager.get_config()
+    names = {p.public_key: p.display_name() for p in config.peers}
+    try:
+        if args.action == "export":
+            if args.file == "-":
+                count = store.export_csv(sys.stdout, start, end, args.resolution, names)
+            else:
+                with open(args.file, "w", newline="", encoding="utf-8") as f:
+                    count = store.export_csv(f, start, end, args.resolution, names)
+            print(f"Exported {count} rows", file=sys.stderr)
+            return 0
+        if args.peer:
+            peer = config.peer_by_public_key(args.peer) or config.peer_by_name(args.peer)
+            key = peer.public_key if peer is not None else args.peer
+            totals = {key: store.usage(key, start, end, args.resolution)}
+        else:
+            totals = store.totals(start, end, args.resolution)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    rows = sorted(totals.items(), key=lambda item: item[1][0] + item[1][1], reverse=True)
+    if args.json:
+        _print_json([{"public_key": k, "name": names.get(k), "rx_bytes": rx, "tx_bytes": tx} for k, (rx, tx) in rows])
+        return 0
+    for key, (rx, tx) in rows:
+        print(f"{names.get(key, '(removed)')}\t{format_bytes(rx)} rx\t{format_bytes(tx)} tx\t{key}")
+    return 0
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="wg_cli", description="Headless WireGuard Manager")
+    parser.add_argument("--conf", help="wg0.conf path (overrides settings)")
+    parser.add_argument("--interface", help="tunnel interface name (overrides settings)")
+    parser.add_argument("--wg", help="wireguard.exe / wg path (overrides settings)")
+    parser.add_argument("--service-backend", help="sc, systemd, wg-quick or stub (overrides settings)")
+    parser.add_argument("--tunnel", help="work on this tunnel from settings[\"tunnels\"]")
+    parser.add_argument("--diagnostics", metavar="PATH", help="write operation timings as JSON here when done")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("list", help="list configured clients")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("add", help="add a client and print its config")
+    p.add_argument("name")
+    p.add_argument("--ip", help="address to assign (default: next free)")
+    p.add_argument("-6", dest="ipv6", action="store_true", help="allocate from the IPv6 pool")
+    p.add_argument("--output", help="write the client config here instead of stdout")
+    p.add_argument("--apply", action="store_true", help="apply to the running tunnel")
+    p.add_argument("--force", action="store_true", help="add even if --ip overlaps another client")
+    p.set_defaults(func=cmd_add)
+
+    p = sub.add_parser("remove", help="remove a client by public key or name")
+    p.add_argument("peer")
+    p.add_argument("--apply", action="store_true", help="apply to the running tunnel")
+    p.set_defaults(func=cmd_remove)
+
+    p = sub.add_parser("status", help="tunnel service status")
+    p.set_defaults(func=cmd_status)
+
+    p = sub.add_parser("tunnels", help="status of all configured tunnels")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_tunnels)
+
+    p = sub.add_parser("dump", help="live peer state from `wg show dump`")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_dump)
+
+    p = sub.add_parser("next-ip", help="next free client address")
+    p.add_argument("-6", dest="ipv6", action="store_true")
+    p.set_defaults(func=cmd_next_ip)
+
+    p = sub.add_parser("owner", help="which client an address is routed to (longest prefix)")
+    p.add_argument("address")
+    p.set_defaults(func=cmd_owner)
+
+    p = sub.add_parser("lint", help="check the config for duplicate keys, bad keys and overlapping AllowedIPs")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_lint)
+
+    p = sub.add_parser("apply", help="apply wg0.conf to the running tunnel")
+    p.set_defaults(func=cmd_apply)
+
+    p = sub.add_parser("provision", help="bulk add clients from a CSV")
+    p.add_argument("csv")
+    p.add_argument("output", help="output directory or .zip")
+    p.add_argument("--no-qr", action="store_true")
+    p.add_argument("--no-apply", action="store_true")
+    p.set_defaults(func=cmd_provision)
+
+    p = sub.add_parser("session", help="Gatekeeper sessions (peers switched on for a limited time)")
+    actions = p.add_subparsers(dest="action", required=True)
+    a = actions.add_parser("list", help="active sessions")
+    a.add_argument("--json", action="store_true")
+    a = actions.add_parser("start", help="switch a peer on for a session")
+    a.add_argument("public_key")
+    a.add_argument("address", help="allowed IPs for the peer, e.g. 10.0.0.5/32")
+    a.add_argument("--hours", type=float, help="session length (default: session_hours setting or 8)")
+    a.add_argument("--label", help="shown in listings, e.g. the user's email")
+    a = actions.add_parser("end", help="switch a peer off now")
+    a.add_argument("public_key")
+    actions.add_parser("expire", help="switch off sessions that have run out, then exit")
+    actions.add_parser("run", help="keep running and switch sessions off as they run out")
+    p.set_defaults(func=cmd_session)
+
+    p = sub.add_parser("history", help="recorded revisions of wg0.conf, newest first")
+    p.add_argument("--json", action="store_true")
+    p.add_argument("--limit", type=int, default=20, help="show this many (0 for all)")
+    p.set_defaults(func=cmd_history)
+
+    p = sub.add_parser("restore", help="write a recorded revision back to wg0.conf")
+    p.add_argument("revision", type=int)
+    p.add_argument("--apply", action="store_true", help="apply the restored config to the running tunnel")
+    p.set_defaults(func=cmd_restore)
+
+    p = sub.add_parser("traffic", help="per-client traffic history")
+    actions = p.add_subparsers(dest="action", required=True)
+    actions.add_parser("record", help="add a sample of the current counters (run it on a schedule)")
+    for name, help in (("show", "bytes per client in a time range, busiest first"),
+                       ("export", "stream the history as CSV, one row per client and bucket")):
+        a = actions.add_parser(name, help=help)
+        if name == "export":
+            a.add_argument("file", help="CSV file to write, - for stdout")
+        else:
+            a.add_argument("--peer", help="only this client (public key or name)")
+            a.add_argument("--json", action="store_true")
+        a.add_argument("--since", help="start: 30d, 12h, 90m ago or a date like 2024-05-01 (default: everything kept)")
+        a.add_argument("--until", help="end, same format (default: now)")
+        a.add_argument("--resolution", choices=["raw", "1m", "1h", "1d"],
+                       help="archive to read (default: the finest one that covers --since)")
+    p.set_defaults(func=cmd_traffic)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    manager = WireGuardManager()
+    overrides = {"conf_path": args.conf, "interface_name": args.interface,
+                 "wg_path": args.wg, "service_backend": args.service_backend}
+    overrides = {k: v for k, v in overrides.items() if v}
+    if overrides:
+        manager.settings = dict(manager.settings, **overrides)
+    if args.tunnel:
+        try:
+            manager = manager.tunnel(args.tunnel)
+        except KeyError as e:
+            print(e.args[0], file=sys.stderr)
+            return 1
+    try:
+        return args.func(manager, args)
+    finally:
+        if args.diagnostics:
+            manager.export_diagnostics(args.diagnostics)
+
+
+if __name__ == "__main__":
+    # Process pool workers for `provision` re-import this module on Windows
+    import multiprocessing
+
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,485 @@
+import os
+import bisect
+import re
+import shutil
+import tempfile
+import threading
+
+# Parsed, cached view of a WireGuard .conf file.
+# WireGuardManager keeps one ConfigCache and every caller (views, dialogs,
+# monitor refresh, IP allocation) reads the same ConfigModel until the file
+# on disk changes.
+#
+# The model is backed by a ConfigDocument that keeps the raw text of every
+# section, so add/remove/rename only touch the affected section and all
+# other bytes (comments, ordering, duplicate keys, line endings) are written
+# back unchanged.
+
+SECTION_RE = re.compile(r'^\s*\[(\w+)\]', re.IGNORECASE)
+NAME_RE = re.compile(r'#\s*Name:\s*(.*)')
+
+
+def strip_prefix(address):
+    return address.split('/')[0].strip()
+
+
+def split_list(value):
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+class PeerRecord:
+    __slots__ = ("name", "values")
+
+    def __init__(self, name=None, values=None):
+        self.name = name
+        self.values = values if values is not None else {}
+
+    @property
+    def public_key(self):
+        return self.values.get('PublicKey', '')
+
+    @property
+    def allowed_ips(self):
+        return self.values.get('AllowedIPs', '')
+
+    @property
+    def addresses(self):
+        return [strip_prefix(ip) for ip in split_list(self.allowed_ips)]
+
+    def display_name(self, default='Unnamed'):
+        return self.name if self.name is not None else default
+
+    def as_dict(self):
+        # Legacy representation used by parse_config()/write_config()
+        data = {}
+        if self.name is not None:
+            data['name'] = self.name
+        data.update(self.values)
+        return data
+
+
+class ConfigModel:
+    def __init__(self, interface=None, peers=None):
+        self.interface = interface if interface is not None else {}
+        self.peers = peers if peers is not None else []
+        # Each index maps a key to the list of peers sharing it, so removing
+        # one peer never needs a rescan to find the next owner
+        self._by_public_key = {}
+        self._by_name = {}
+        self._by_address = {}
+        # Bumped on every in-place edit so derived indexes know to rebuild
+        self.version = 0
+        for peer in self.peers:
+            self._index(peer)
+
+    def _index_entries(self, peer):
+        entries = []
+        if peer.public_key:
+            entries.append((self._by_public_key, peer.public_key))
+        if peer.name is not None:
+            entries.append((self._by_name, peer.name))
+        for address in peer.addresses:
+            entries.append((self._by_address, address))
+        return entries
+
+    def _index(self, peer):
+        for index, key in self._index_entries(peer):
+            index.setdefault(key, []).append(peer)
+
+    def _unindex(self, peer):
+        for index, key in self._index_entries(peer):
+            owners = index.get(key)
+            if owners is None:
+                continue
+            owners[:] = [p for p in owners if p is not peer]
+            if not owners:
+                del index[key]
+
+    def add_peer(self, peer):
+        self.peers.append(peer)
+        self._index(peer)
+        self.version += 1
+
+    def remove_peer(self, peer):
+        self._unindex(peer)
+        self.peers.remove(peer)
+        self.version += 1
+
+    def rename_peer(self, peer, name):
+        self._unindex(peer)
+        peer.name = name
+        self._index(peer)
+        self.version += 1
+
+    def peer_by_public_key(self, public_key):
+        owners = self._by_public_key.get(public_key)
+        return owners[0] if owners else None
+
+    def peer_by_name(self, name):
+        owners = self._by_name.get(name)
+        return owners[0] if owners else None
+
+    def peer_by_address(self, address):
+        owners = self._by_address.get(strip_prefix(address))
+        return owners[0] if owners else None
+
+    def duplicate_public_keys(self):
+        return {key: owners for key, owners in self._by_public_key.items() if len(owners) > 1}
+
+    def name_for(self, public_key, default="Unknown Client"):
+        peer = self.peer_by_public_key(public_key)
+        if peer is None:
+            return default
+        return peer.display_name('Unknown')
+
+    def to_dict(self):
+        # Fresh copies, callers are free to mutate the result
+        return {
+            "interface": dict(self.interface),
+            "peers": [peer.as_dict() for peer in self.peers]
+        }
+
+
+class PeerSearchIndex:
+    """ Prefix search over peer names (each word), addresses and public keys """
+
+    def __init__(self, model):
+        self.model = model
+        self._version = None
+        self._keys = []
+        self._positions = []
+        self._last_query = None
+        self._last_result = None
+
+    def _rebuild(self):
+        entries = []
+        for i, peer in enumerate(self.model.peers):
+            for term in self.terms(peer):
+                entries.append((term, i))
+        entries.sort()
+        self._keys = [term for term, _ in entries]
+        self._positions = [i for _, i in entries]
+        self._version = self.model.version
+        self._last_query = None
+        self._last_result = None
+
+    @staticmethod
+    def terms(peer):
+        terms = set()
+        if peer.name:
+            name = peer.name.lower()
+            terms.add(name)
+            terms.update(name.split())
+        terms.update(peer.addresses)
+        if peer.public_key:
+            terms.add(peer.public_key.lower())
+        return terms
+
+    @classmethod
+    def matches(cls, peer, query):
+        return any(term.startswith(query) for term in cls.terms(peer))
+
+    def search(self, query):
+        query = query.strip().lower()
+        if self._version != self.model.version:
+            self._rebuild()
+        if not query:
+            return list(self.model.peers)
+
+        # Typing more characters only narrows the previous result
+        if self._last_query and query.startswith(self._last_query):
+            result = [p for p in self._last_result if self.matches(p, query)]
+        else:
+            lo = bisect.bisect_left(self._keys, query)
+            hi = bisect.bisect_left(self._keys, query + '\uffff')
+            peers = self.model.peers
+            result = [peers[i] for i in sorted(set(self._positions[lo:hi]))]
+
+        self._last_query = query
+        self._last_result = result
+        return result
+
+
+class ConfigSection:
+    __slots__ = ("kind", "text", "record")
+
+    def __init__(self, kind, text, record=None):
+        self.kind = kind
+        self.text = text
+        self.record = record
+
+
+def _parse_section(kind, lines):
+    data = {}
+    name = None
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith('#'):
+            if name is None:
+                name_match = NAME_RE.search(stripped)
+                if name_match:
+                    name = name_match.group(1).strip()
+            continue
+        if '=' in stripped:
+            key, val = stripped.split('=', 1)
+            data[key.strip()] = val.strip()
+
+    if kind == 'peer':
+        return PeerRecord(name, data)
+    interface_data = {}
+    if name is not None:
+        interface_data['name'] = name
+    interface_data.update(data)
+    return interface_data
+
+
+class ConfigDocument:
+    """ Round-trip safe representation of a .conf file, one text span per section """
+
+    def __init__(self, sections=None, newline='\n'):
+        self.sections = sections if sections is not None else []
+        self.newline = newline
+        self._peer_sections = {}
+        interface = {}
+        peers = []
+        for section in self.sections:
+            if section.kind == 'interface':
+                interface = section.record
+            elif section.kind == 'peer':
+                peers.append(section.record)
+                if section.record.public_key:
+                    self._peer_sections.setdefault(section.record.public_key, section)
+        self.model = ConfigModel(interface, peers)
+
+    @classmethod
+    def parse(cls, content):
+        newline = '\r\n' if '\r\n' in content else '\n'
+        sections = []
+        kind = None
+        lines = []
+
+        def flush():
+            if not lines:
+                return
+            record = _parse_section(kind, lines) if kind in ('interface', 'peer') else None
+            sections.append(ConfigSection(kind, ''.join(lines), record))
+
+        for line in content.splitlines(keepends=True):
+            header = SECTION_RE.match(line)
+            if header:
+                flush()
+                kind = header.group(1).lower()
+                lines = []
+            lines.append(line)
+        flush()
+        return cls(sections, newline)
+
+    def text(self):
+        return ''.join(section.text for section in self.sections)
+
+    def _peer_text(self, name, values):
+        nl = self.newline
+        lines = ["[Peer]"]
+        if name is not None:
+            lines.append(f"# Name: {name}")
+        for k, v in values.items():
+            lines.append(f"{k} = {v}")
+        return nl.join(lines) + nl
+
+    def add_peer(self, name, values):
+        # Make sure the previous span ends cleanly and leave one blank line
+        nl = self.newline
+        if self.sections:
+            last = self.sections[-1]
+            if not last.text.endswith(('\n', '\r')):
+                last.text += nl
+            if last.text.strip() and not last.text.endswith(nl + nl):
+                last.text += nl
+
+        record = PeerRecord(name, dict(values))
+        section = ConfigSection('peer', self._peer_text(name, record.values), record)
+        self.sections.append(section)
+        if record.public_key:
+            self._peer_sections.setdefault(record.public_key, section)
+        self.model.add_peer(record)
+        return record
+
+    def remove_peer(self, public_key):
+        section = self._peer_sections.pop(public_key, None)
+        if section is None:
+            return False
+        self.sections.remove(section)
+        self.model.remove_peer(section.record)
+        # Another section may carry the same (duplicate) key
+        for other in self.sections:
+            if other.kind == 'peer' and other.record.public_key == public_key:
+                self._peer_sections[public_key] = other
+                break
+        return True
+
+    def rename_peer(self, public_key, new_name):
+        section = self._peer_sections.get(public_key)
+        if section is None:
+            return False
+
+        nl = self.newline
+        lines = section.text.splitlines(keepends=True)
+        for i, line in enumerate(lines):
+            if line.strip().startswith('#') and NAME_RE.search(line):
+                ending = line[len(line.rstrip('\r\n')):] or nl
+                indent = line[:len(line) - len(line.lstrip())]
+                lines[i] = f"{indent}# Name: {new_name}{ending}"
+                break
+        else:
+            if not lines[0].endswith(('\n', '\r')):
+                lines[0] += nl
+            lines.insert(1, f"# Name: {new_name}{nl}")
+
+        section.text = ''.join(lines)
+        self.model.rename_peer(section.record, new_name)
+        return True
+
+
+def atomic_write(path, content, backup=True):
+    """ Write content to path via a temp file + rename, keeping the old file as .bak if backup """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".conf", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', newline='') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+
+        if backup and os.path.exists(path):
+            # A hard link keeps the previous version without copying it
+            bak_path = path + ".bak"
+            link_tmp = bak_path + ".tmp"
+            try:
+                if os.path.exists(link_tmp):
+                    os.remove(link_tmp)
+                os.link(path, link_tmp)
+                os.replace(link_tmp, bak_path)
+            except OSError:
+                shutil.copy2(path, bak_path)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class FileLock:
+    """ Exclusive lock on a file, across processes (the GUI and wg_cli share AppData) """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+b")
+        if os.name == "nt":
+            import msvcrt
+
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 s
+                    pass
+        else:
+            import fcntl
+
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if os.name == "nt":
+            import msvcrt
+
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+def record_history(history, document, message):
+    # The config is already committed; a history that can't be written must not fail the edit
+    try:
+        history.record_sections([section.text for section in document.sections], message)
+    except (OSError, ValueError) as e:
+        print(f"Could not record config history: {e}")
+
+
+class ConfigCache:
+    """ Holds the parsed config, re-parsing only when the file's stat changes """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._path = None
+        self._stamp = None
+        self._document = None
+        self._recorded = None
+
+    @staticmethod
+    def _stat_stamp(path):
+        try:
+            st = os.stat(path)
+        except (OSError, TypeError, ValueError):
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def get_document(self, path):
+        stamp = self._stat_stamp(path)
+        with self._lock:
+            if self._document is not None and path == self._path and stamp == self._stamp:
+                return self._document
+
+            if stamp is None:
+                document = ConfigDocument()
+            else:
+                with open(path, 'r', newline='') as f:
+                    document = ConfigDocument.parse(f.read())
+
+            self._path = path
+            self._stamp = stamp
+            self._document = document
+            return document
+
+    def get(self, path):
+        return self.get_document(path).model
+
+    def edit(self, path, operation, history=None, message=""):
+        """
+        Apply operation(document) and commit the result atomically. With a
+        wg_history.ConfigHistory the file is recorded before (if it changed
+        since the last revision) and after the edit, instead of a .bak copy.
+        """
+        with self._lock:
+            document = self.get_document(path)
+            # A document this cache hasn't recorded was (re)read from disk: keep that state first
+            if history is not None and self._stamp is not None and document is not self._recorded:
+                record_history(history, document, "external edit" if history.latest() else "initial")
+            try:
+                result = operation(document)
+                if result is False:
+                    return result
+                atomic_write(path, document.text(), backup=history is None)
+            except BaseException:
+                # The in-memory document may be half-edited, drop it
+                self.invalidate()
+                raise
+            self._stamp = self._stat_stamp(path)
+            if history is not None:
+                record_history(history, document, message)
+                self._recorded = document
+            return result
+
+    def invalidate(self):
+        with self._lock:
+            self._document = None
+            self._stamp = None
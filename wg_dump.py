@@ -0,0 +1,137 @@
+from array import array
+
+# Parsing `wg show <iface> dump`.
+#
+# The output is fed to DumpParser in chunks as it arrives from the child
+# process, so the whole dump is never held as one string or one list of
+# lines. Peers go into a PeerTable: one list or array per column instead of
+# a dict per peer, which is what matters on a hub with tens of thousands of
+# peers polled every few seconds. The first line (the interface itself) is
+# kept as a DumpInterface.
+
+
+class DumpInterface:
+    __slots__ = ("private_key", "public_key", "listen_port", "fwmark")
+
+    def __init__(self, private_key, public_key, listen_port, fwmark):
+        self.private_key = private_key
+        self.public_key = public_key
+        self.listen_port = listen_port
+        self.fwmark = fwmark
+
+    def as_dict(self):
+        # Never hand the private key to callers that only want to display this
+        return {"public_key": self.public_key, "listen_port": self.listen_port, "fwmark": self.fwmark}
+
+
+class PeerTable:
+    """ Columnar peer list; row i of every column describes the same peer """
+
+    def __init__(self):
+        self.public_keys = []
+        self.preshared_keys = []
+        self.endpoints = []
+        self.allowed_ips = []
+        self.keepalives = []
+        self.handshakes = array('Q')
+        self.rx = array('Q')
+        self.tx = array('Q')
+        self._index = None
+        # One shared object for repeated values like "(none)", "off" and "25"
+        self._shared = {}
+
+    def __len__(self):
+        return len(self.public_keys)
+
+    def append(self, parts):
+        # Numbers first: a bad line raises ValueError before any column grows
+        handshake, rx, tx = int(parts[4]), int(parts[5]), int(parts[6])
+        if handshake < 0 or rx < 0 or tx < 0:
+            raise ValueError(f"Negative counter in peer line: {parts[4:7]}")
+        shared = self._shared.setdefault
+        self.public_keys.append(parts[0])
+        self.preshared_keys.append(shared(parts[1], parts[1]))
+        endpoint = parts[2]
+        self.endpoints.append(shared(endpoint, endpoint) if endpoint == "(none)" else endpoint)
+        self.allowed_ips.append(parts[3])
+        self.handshakes.append(handshake)
+        self.rx.append(rx)
+        self.tx.append(tx)
+        self.keepalives.append(shared(parts[7], parts[7]))
+        self._index = None
+
+    def index(self):
+        """ public key -> row, built on first use """
+        if self._index is None:
+            self._index = {key: i for i, key in enumerate(self.public_keys)}
+        return self._index
+
+    def row_of(self, public_key):
+        return self.index().get(public_key)
+
+    def counters(self):
+        # (public_key, rx, tx, handshake) for ThroughputEngine.record()
+        return zip(self.public_keys, self.rx, self.tx, self.handshakes)
+
+    def peer(self, i):
+        return {
+            "public_key": self.public_keys[i],
+            "preshared_key": self.preshared_keys[i],
+            "endpoint": self.endpoints[i],
+            "allowed_ips": self.allowed_ips[i],
+            "latest_handshake": self.handshakes[i],
+            "transfer_rx": self.rx[i],
+            "transfer_tx": self.tx[i],
+            "persistent_keepalive": self.keepalives[i],
+        }
+
+    def as_dicts(self):
+        return [self.peer(i) for i in range(len(self))]
+
+
+class DumpParser:
+    """ Incremental parser: feed(bytes) as many times as needed, then close() """
+
+    def __init__(self):
+        self.interface = None
+        self.peers = PeerTable()
+        # Peer lines left out because a number in them didn't parse
+        self.skipped = 0
+        self._pending = b""
+        self._first = True
+
+    def feed(self, chunk):
+        data = self._pending + chunk if self._pending else chunk
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._pending = data
+            return
+        self._pending = data[end + 1:]
+        for line in data[:end].decode('utf-8', errors='replace').split('\n'):
+            self._line(line)
+
+    def _line(self, line):
+        parts = line.rstrip('\r').split('\t')
+        if self._first:
+            self._first = False
+            if len(parts) == 4:
+                self.interface = DumpInterface(*parts)
+                return
+        if len(parts) >= 8:
+            try:
+                self.peers.append(parts)
+            except ValueError:
+                self.skipped += 1
+
+    def close(self):
+        if self._pending:
+            self._line(self._pending.decode('utf-8', errors='replace'))
+            self._pending = b""
+        return self.interface, self.peers
+
+
+def parse_dump(data):
+    """ (DumpInterface or None, PeerTable) from complete dump output (bytes or str) """
+    parser = DumpParser()
+    parser.feed(data.encode('utf-8') if isinstance(data, str) else data)
+    return parser.close()
@@ -0,0 +1,385 @@
+import os
+import threading
+import time
+
+import wg_keys
+from wg_config import ConfigDocument
+from wg_uapi import ZERO_KEY, to_hex, to_base64
+
+# In-memory stand-ins for wg, sc, systemctl and wg-quick, so WireGuardManager
+# can be exercised on a machine without WireGuard:
+#
+#   manager = WireGuardManager(runner=CommandRunner(backend=FakeBackend()))
+#
+# FakeWireGuard keeps the same state layout benchmarks/fake_wg.py stores in
+# its JSON file, and that script is a thin wrapper around it. FakeUapiServer
+# serves the same state over a UAPI socket (see wg_uapi).
+
+
+def new_interface():
+    return {"private_key": "(none)", "listen_port": "0", "fwmark": "off", "peers": {}}
+
+
+def new_peer():
+    return {"preshared_key": "(none)", "endpoint": "(none)", "allowed_ips": "(none)",
+            "latest_handshake": 0, "transfer_rx": 0, "transfer_tx": 0, "persistent_keepalive": "off"}
+
+
+def read_key_file(path):
+    with open(path) as f:
+        key = f.read().strip()
+    return key or "(none)"
+
+
+class FakeWireGuard:
+    """ Supported: genkey, pubkey, show <iface> dump, set, setconf, syncconf """
+
+    def __init__(self, state=None):
+        self.state = state if state is not None else {"interfaces": {}, "calls": []}
+        self.state.setdefault("interfaces", {})
+        self.state.setdefault("calls", [])
+
+    @property
+    def interfaces(self):
+        return self.state["interfaces"]
+
+    def dump(self, iface):
+        public_key = "(none)"
+        if iface["private_key"] != "(none)":
+            public_key = wg_keys.derive_public_key(iface["private_key"])
+        lines = ["\t".join([iface["private_key"], public_key, str(iface["listen_port"]), iface["fwmark"]])]
+        for key, p in iface["peers"].items():
+            lines.append("\t".join([key, p["preshared_key"], p["endpoint"], p["allowed_ips"],
+                                    str(p["latest_handshake"]), str(p["transfer_rx"]),
+                                    str(p["transfer_tx"]), p["persistent_keepalive"]]))
+        return "\n".join(lines) + "\n"
+
+    def apply_set(self, iface, args):
+        peer = None
+        touched = []
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg == "peer":
+                key = args[i + 1]
+                peer = iface["peers"].setdefault(key, new_peer())
+                peer["_key"] = key
+                touched.append(peer)
+                i += 2
+                continue
+            if arg == "remove":
+                iface["peers"].pop(peer.pop("_key"), None)
+                peer = None
+                i += 1
+                continue
+
+            value = args[i + 1]
+            if peer is None:
+                if arg == "listen-port":
+                    iface["listen_port"] = value
+                elif arg == "private-key":
+                    iface["private_key"] = read_key_file(value)
+                elif arg == "fwmark":
+                    iface["fwmark"] = value
+            elif arg == "allowed-ips":
+                peer["allowed_ips"] = value or "(none)"
+            elif arg == "persistent-keepalive":
+                peer["persistent_keepalive"] = "off" if value in ("0", "off") else value
+            elif arg == "endpoint":
+                peer["endpoint"] = value
+            elif arg == "preshared-key":
+                peer["preshared_key"] = read_key_file(value)
+            i += 2
+
+        for p in touched:
+            p.pop("_key", None)
+
+    def load_conf(self, iface, path, replace_interface):
+        with open(path, newline="") as f:
+            model = ConfigDocument.parse(f.read()).model
+        if replace_interface or model.interface.get("PrivateKey"):
+            iface["private_key"] = model.interface.get("PrivateKey", "(none)")
+            iface["listen_port"] = model.interface.get("ListenPort", iface["listen_port"])
+        peers = {}
+        for peer in model.peers:
+            current = iface["peers"].get(peer.public_key, new_peer())
+            current["allowed_ips"] = ", ".join(peer.allowed_ips.replace(" ", "").split(",")) or "(none)"
+            current["preshared_key"] = peer.values.get("PresharedKey", "(none)")
+            current["endpoint"] = peer.values.get("Endpoint", current["endpoint"])
+            keepalive = peer.values.get("PersistentKeepalive", "off")
+            current["persistent_keepalive"] = "off" if keepalive in ("0", "off") else keepalive
+            peers[peer.public_key] = current
+        iface["peers"] = peers
+
+    def uapi_get(self, iface):
+        """ Answer to a UAPI get=1 for the same state as dump() """
+        lines = []
+        if iface["private_key"] != "(none)":
+            lines.append(f"private_key={to_hex(iface['private_key'])}")
+        lines.append(f"listen_port={iface['listen_port']}")
+        if iface["fwmark"] not in ("off", "0"):
+            lines.append(f"fwmark={iface['fwmark']}")
+        for key, p in iface["peers"].items():
+            lines.append(f"public_key={to_hex(key)}")
+            lines.append(f"preshared_key={ZERO_KEY if p['preshared_key'] == '(none)' else to_hex(p['preshared_key'])}")
+            lines.append("protocol_version=1")
+            if p["endpoint"] != "(none)":
+                lines.append(f"endpoint={p['endpoint']}")
+            lines.append(f"last_handshake_time_sec={p['latest_handshake']}")
+            lines.append("last_handshake_time_nsec=0")
+            lines.append(f"tx_bytes={p['transfer_tx']}")
+            lines.append(f"rx_bytes={p['transfer_rx']}")
+            keepalive = p["persistent_keepalive"]
+            lines.append(f"persistent_keepalive_interval={0 if keepalive == 'off' else keepalive}")
+            for ip in p["allowed_ips"].split(","):
+                if ip.strip() and ip.strip() != "(none)":
+                    lines.append(f"allowed_ip={ip.strip()}")
+        lines.append("errno=0")
+        return "\n".join(lines) + "\n\n"
+
+    def uapi_set(self, name, lines):
+        """ Apply the key=value lines of a UAPI set=1; returns the errno """
+        iface = self.interfaces.get(name)
+        if iface is None:
+            return -19
+        peer = None
+        for line in lines:
+            key, _, value = line.partition("=")
+            if key == "public_key":
+                public_key = to_base64(value)
+                peer = iface["peers"].setdefault(public_key, new_peer())
+            elif peer is None:
+                if key == "private_key":
+                    iface["private_key"] = "(none)" if value == ZERO_KEY else to_base64(value)
+                elif key == "listen_port":
+                    iface["listen_port"] = value
+                elif key == "fwmark":
+                    iface["fwmark"] = "off" if value == "0" else value
+                elif key == "replace_peers":
+                    iface["peers"].clear()
+                else:
+                    return -22
+            elif key == "remove":
+                iface["peers"].pop(public_key, None)
+                # Anything else for this peer is ignored
+                peer = new_peer()
+            elif key == "replace_allowed_ips":
+                peer["allowed_ips"] = "(none)"
+            elif key == "allowed_ip":
+                peer["allowed_ips"] = value if peer["allowed_ips"] == "(none)" else f"{peer['allowed_ips']},{value}"
+            elif key == "persistent_keepalive_interval":
+                peer["persistent_keepalive"] = "off" if value == "0" else value
+            elif key == "endpoint":
+                peer["endpoint"] = value
+            elif key == "preshared_key":
+                peer["preshared_key"] = "(none)" if value == ZERO_KEY else to_base64(value)
+            elif key not in ("protocol_version", "update_only"):
+                return -22
+        return 0
+
+    def handle(self, argv, stdin=""):
+        """ Run one `wg` invocation: (returncode, stdout, stderr) """
+        if argv[:1] == ["genkey"]:
+            return 0, wg_keys.generate_private_key() + "\n", ""
+        if argv[:1] == ["pubkey"]:
+            try:
+                return 0, wg_keys.derive_public_key(stdin) + "\n", ""
+            except ValueError:
+                return 1, "", "Error: unable to read private key from stdin\n"
+
+        self.state["calls"].append(list(argv))
+        interfaces = self.interfaces
+        if argv[:1] == ["show"] and len(argv) == 3 and argv[2] == "dump":
+            if argv[1] not in interfaces:
+                return 1, "", f"Unable to access interface: {argv[1]}\n"
+            return 0, self.dump(interfaces[argv[1]]), ""
+        if argv[:1] == ["show"] and len(argv) == 2:
+            if argv[1] not in interfaces:
+                return 1, "", f"Unable to access interface: {argv[1]}\n"
+            return 0, f"interface: {argv[1]}\n", ""
+        if argv[:1] == ["set"] and len(argv) >= 2:
+            self.apply_set(interfaces.setdefault(argv[1], new_interface()), argv[2:])
+            return 0, "", ""
+        if argv[:1] in (["setconf"], ["syncconf"]) and len(argv) == 3:
+            self.load_conf(interfaces.setdefault(argv[1], new_interface()), argv[2], argv[0] == "setconf")
+            return 0, "", ""
+        return 1, "", "Usage: wg <cmd> [<args>]\n"
+
+
+class FakeServices:
+    """ sc, systemctl and wg-quick; a service is running while its wg interface exists """
+
+    def __init__(self, wg, installed=("wg0",), configs=None):
+        self.wg = wg
+        self.installed = set(installed)
+        # interface -> .conf path loaded on start, like the real services do
+        self.configs = configs or {}
+
+    def interface_for(self, service):
+        for prefix, suffix in (("WireGuardTunnel$", ""), ("wg-quick@", ".service")):
+            if service.startswith(prefix) and service.endswith(suffix):
+                return service[len(prefix):len(service) - len(suffix)]
+        return service
+
+    def _up(self, interface):
+        iface = self.wg.interfaces.setdefault(interface, new_interface())
+        if self.configs.get(interface):
+            self.wg.load_conf(iface, self.configs[interface], True)
+
+    def _down(self, interface):
+        self.wg.interfaces.pop(interface, None)
+
+    def sc(self, argv):
+        if len(argv) != 2:
+            return 1, "", "usage: sc <query|start|stop> <service>\n"
+        action, interface = argv[0], self.interface_for(argv[1])
+        if interface not in self.installed:
+            return 1060, "", "The specified service does not exist as an installed service.\n"
+        if action == "start":
+            self._up(interface)
+        elif action == "stop":
+            self._down(interface)
+        elif action != "query":
+            return 1, "", f"unknown action {action}\n"
+        state = "4  RUNNING" if interface in self.wg.interfaces else "1  STOPPED"
+        return 0, f"SERVICE_NAME: {argv[1]}\n        STATE              : {state}\n", ""
+
+    def systemctl(self, argv):
+        if len(argv) != 2:
+            return 1, "", "usage: systemctl <is-active|start|stop> <unit>\n"
+        action, interface = argv[0], self.interface_for(argv[1])
+        if interface not in self.installed:
+            return (3, "unknown\n", "") if action == "is-active" else (5, "", f"Unit {argv[1]} not found.\n")
+        if action == "is-active":
+            running = interface in self.wg.interfaces
+            return (0, "active\n", "") if running else (3, "inactive\n", "")
+        if action == "start":
+            self._up(interface)
+        elif action == "stop":
+            self._down(interface)
+        else:
+            return 1, "", f"unknown action {action}\n"
+        return 0, "", ""
+
+    def wg_quick(self, argv):
+        if len(argv) != 2 or argv[0] not in ("up", "down"):
+            return 1, "", "usage: wg-quick <up|down> <interface>\n"
+        (self._up if argv[0] == "up" else self._down)(argv[1])
+        return 0, "", ""
+
+
+class FakeBackend:
+    """
+    CommandRunner backend dispatching on the program name. Every call is
+    recorded in `calls`; a `delay` longer than the timeout behaves like a
+    hung process.
+    """
+
+    def __init__(self, wg=None, installed=("wg0",), configs=None, delay=0.0):
+        self.wg = wg or FakeWireGuard()
+        self.services = FakeServices(self.wg, installed, configs)
+        self.delay = delay
+        self.calls = []
+        self.handlers = {
+            "wg": lambda argv, stdin: self.wg.handle(argv, stdin),
+            "sc": lambda argv, stdin: self.services.sc(argv),
+            "systemctl": lambda argv, stdin: self.services.systemctl(argv),
+            "wg-quick": lambda argv, stdin: self.services.wg_quick(argv),
+        }
+
+    def __call__(self, args, input=None, timeout=None):
+        self.calls.append(list(args))
+        if self.delay:
+            if timeout is not None and self.delay > timeout:
+                time.sleep(timeout)
+                raise TimeoutError(f"{args[0]} did not finish within {timeout:g}s")
+            time.sleep(self.delay)
+        program = os.path.basename(args[0]).lower()
+        if program.endswith(".exe"):
+            program = program[:-4]
+        handler = self.handlers.get(program)
+        if handler is None:
+            raise FileNotFoundError(f"No such fake program: {args[0]}")
+        returncode, stdout, stderr = handler(args[1:], (input or b"").decode())
+        return returncode, stdout.encode(), stderr.encode()
+
+
+class FakeUapiServer:
+    """
+    Stand-in UAPI socket for one interface of a FakeWireGuard, served from a
+    background thread. Needs Unix domain sockets.
+
+        server = FakeUapiServer(fake.wg, "wg0", path).start()
+        manager.settings["uapi_path"] = path
+    """
+
+    def __init__(self, wg, interface, path, answer=None):
+        self.wg = wg
+        self.interface = interface
+        self.path = path
+        # Bytes served for every get=1 instead of the state, for benchmarks (like FAKE_WG_DUMP)
+        self.answer = answer
+        self.requests = 0
+        self.connections = 0
+        self._server = None
+        self._sockets = []
+
+    def start(self):
+        import socketserver
+
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                fake.connections += 1
+                fake._sockets.append(self.connection)
+                while True:
+                    op = self.rfile.readline()
+                    if not op:
+                        return
+                    lines = []
+                    while True:
+                        line = self.rfile.readline()
+                        if not line.strip():
+                            break
+                        lines.append(line.decode().rstrip("\n"))
+                    try:
+                        self.wfile.write(fake.handle(op.decode().strip(), lines))
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client gave up on the answer and closed its end
+                        return
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-uapi", daemon=True).start()
+        return self
+
+    def handle(self, op, lines):
+        self.requests += 1
+        if op == "get=1":
+            if self.answer is not None:
+                return self.answer
+            iface = self.wg.interfaces.get(self.interface)
+            return (self.wg.uapi_get(iface) if iface is not None else "errno=-19\n\n").encode()
+        if op == "set=1":
+            return f"errno={self.wg.uapi_set(self.interface, lines)}\n\n".encode()
+        return b"errno=-22\n\n"
+
+    def close(self):
+        """ Stop listening and drop every open connection, like a tunnel going down """
+        import socket
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for sock in self._sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._sockets = []
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -0,0 +1,370 @@
+import asyncio
+import hmac
+import json
+import os
+import secrets
+import time
+from collections import OrderedDict
+
+# Core of the Gatekeeper API (docs/TECHNICAL_SPECIFICATION.md), kept free of
+# FastAPI so it can be driven directly by benchmarks; gatekeeper.py puts the
+# HTTP endpoints on top.
+#
+# Everything here runs on the event loop thread: the stores are plain dicts
+# without locks, and the only blocking work (`wg set` through the session
+# scheduler) is pushed to a worker thread.
+#
+# - Whitelist: whitelist.json as a dict keyed by normalized email, reloaded
+#   when the file's stat changes (checked at most once per CHECK_INTERVAL).
+# - OtpStore: pending codes with a fixed TTL. Entries are kept in insertion
+#   order, which is also expiry order, so expired ones are evicted from the
+#   front as new codes are issued and the size is capped at max_entries.
+# - RateLimiter: a token bucket per email and per client IP, evicting the
+#   least recently used buckets beyond max_keys.
+# - Mail goes through a MailSender: StubMailSender prints it, GraphMailSender
+#   sends it through Microsoft Graph (needs msal and httpx).
+
+OTP_TTL = 300
+OTP_DIGITS = 6
+OTP_MAX_ATTEMPTS = 5
+OTP_MAX_PENDING = 100000
+CHECK_INTERVAL = 1.0
+# (tokens per second, burst)
+EMAIL_RATE = (5 / 900, 5)
+IP_RATE = (1.0, 30)
+MAX_BUCKETS = 100000
+MAX_EMAIL_LENGTH = 254
+
+
+class GatekeeperError(Exception):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def normalize_email(email):
+    return (email or "").strip().casefold()
+
+
+class WhitelistEntry:
+    __slots__ = ("email", "public_key", "address")
+
+    def __init__(self, email, public_key="", address=""):
+        self.email = email
+        self.public_key = public_key
+        self.address = address
+
+
+class Whitelist:
+    """
+    whitelist.json is either a list of emails / {"email", "public_key",
+    "address"} objects, or an object mapping email -> {"public_key", "address"}.
+    Emails without a peer can ask for codes but have nothing to switch on.
+    """
+
+    def __init__(self, path, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._entries = {}
+        self._stamp = None
+        self._checked_at = None
+
+    def __len__(self):
+        self._refresh()
+        return len(self._entries)
+
+    def get(self, email):
+        self._refresh()
+        return self._entries.get(normalize_email(email))
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            stamp = None
+        if stamp == self._stamp:
+            return
+        try:
+            self._entries = self.load(self.path) if stamp is not None else {}
+            self._stamp = stamp
+        except (OSError, ValueError) as e:
+            # Keep serving the last good list while the file is being edited
+            print(f"Whitelist error: {e}")
+
+    @staticmethod
+    def load(path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            items = [dict(value or {}, email=email) for email, value in data.items()]
+        elif isinstance(data, list):
+            items = [{"email": item} if isinstance(item, str) else item for item in data]
+        else:
+            raise ValueError("whitelist must be a list or an object")
+        entries = {}
+        for item in items:
+            email = normalize_email(item.get("email"))
+            if email:
+                entries[email] = WhitelistEntry(email, item.get("public_key", ""), item.get("address", ""))
+        return entries
+
+
+class _Pending:
+    __slots__ = ("code", "expires_at", "attempts")
+
+    def __init__(self, code, expires_at):
+        self.code = code
+        self.expires_at = expires_at
+        self.attempts = 0
+
+
+class OtpStore:
+    def __init__(self, ttl=OTP_TTL, max_entries=OTP_MAX_PENDING, max_attempts=OTP_MAX_ATTEMPTS, digits=OTP_DIGITS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_attempts = max_attempts
+        self.digits = digits
+        # email -> _Pending, oldest first
+        self._pending = OrderedDict()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def issue(self, email, now=None):
+        """ New code for email, replacing any pending one """
+        now = time.monotonic() if now is None else now
+        self._evict(now)
+        code = f"{secrets.randbelow(10 ** self.digits):0{self.digits}d}"
+        self._pending.pop(email, None)
+        self._pending[email] = _Pending(code, now + self.ttl)
+        while len(self._pending) > self.max_entries:
+            self._pending.popitem(last=False)
+        return code
+
+    def verify(self, email, code, now=None):
+        """ True once for the right code; the code is dropped after max_attempts misses """
+        now = time.monotonic() if now is None else now
+        pending = self._pending.get(email)
+        if pending is None:
+            return False
+        if pending.expires_at <= now:
+            del self._pending[email]
+            return False
+        if hmac.compare_digest(pending.code, code):
+            del self._pending[email]
+            return True
+        pending.attempts += 1
+        if pending.attempts >= self.max_attempts:
+            del self._pending[email]
+        return False
+
+    def _evict(self, now):
+        pending = self._pending
+        while pending:
+            email, first = next(iter(pending.items()))
+            if first.expires_at > now:
+                break
+            del pending[email]
+
+
+class RateLimiter:
+    """ Token bucket per key: `rate` tokens per second, holding at most `burst` """
+
+    def __init__(self, rate, burst, max_keys=MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> [tokens, last refill], least recently used first
+        self._buckets = OrderedDict()
+
+    def acquire(self, key, now=None):
+        """ Take a token; returns 0 if allowed, else the seconds until one is available """
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        return (1 - bucket[0]) / self.rate
+
+
+class MailSender:
+    async def send(self, to, subject, body):
+        raise NotImplementedError
+
+
+class StubMailSender(MailSender):
+    """ Prints mail instead of sending it; the last messages are kept in `outbox` """
+
+    def __init__(self, quiet=False, keep=100):
+        self.quiet = quiet
+        self.keep = keep
+        self.outbox = []
+
+    async def send(self, to, subject, body):
+        self.outbox.append((to, subject, body))
+        del self.outbox[:-self.keep]
+        if not self.quiet:
+            print(f"Mail to {to}: {subject}\n{body}")
+
+
+class GraphMailSender(MailSender):
+    """ Sends as `sender` (a mailbox in the tenant) with the Mail.Send application permission """
+
+    GRAPH_URL = "https://graph.microsoft.com/v1.0/users/{}/sendMail"
+
+    def __init__(self, tenant_id, client_id, client_secret, sender):
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.sender = sender
+        self._app = None
+        self._client = None
+
+    def _token(self):
+        import msal
+
+        if self._app is None:
+            self._app = msal.ConfidentialClientApplication(
+                self.client_id, authority=f"https://login.microsoftonline.com/{self.tenant_id}",
+                client_credential=self.client_secret)
+        # msal caches the token and only goes to the network when it expires
+        result = self._app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
+        if "access_token" not in result:
+            raise RuntimeError(result.get("error_description") or "could not get a Graph token")
+        return result["access_token"]
+
+    async def send(self, to, subject, body):
+        import httpx
+
+        token = await asyncio.to_thread(self._token)
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=15)
+        message = {"message": {"subject": subject, "body": {"contentType": "Text", "content": body},
+                               "toRecipients": [{"emailAddress": {"address": to}}]},
+                   "saveToSentItems": False}
+        response = await self._client.post(self.GRAPH_URL.format(self.sender), json=message,
+                                           headers={"Authorization": f"Bearer {token}"})
+        response.raise_for_status()
+
+
+def create_sender(settings):
+    name = settings.get("mail_sender", "stub")
+    if name == "graph":
+        return GraphMailSender(settings.get("graph_tenant_id"), settings.get("graph_client_id"),
+                               settings.get("graph_client_secret"), settings.get("graph_sender"))
+    if name == "stub":
+        return StubMailSender()
+    raise ValueError(f"Unknown mail sender: {name}")
+
+
+class Gatekeeper:
+    def __init__(self, manager, whitelist=None, otps=None, sender=None, email_limiter=None, ip_limiter=None):
+        settings = manager.settings
+        self.manager = manager
+        self.whitelist = whitelist or Whitelist(
+            settings.get("whitelist_path") or os.path.join(manager.app_data_dir, "whitelist.json"))
+        self.otps = otps or OtpStore(ttl=settings.get("otp_ttl_seconds", OTP_TTL))
+        self.sender = sender or create_sender(settings)
+        self.email_limiter = email_limiter or RateLimiter(*EMAIL_RATE)
+        self.ip_limiter = ip_limiter or RateLimiter(*IP_RATE)
+        self.sessions = manager.get_session_scheduler()
+        # Mail tasks in flight; asyncio only keeps weak references to tasks
+        self._deliveries = set()
+        # Verified users waiting for their peer to be switched on: (entry, email, future)
+        self._activations = []
+        self._activating = None
+
+    def _limit(self, email, client_ip):
+        for limiter, key in ((self.ip_limiter, client_ip), (self.email_limiter, email)):
+            wait = limiter.acquire(key)
+            if wait:
+                raise GatekeeperError(429, "Too many requests", retry_after=wait)
+
+    @staticmethod
+    def _email(email):
+        email = normalize_email(email)
+        if not email or len(email) > MAX_EMAIL_LENGTH or "@" not in email:
+            raise GatekeeperError(422, "Invalid email address")
+        return email
+
+    async def request_otp(self, email, client_ip):
+        """
+        Mail a code if the email is whitelisted. The answer is the same either
+        way, so the API can't be used to probe the whitelist.
+        """
+        email = self._email(email)
+        self._limit(email, client_ip)
+        if self.whitelist.get(email) is not None:
+            code = self.otps.issue(email)
+            minutes = max(self.otps.ttl // 60, 1)
+            task = asyncio.ensure_future(self._deliver(
+                email, "Your VPN sign-in code",
+                f"Your WireGuard sign-in code is {code}.\nIt expires in {minutes} minute(s)."))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+        return {"status": "sent if the address is authorized"}
+
+    async def _deliver(self, email, subject, body):
+        try:
+            await self.sender.send(email, subject, body)
+        except Exception as e:
+            print(f"Mail delivery to {email} failed: {e}")
+
+    async def verify(self, email, code, client_ip):
+        """ Check the code and switch the user's peer on for a session """
+        email = self._email(email)
+        self._limit(email, client_ip)
+        code = (code or "").strip()
+        if not (code.isdigit() and len(code) == self.otps.digits) or not self.otps.verify(email, code):
+            raise GatekeeperError(401, "Invalid or expired code")
+        entry = self.whitelist.get(email)
+        if entry is None or not (entry.public_key and entry.address):
+            raise GatekeeperError(403, "No peer is assigned to this address")
+        session = await self._activate(entry, email)
+        if session is None:
+            raise GatekeeperError(503, "Could not activate the peer")
+        return {"address": session.address, "expires_at": int(session.expires_at)}
+
+    async def _activate(self, entry, email):
+        # Users verified while a `wg set` is running are switched on together
+        # by the next one, so a burst of logins doesn't spawn a wg per user
+        future = asyncio.get_running_loop().create_future()
+        self._activations.append((entry, email, future))
+        if self._activating is None or self._activating.done():
+            self._activating = asyncio.ensure_future(self._activate_pending())
+        return await future
+
+    async def _activate_pending(self):
+        while self._activations:
+            batch, self._activations = self._activations, []
+            try:
+                sessions = await asyncio.to_thread(self.sessions.activate_many,
+                                                   [(entry.public_key, entry.address, email)
+                                                    for entry, email, _ in batch])
+            except Exception as e:
+                print(f"Session activation error: {e}")
+                sessions = []
+            started = {session.public_key: session for session in sessions}
+            for entry, _, future in batch:
+                if not future.done():
+                    future.set_result(started.get(entry.public_key))
+
+    def start(self):
+        self.sessions.start()
+
+    def close(self):
+        self.sessions.close()
@@ -0,0 +1,350 @@
+import hashlib
+import mmap
+import os
+import re
+import threading
+import time
+import zlib
+
+from wg_config import FileLock
+
+# Version history of a wg0.conf, replacing the single .bak copy.
+#
+# A revision is stored as a tree of content-addressed objects. The leaves
+# are the [Interface]/[Peer] sections of the file, byte for byte; each tree
+# node lists the 16-byte digests of its children. Runs of children are cut
+# after any child whose digest ends in a byte that is 0 modulo FANOUT, so the
+# boundaries depend only on content: adding or removing a peer changes one
+# node per level, not every node after it. An edit to one peer of a 10k-peer
+# config stores that section plus one node of ~FANOUT digests per level
+# (four levels), about 1 KB, where the .bak scheme copied the whole file.
+#
+# On disk, in the history directory:
+#
+#   pack-<n>    objects, zlib-compressed where that helps, appended
+#   index-<n>   "<id> <offset> <length> <z|r>" per object, appended
+#   CURRENT     <n>, bumped when garbage collection rewrites pack and index
+#   revisions   "<number> <time> <root id> <size> <message>" per revision
+#   lock        held while reading or writing any of the above, since the
+#               GUI and wg_cli may use the same history at the same time
+#
+# Revisions beyond max_revisions or older than max_days are dropped (the
+# newest is always kept). Objects only they used stay in the pack until dead
+# bytes outweigh live ones, then pack and index are rewritten.
+
+FANOUT = 16
+DIGEST_SIZE = 16
+DEFAULT_MAX_REVISIONS = 1000
+DEFAULT_MAX_DAYS = 90
+# Never rewrite a pack smaller than this
+GC_MIN_BYTES = 1024 * 1024
+
+SECTION_START = re.compile(r'(?m)^(?=[ \t]*\[)')
+
+
+def digest(data):
+    return hashlib.sha256(data).digest()[:DIGEST_SIZE]
+
+
+def _children(node):
+    # Tree node: one byte of level (1 = children are sections), then digests
+    return node[0], [node[i:i + DIGEST_SIZE] for i in range(1, len(node), DIGEST_SIZE)]
+
+
+def split_sections(text):
+    return [part for part in SECTION_START.split(text) if part]
+
+
+class Revision:
+    __slots__ = ("id", "timestamp", "root", "size", "message")
+
+    def __init__(self, id, timestamp, root, size, message=""):
+        self.id = id
+        self.timestamp = timestamp
+        self.root = root
+        self.size = size
+        self.message = message
+
+    def line(self):
+        return f"{self.id} {int(self.timestamp)} {self.root} {self.size} {self.message}\n"
+
+    def as_dict(self):
+        return {"id": self.id, "timestamp": int(self.timestamp), "size": self.size, "message": self.message}
+
+
+class ConfigHistory:
+    def __init__(self, directory, max_revisions=DEFAULT_MAX_REVISIONS, max_days=DEFAULT_MAX_DAYS):
+        self.directory = directory
+        self.max_revisions = max_revisions
+        self.max_days = max_days
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(os.path.join(directory, "lock"))
+        # _stamp() of the files as last read or written, None before the first _load()
+        self._loaded = None
+        self._generation = 0
+        # hash -> (offset, length, compressed)
+        self._index = {}
+        self._pack_size = 0
+        # Pack size at the last garbage check, see _prune
+        self._checked_size = 0
+        self._revisions = []
+        # section text -> hash for the latest revision, so unchanged sections aren't hashed again
+        self._section_hashes = {}
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _stamp(self):
+        stamp = []
+        for name in ("revisions", "CURRENT"):
+            try:
+                st = os.stat(self._path(name))
+                stamp.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _load(self):
+        # Reloaded when another process (the CLI next to the GUI) wrote to the history
+        stamp = self._stamp()
+        if self._loaded == stamp:
+            return
+        try:
+            with open(self._path("CURRENT")) as f:
+                self._generation = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            self._generation = 0
+        pack_path = self._path(f"pack-{self._generation}")
+        self._pack_size = os.path.getsize(pack_path) if os.path.exists(pack_path) else 0
+
+        index = {}
+        try:
+            with open(self._path(f"index-{self._generation}")) as f:
+                for line in f:
+                    parts = line.split()
+                    # Entries past the end of the pack come from an interrupted write
+                    if len(parts) == 4 and line.endswith("\n"):
+                        offset, length = int(parts[1]), int(parts[2])
+                        if offset + length <= self._pack_size:
+                            index[parts[0]] = (offset, length, parts[3] == "z")
+        except FileNotFoundError:
+            pass
+        self._index = index
+
+        revisions = []
+        try:
+            with open(self._path("revisions"), encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split(" ", 4)
+                    if len(parts) >= 4 and line.endswith("\n") and parts[2] in index:
+                        revisions.append(Revision(int(parts[0]), int(parts[1]), parts[2], int(parts[3]),
+                                                  parts[4] if len(parts) > 4 else ""))
+        except FileNotFoundError:
+            pass
+        self._revisions = revisions
+        self._section_hashes = {}
+        self._loaded = stamp
+
+    def revisions(self):
+        """ All kept revisions, newest first; only the small revisions file is read """
+        with self._lock, self._file_lock:
+            self._load()
+            return self._revisions[::-1]
+
+    def latest(self):
+        with self._lock, self._file_lock:
+            self._load()
+            return self._revisions[-1] if self._revisions else None
+
+    def record(self, text, message=""):
+        return self.record_sections(split_sections(text), message)
+
+    def record_sections(self, sections, message=""):
+        """
+        Store a revision made of these section texts (concatenated they are the
+        file). Returns the Revision, or None if it equals the latest one.
+        """
+        with self._lock, self._file_lock:
+            self._load()
+            new = {}
+
+            def put(data):
+                key = digest(data)
+                name = key.hex()
+                if name not in self._index and name not in new:
+                    new[name] = data
+                return key
+
+            known = self._section_hashes
+            hashes = {}
+            keys = []
+            for text in sections:
+                key = known.get(text)
+                if key is None:
+                    key = hashes.get(text) or put(text.encode("utf-8"))
+                hashes[text] = key
+                keys.append(key)
+
+            level = 1
+            while True:
+                nodes = []
+                current = []
+                for key in keys:
+                    current.append(key)
+                    # At least two children per node, so every level is at most half the one below
+                    if key[-1] % FANOUT == 0 and len(current) > 1:
+                        nodes.append(put(bytes([level]) + b"".join(current)))
+                        current = []
+                if current or not nodes:
+                    nodes.append(put(bytes([level]) + b"".join(current)))
+                if len(nodes) == 1:
+                    root = nodes[0].hex()
+                    break
+                keys = nodes
+                level += 1
+
+            latest = self._revisions[-1] if self._revisions else None
+            if latest is not None and latest.root == root:
+                self._section_hashes = hashes
+                return None
+
+            self._write_objects(new)
+            revision = Revision(latest.id + 1 if latest else 1, time.time(), root,
+                                len("".join(sections).encode("utf-8")), " ".join(message.split()))
+            with open(self._path("revisions"), "a", encoding="utf-8", newline="\n") as f:
+                f.write(revision.line())
+            self._revisions.append(revision)
+            self._section_hashes = hashes
+            self._prune()
+            self._loaded = self._stamp()
+            return revision
+
+    def _write_objects(self, objects):
+        if not objects:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        lines = []
+        with open(self._path(f"pack-{self._generation}"), "ab") as pack:
+            offset = pack.seek(0, os.SEEK_END)
+            for h, data in objects.items():
+                packed = zlib.compress(data)
+                compressed = len(packed) < len(data)
+                if not compressed:
+                    packed = data
+                pack.write(packed)
+                self._index[h] = (offset, len(packed), compressed)
+                lines.append(f"{h} {offset} {len(packed)} {'z' if compressed else 'r'}\n")
+                offset += len(packed)
+            pack.flush()
+            os.fsync(pack.fileno())
+        self._pack_size = offset
+        with open(self._path(f"index-{self._generation}"), "a", newline="\n") as f:
+            f.write("".join(lines))
+
+    def _reader(self):
+        # The whole pack is mapped; objects are slices of it
+        with open(self._path(f"pack-{self._generation}"), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _get(self, pack, name):
+        offset, length, compressed = self._index[name]
+        data = pack[offset:offset + length]
+        return zlib.decompress(data) if compressed else data
+
+    def _walk(self, pack, root, seen=None):
+        """ Section digests of the tree under root, in order; nodes in seen are skipped """
+        sections = []
+        stack = [bytes.fromhex(root)]
+        while stack:
+            name = stack.pop().hex()
+            if seen is not None:
+                if name in seen:
+                    continue
+                seen.add(name)
+            level, children = _children(self._get(pack, name))
+            if level == 1:
+                sections.extend(children)
+            else:
+                stack.extend(reversed(children))
+        return sections
+
+    def read(self, revision_id):
+        """ Text of a kept revision; KeyError if there is no such revision """
+        with self._lock, self._file_lock:
+            self._load()
+            revision = next((r for r in self._revisions if r.id == revision_id), None)
+            if revision is None:
+                raise KeyError(f"No revision {revision_id}")
+            with self._reader() as pack:
+                return b"".join(self._get(pack, key.hex()) for key in self._walk(pack, revision.root)).decode("utf-8")
+
+    def _prune(self):
+        cutoff = time.time() - self.max_days * 86400 if self.max_days else None
+        keep = self._revisions[-self.max_revisions:] if self.max_revisions else list(self._revisions)
+        if cutoff is not None:
+            keep = [r for r in keep[:-1] if r.timestamp >= cutoff] + keep[-1:]
+        if len(keep) == len(self._revisions):
+            return
+        from wg_config import atomic_write
+
+        atomic_write(self._path("revisions"), "".join(r.line() for r in keep), backup=False)
+        self._revisions = keep
+        # Dead objects only pile up as the pack grows, so look for them every 1/8 of growth
+        if self._pack_size >= self._checked_size + max(self._checked_size // 8, 64 * 1024):
+            self._checked_size = self._pack_size
+            self._collect_garbage()
+
+    def _live_objects(self):
+        live = set()
+        with self._reader() as pack:
+            for revision in self._revisions:
+                live.update(key.hex() for key in self._walk(pack, revision.root, live))
+        return live
+
+    def _collect_garbage(self, force=False):
+        live = self._live_objects()
+        live_bytes = sum(self._index[h][1] for h in live)
+        if not force and self._pack_size - live_bytes <= max(live_bytes, GC_MIN_BYTES):
+            return
+        from wg_config import atomic_write
+
+        generation = self._generation + 1
+        index = {}
+        lines = []
+        offset = 0
+        with self._reader() as old, open(self._path(f"pack-{generation}"), "wb") as pack:
+            for h in live:
+                start, length, compressed = self._index[h]
+                pack.write(old[start:start + length])
+                index[h] = (offset, length, compressed)
+                lines.append(f"{h} {offset} {length} {'z' if compressed else 'r'}\n")
+                offset += length
+            pack.flush()
+            os.fsync(pack.fileno())
+        atomic_write(self._path(f"index-{generation}"), "".join(lines), backup=False)
+        # The switch to the new pack is this one rename
+        atomic_write(self._path("CURRENT"), f"{generation}\n", backup=False)
+        for name in (f"pack-{self._generation}", f"index-{self._generation}"):
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+        self._generation = generation
+        self._index = index
+        self._pack_size = self._checked_size = offset
+        # Cached digests may point at objects that were just dropped
+        self._section_hashes = {}
+
+    def compact(self):
+        """ Rewrite the pack with only the objects kept revisions use """
+        with self._lock, self._file_lock:
+            self._load()
+            if self._revisions:
+                self._collect_garbage(force=True)
+                self._loaded = self._stamp()
+
+    def stats(self):
+        with self._lock, self._file_lock:
+            self._load()
+            return {"revisions": len(self._revisions), "objects": len(self._index), "pack_bytes": self._pack_size}
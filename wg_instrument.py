@@ -0,0 +1,298 @@
+import _thread
+import os
+import time
+
+# Timing for everything that can stall the app: WireGuardManager methods,
+# external commands (recorded by wg_runner) and the Tk view renders.
+#
+# Each operation keeps count/total/max plus its last WINDOW durations, from
+# which the diagnostics view computes percentiles. Operations slower than the
+# threshold are written to a rotating log under the AppData directory, since
+# print() output is lost in the --noconsole build. Profiler wraps cProfile
+# for on-demand captures of the UI thread. STARTUP times the phases of app
+# startup and appends them to logs/startup.log, one line per launch.
+#
+# Importing this must stay cheap, it is loaded with wg_manager: no functools
+# or threading here, and logging, cProfile and pstats are only imported once
+# they are needed.
+
+WINDOW = 256
+DEFAULT_SLOW_MS = 250
+SLOW_LOG_BYTES = 1024 * 1024
+SLOW_LOG_BACKUPS = 3
+
+
+class OperationStats:
+    __slots__ = ("count", "total", "max", "samples", "_next")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+        self._next = 0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if len(self.samples) < WINDOW:
+            self.samples.append(seconds)
+        else:
+            self.samples[self._next] = seconds
+            self._next = (self._next + 1) % WINDOW
+
+    def summary(self):
+        ordered = sorted(self.samples)
+
+        def pct(p):
+            return round(ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)] * 1000, 2)
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 2),
+            "p50_ms": pct(50),
+            "p95_ms": pct(95),
+            "p99_ms": pct(99),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class _Timer:
+    __slots__ = ("recorder", "name", "start")
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.recorder.record(self.name, time.perf_counter() - self.start,
+                             None if exc_type is None else f"raised {exc_type.__name__}")
+        return False
+
+
+class Recorder:
+    def __init__(self, threshold_ms=DEFAULT_SLOW_MS):
+        self.threshold_ms = threshold_ms
+        self.enabled = True
+        self.log_path = None
+        self._logger = None
+        self._lock = _thread.allocate_lock()
+        self._ops = {}
+
+    def configure(self, log_dir=None, threshold_ms=None):
+        """ Set where slow operations are logged (a rotating slow.log) and the threshold """
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+        if log_dir:
+            path = os.path.join(log_dir, "slow.log")
+            if path != self.log_path:
+                self.log_path = path
+                self._logger = None
+
+    def timed(self, name):
+        return _Timer(self, name)
+
+    def record(self, name, seconds, detail=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._ops.get(name)
+            if stats is None:
+                stats = self._ops[name] = OperationStats()
+            stats.add(seconds)
+        if seconds * 1000 >= self.threshold_ms:
+            self._log_slow(name, seconds, detail)
+
+    def _log_slow(self, name, seconds, detail):
+        if self.log_path is None:
+            return
+        try:
+            if self._logger is None:
+                self._logger = self._open_log()
+            import threading
+
+            thread = threading.current_thread().name
+            self._logger.warning(f"{name} took {seconds * 1000:.0f} ms [{thread}]{' ' + detail if detail else ''}")
+        except OSError as e:
+            print(f"Slow log error: {e}")
+            self.log_path = None
+
+    def _open_log(self):
+        import logging
+        from logging.handlers import RotatingFileHandler
+
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        logger = logging.getLogger("wgmanager.slow")
+        logger.propagate = False
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        handler = RotatingFileHandler(self.log_path, maxBytes=SLOW_LOG_BYTES, backupCount=SLOW_LOG_BACKUPS,
+                                      encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+        return logger
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.summary() for name, stats in sorted(self._ops.items())}
+
+    def reset(self):
+        with self._lock:
+            self._ops.clear()
+
+
+class Profiler:
+    """ cProfile capture toggled from the diagnostics view; profiles the thread that starts it """
+
+    def __init__(self):
+        self._profile = None
+        self.started_at = None
+
+    @property
+    def active(self):
+        return self._profile is not None
+
+    def start(self):
+        import cProfile
+
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            self.started_at = time.time()
+            self._profile.enable()
+
+    def stop(self, directory, top=30):
+        """ Stop and save <directory>/profile-<time>.prof; returns (path, text summary) """
+        import io
+        import pstats
+
+        profile, self._profile = self._profile, None
+        if profile is None:
+            return None, ""
+        profile.disable()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime("profile-%Y%m%d-%H%M%S.prof"))
+        profile.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(top)
+        return path, out.getvalue()
+
+
+def process_age():
+    """ Seconds since this process was created, None where that can't be read """
+    try:
+        if os.name == "nt":
+            import ctypes
+            from ctypes import wintypes
+
+            kernel32 = ctypes.windll.kernel32
+            created, exited, kernel, user, now = (wintypes.FILETIME() for _ in range(5))
+            if not kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), ctypes.byref(created), ctypes.byref(exited),
+                                            ctypes.byref(kernel), ctypes.byref(user)):
+                return None
+            kernel32.GetSystemTimePreciseAsFileTime(ctypes.byref(now))
+
+            def ticks(ft):
+                return (ft.dwHighDateTime << 32) | ft.dwLowDateTime
+            # FILETIME is in 100 ns units
+            return (ticks(now) - ticks(created)) / 1e7
+        with open("/proc/self/stat") as f:
+            # Field 22, after the parenthesised command name
+            started = int(f.read().rpartition(")")[2].split()[19]) / os.sysconf("SC_CLK_TCK")
+        with open("/proc/uptime") as f:
+            return float(f.read().split()[0]) - started
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
+class StartupTrace:
+    """
+    Phases of app startup: begin() first thing in main.py, mark(phase) at the
+    end of each phase, finish() once the window shows real data. The time
+    before begin() (interpreter start, unpacking a --onefile build's
+    bundle where it happens in this process) is reported as "process start".
+    """
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.phases = []
+        self.finished = False
+        self._last = None
+
+    def begin(self):
+        self._last = time.perf_counter()
+        age = process_age()
+        if age is not None:
+            self.phases.append(("process start", age))
+            self.recorder.record("startup.process start", age)
+
+    def mark(self, phase):
+        if self._last is None or self.finished:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self.recorder.record(f"startup.{phase}", now - self._last)
+        self._last = now
+
+    def total(self):
+        return sum(seconds for _, seconds in self.phases)
+
+    def summary(self):
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases)
+        return f"startup {self.total() * 1000:.0f} ms: {phases}"
+
+    def finish(self, phase, log_dir=None):
+        """ Mark the last phase and append the summary to <log_dir>/startup.log """
+        if self._last is None or self.finished:
+            return
+        self.mark(phase)
+        self.finished = True
+        if log_dir:
+            try:
+                os.makedirs(log_dir, exist_ok=True)
+                with open(os.path.join(log_dir, "startup.log"), "a", encoding="utf-8") as f:
+                    f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {self.summary()}\n")
+            except OSError as e:
+                print(f"Startup log error: {e}")
+
+
+RECORDER = Recorder()
+PROFILER = Profiler()
+STARTUP = StartupTrace(RECORDER)
+
+
+def instrument(name):
+    """ Decorator recording every call of the function under `name` """
+    def decorate(func):
+        def wrapper(*args, **kwargs):
+            with RECORDER.timed(name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorate
+
+
+def instrument_methods(cls, prefix):
+    """ Wrap every public method defined on cls; properties are left alone """
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith('_') or not hasattr(value, '__code__'):
+            continue
+        setattr(cls, attr, instrument(f"{prefix}.{attr}")(value))
+    return cls
+
+
+def write_json(path, data):
+    import json
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
@@ -0,0 +1,129 @@
+import os
+import base64
+import binascii
+
+# In-process replacement for `wg genkey` / `wg pubkey`.
+# Uses the `cryptography` package when it is installed, otherwise falls back to
+# a pure Python Curve25519 implementation (RFC 7748). Both produce exactly the
+# same base64 output as wg.exe.
+
+# The cryptography import is deferred to the first key operation, it costs
+# tens of milliseconds and most callers never derive a key.
+_crypto = None
+
+KEY_LEN = 32
+
+_P = 2 ** 255 - 19
+_A24 = 121665
+_BASE_POINT_U = 9
+
+
+def _clamp(k):
+    # Same clamping `wg genkey` applies to the random bytes
+    k = bytearray(k)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    return bytes(k)
+
+
+def _x25519(scalar, u):
+    """ Montgomery ladder from RFC 7748, section 5 """
+    k = int.from_bytes(_clamp(scalar), "little")
+    x1 = u
+    x2, z2 = 1, 0
+    x3, z3 = u, 1
+    swap = 0
+    p = _P
+
+    for t in range(254, -1, -1):
+        k_t = (k >> t) & 1
+        swap ^= k_t
+        if swap:
+            x2, x3 = x3, x2
+            z2, z3 = z3, z2
+        swap = k_t
+
+        a = (x2 + z2) % p
+        aa = (a * a) % p
+        b = (x2 - z2) % p
+        bb = (b * b) % p
+        e = (aa - bb) % p
+        c = (x3 + z3) % p
+        d = (x3 - z3) % p
+        da = (d * a) % p
+        cb = (c * b) % p
+        x3 = (da + cb) % p
+        x3 = (x3 * x3) % p
+        z3 = (da - cb) % p
+        z3 = (x1 * z3 * z3) % p
+        x2 = (aa * bb) % p
+        z2 = (e * (aa + _A24 * e)) % p
+
+    if swap:
+        x2, x3 = x3, x2
+        z2, z3 = z3, z2
+
+    return (x2 * pow(z2, p - 2, p)) % p
+
+
+def decode_key(key_b64):
+    """ Decode a base64 WireGuard key, raising ValueError if it is malformed """
+    try:
+        raw = base64.b64decode(key_b64.strip(), validate=True)
+    except (binascii.Error, AttributeError) as e:
+        raise ValueError(f"Invalid key encoding: {e}")
+    if len(raw) != KEY_LEN:
+        raise ValueError(f"Invalid key length: {len(raw)} bytes")
+    return raw
+
+
+def encode_key(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _load_crypto():
+    global _crypto
+    if _crypto is None:
+        try:
+            from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+            from cryptography.hazmat.primitives import serialization
+            _crypto = (X25519PrivateKey, serialization)
+        except ImportError:
+            _crypto = False
+    return _crypto
+
+
+def public_from_private_bytes(priv_raw):
+    crypto = _load_crypto()
+    if crypto:
+        X25519PrivateKey, serialization = crypto
+        pub = X25519PrivateKey.from_private_bytes(priv_raw).public_key()
+        return pub.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return _x25519(priv_raw, _BASE_POINT_U).to_bytes(KEY_LEN, "little")
+
+
+def generate_private_key():
+    """ Equivalent of `wg genkey` """
+    return encode_key(_clamp(os.urandom(KEY_LEN)))
+
+
+def derive_public_key(private_key_b64):
+    """ Equivalent of `echo <key> | wg pubkey` """
+    return encode_key(public_from_private_bytes(decode_key(private_key_b64)))
+
+
+def generate_keypair():
+    priv_raw = _clamp(os.urandom(KEY_LEN))
+    return encode_key(priv_raw), encode_key(public_from_private_bytes(priv_raw))
+
+
+def generate_keypairs(count):
+    """ Return a list of `count` (private_key, public_key) tuples """
+    # One urandom call for the whole batch instead of one per key
+    entropy = os.urandom(KEY_LEN * count)
+    pairs = []
+    for i in range(count):
+        priv_raw = _clamp(entropy[i * KEY_LEN:(i + 1) * KEY_LEN])
+        pairs.append((encode_key(priv_raw), encode_key(public_from_private_bytes(priv_raw))))
+    return pairs
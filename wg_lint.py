@@ -0,0 +1,152 @@
+import re
+
+from wg_prefix import parse_network, format_network, WIDTH
+
+# Whole-config checks, for `wg_cli.py lint` and before applying:
+#
+#   duplicate-public-key  two [Peer] sections with the same PublicKey
+#   invalid-key           PublicKey/PresharedKey/PrivateKey that isn't 32 bytes of base64
+#   duplicate-setting     a key given twice in one section (only the last one is read)
+#   invalid-address       an AllowedIPs entry that doesn't parse
+#   overlap               AllowedIPs of two peers overlap
+#   interface-address     a peer's AllowedIPs cover the interface's own address
+#
+# Overlaps are found with one sort and one sweep over all AllowedIPs ranges,
+# not by testing pairs, so a 100k-peer config is checked in well under a
+# second. Keys are checked with a regex for the exact shape of a 32-byte
+# base64 value instead of decoding them.
+
+KEY_RE = re.compile(r'[A-Za-z0-9+/]{42}[AEIMQUYcgkosw480]=')
+SETTING_RE = re.compile(r'(?m)^[ \t]*([A-Za-z]+)[ \t]*=')
+PEER_KEYS = ("PublicKey", "PresharedKey")
+KEYS = PEER_KEYS + ("PrivateKey",)
+
+
+class LintIssue:
+    __slots__ = ("level", "code", "message", "peers")
+
+    def __init__(self, level, code, message, peers=()):
+        self.level = level
+        self.code = code
+        self.message = message
+        # Display names of the peers involved
+        self.peers = list(peers)
+
+    def __str__(self):
+        return f"{self.level}: {self.message}"
+
+    def as_dict(self):
+        return {"level": self.level, "code": self.code, "message": self.message, "peers": self.peers}
+
+
+def _duplicate_settings(text, values):
+    # Each setting line has one "=" and keys may end in "=" padding. With no
+    # more "=" than that in the text, no line was dropped as a duplicate
+    expected = len(values)
+    for key in KEYS:
+        expected += values.get(key, '').count('=')
+    if text.count('=') <= expected:
+        return []
+    keys = SETTING_RE.findall(text)
+    seen = set()
+    return sorted({key for key in keys if key in seen or seen.add(key)})
+
+
+def lint_document(document):
+    """ [LintIssue] for a wg_config.ConfigDocument, errors first """
+    issues = []
+    ranges = []
+    peers = []
+    valid_key = KEY_RE.fullmatch
+
+    for section in document.sections:
+        if section.kind == 'interface':
+            values = section.record
+            name = "[Interface]"
+            private_key = values.get('PrivateKey')
+            if private_key is not None and not valid_key(private_key):
+                issues.append(LintIssue("error", "invalid-key", f"{name}: PrivateKey is not a valid key"))
+            for entry in values.get('Address', '').split(','):
+                try:
+                    version, value, _ = parse_network(entry.split('/')[0])
+                except ValueError:
+                    continue
+                # The interface's own address, owner -1
+                ranges.append((version, value, -value, -1))
+            # Without the "# Name:" comment parse_section adds
+            values = {k: v for k, v in values.items() if k != 'name'}
+        elif section.kind == 'peer':
+            peer = section.record
+            values = peer.values
+            index = len(peers)
+            peers.append(peer)
+            name = None
+            public_key = values.get('PublicKey')
+            preshared_key = values.get('PresharedKey')
+            if public_key is None or not valid_key(public_key) or (preshared_key is not None
+                                                                    and not valid_key(preshared_key)):
+                name = peer.display_name()
+                for key in PEER_KEYS:
+                    if values.get(key) is not None and not valid_key(values[key]):
+                        issues.append(LintIssue("error", "invalid-key", f"{name}: {key} is not a valid key", [name]))
+                if public_key is None:
+                    issues.append(LintIssue("error", "invalid-key", f"{name}: no PublicKey", [name]))
+            for entry in values.get('AllowedIPs', '').split(','):
+                try:
+                    version, value, length = parse_network(entry)
+                except ValueError as e:
+                    if entry.strip():
+                        name = peer.display_name()
+                        issues.append(LintIssue("error", "invalid-address", f"{name}: {e}", [name]))
+                    continue
+                ranges.append((version, value, -(value | ((1 << (WIDTH[version] - length)) - 1)), index))
+        else:
+            continue
+        for key in _duplicate_settings(section.text, values):
+            name = name or section.record.display_name()
+            issues.append(LintIssue("warning", "duplicate-setting",
+                                    f"{name}: {key} is set more than once, only the last value is used",
+                                    [name] if section.kind == 'peer' else []))
+
+    for public_key, owners in document.model.duplicate_public_keys().items():
+        names = [p.display_name() for p in owners]
+        issues.append(LintIssue("error", "duplicate-public-key",
+                                f"PublicKey {public_key} is used by {len(owners)} peers: {', '.join(names)}", names))
+
+    issues.extend(_overlaps(ranges, peers))
+    issues.sort(key=lambda issue: issue.level != "error")
+    return issues
+
+
+def _overlaps(ranges, peers):
+    # Ranges are (version, start, -end, owner): sorted by start, widest first
+    # on ties. A range overlaps an earlier one exactly when it starts before
+    # the furthest end seen so far.
+    issues = []
+    ranges.sort()
+    version = None
+    cover_end = cover = None
+    for r in ranges:
+        if r[0] != version:
+            version, cover_end, cover = r[0], -1, None
+        if r[1] <= cover_end and cover[3] != r[3]:
+            issues.append(_overlap_issue(r, cover, peers))
+        if -r[2] > cover_end:
+            cover_end, cover = -r[2], r
+    return issues
+
+
+def _describe(r):
+    version, start, end, _ = r
+    return format_network((version, start, WIDTH[version] - (-end - start).bit_length()))
+
+
+def _overlap_issue(r, cover, peers):
+    if -1 in (r[3], cover[3]):
+        peer_range = r if cover[3] == -1 else cover
+        name = peers[peer_range[3]].display_name()
+        return LintIssue("warning", "interface-address",
+                         f"{name}: {_describe(peer_range)} covers the interface address", [name])
+    first, second = peers[cover[3]].display_name(), peers[r[3]].display_name()
+    return LintIssue("error", "overlap", f"{second}: {_describe(r)} overlaps {_describe(cover)} of {first}",
+                     [first, second])
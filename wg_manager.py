@@ -1,27 +1,77 @@
 import os
-import json
-import subprocess
-import re
-import shutil
-import time
+
+from wg_instrument import RECORDER, PROFILER, DEFAULT_SLOW_MS, instrument_methods, write_json
+
+# Only `os` and the (stdlib-only) instrumentation are imported up front.
+# Everything else (json, subprocess, the config/allocator/service modules) is
+# imported where it is first used, so scripts and the headless CLI can import
+# this module in a few milliseconds.
 
 class WireGuardManager:
-    def __init__(self, app_name="WireGuardManager"):
+    def __init__(self, app_name="WireGuardManager", runner=None):
         self.app_name = app_name
-        self.app_data_dir = os.path.join(os.getenv('LOCALAPPDATA'), self.app_name)
+        base_dir = os.getenv('LOCALAPPDATA') or os.path.join(os.path.expanduser("~"), ".local", "share")
+        self.app_data_dir = os.path.join(base_dir, self.app_name)
         self.settings_path = os.path.join(self.app_data_dir, "settings.json")
         self.legacy_settings_path = "settings.json"
-        
-        # Ensure AppData directory exists
-        if not os.path.exists(self.app_data_dir):
-            os.makedirs(self.app_data_dir)
-            
-        # Migrate if needed
-        self.migrate_settings()
-        
-        self.settings = self.load_settings()
+        self.sessions_path = os.path.join(self.app_data_dir, "sessions.journal")
+        self._settings = None
+        self._public_key_cache = {}
+        self._config_cache = None
+        self._allocator = None
+        self._allocator_model = None
+        self._prefix_index = None
+        self._prefix_index_model = None
+        self._search_index = None
+        self._service_watcher = None
+        self._service_backend_name = None
+        self._session_scheduler = None
+        self._history = None
+        self._traffic = None
+        self._uapi = None
+        # Managers for the other tunnels in settings["tunnels"], see tunnel();
+        # on those, _parent is the main manager
+        self._tunnels = {}
+        self._parent = None
+        self._tunnel_pool = None
+        # CommandRunner for wg/sc; pass one with a wg_fake.FakeBackend to run without WireGuard
+        self._runner = runner
+
+    @property
+    def settings(self):
+        # Settings I/O (directory creation, migration, load) happens on first use
+        if self._settings is None:
+            # Ensure AppData directory exists
+            if not os.path.exists(self.app_data_dir):
+                os.makedirs(self.app_data_dir)
+
+            # Migrate if needed
+            self.migrate_settings()
+
+            self._settings = self.load_settings()
+        return self._settings
+
+    @settings.setter
+    def settings(self, value):
+        self._settings = value
+
+    @property
+    def runner(self):
+        if self._runner is None:
+            from wg_runner import default_runner
+            self._runner = default_runner()
+        return self._runner
+
+    @property
+    def config_cache(self):
+        if self._config_cache is None:
+            from wg_config import ConfigCache
+            self._config_cache = ConfigCache()
+        return self._config_cache
         
     def migrate_settings(self):
+        import shutil
+
         # If legacy file exists but new one doesn't, migrate
         if os.path.exists(self.legacy_settings_path) and not os.path.exists(self.settings_path):
             try:
@@ -32,6 +82,8 @@ class WireGuardManager:
                 print(f"Migration error: {e}")
 
     def load_settings(self):
+        import json
+
         if os.path.exists(self.settings_path):
             try:
                 with open(self.settings_path, 'r') as f:
@@ -46,9 +98,29 @@ class WireGuardManager:
         }
 
     def save_settings(self, settings):
+        import json
+
+        if self._parent is not None:
+            self._save_tunnel_settings(settings)
+            return
         self.settings = settings
         with open(self.settings_path, 'w') as f:
             json.dump(settings, f, indent=4)
+        # wg_path may have changed
+        self.runner.forget()
+
+    def _save_tunnel_settings(self, settings):
+        # A tunnel from settings["tunnels"] shares the main settings file: what
+        # differs from the main settings is saved as its entry there
+        parent = self._parent
+        name = self.settings.get("interface_name")
+        spec = {k: v for k, v in settings.items() if k != "tunnels" and parent.settings.get(k) != v}
+        spec["interface_name"] = settings.get("interface_name", name)
+        tunnels = [spec if t.get("interface_name") == name else t for t in parent.settings.get("tunnels", [])]
+        parent.save_settings(dict(parent.settings, tunnels=tunnels))
+        if spec["interface_name"] != name:
+            parent._tunnels.pop(name, None)
+        self.settings = {**parent.settings, **spec, "tunnels": []}
 
     def get_config_content(self):
         conf_path = self.settings.get("conf_path")
@@ -57,50 +129,30 @@ class WireGuardManager:
                 return f.read()
         return ""
 
+    def get_config(self):
+        # Cached ConfigModel, re-parsed only when the file changes on disk
+        return self.config_cache.get(self.settings.get("conf_path"))
+
     def parse_config(self):
-        content = self.get_config_content()
-        if not content:
-            return {"interface": {}, "peers": []}
+        return self.get_config().to_dict()
 
-        # Split into sections
-        sections = re.split(r'\[(Interface|Peer)\]', content, flags=re.IGNORECASE)
-        
-        interface_data = {}
-        peers = []
-        
-        # The split returns [pre-text, 'Interface', content, 'Peer', content, ...]
-        # We start from index 1
-        for i in range(1, len(sections), 2):
-            section_type = sections[i].lower()
-            section_content = sections[i+1]
-            
-            data = {}
-            # Extract comments for name
-            name_match = re.search(r'#\s*Name:\s*(.*)', section_content)
-            if name_match:
-                data['name'] = name_match.group(1).strip()
-            
-            # Extract keys/values
-            lines = section_content.strip().split('\n')
-            for line in lines:
-                if '=' in line:
-                    key, val = line.split('=', 1)
-                    data[key.strip()] = val.strip()
-            
-            if section_type == 'interface':
-                interface_data = data
-            else:
-                peers.append(data)
-                
-        return {"interface": interface_data, "peers": peers}
+    def search_peers(self, query):
+        from wg_config import PeerSearchIndex
+
+        # Prefix search on name, address or key; the index follows the cached model
+        model = self.get_config()
+        if self._search_index is None or self._search_index.model is not model:
+            self._search_index = PeerSearchIndex(model)
+        return self._search_index.search(query)
 
     def write_config(self, interface_data, peers):
+        from wg_config import atomic_write
+
         conf_path = self.settings.get("conf_path")
         
-        # To preserve formatting, we'll read the existing file
-        # and only append new peers if they don't exist.
-        # For simplicity and to ensure '# Name:' comments are handled,
-        # we will rebuild the config but try to be cleaner.
+        # Full rewrite from dicts. Comments and key order outside of what is
+        # passed in are lost, so single-peer edits should go through
+        # add_peer/remove_peer/rename_peer instead.
         
         lines = ["[Interface]"]
         if 'PrivateKey' in interface_data:
@@ -127,142 +179,528 @@ class WireGuardManager:
                     lines.append(f"{k} = {v}")
                     
         content = "\n".join(lines)
-        
-        # Backup before writing
-        if os.path.exists(conf_path):
-            shutil.copy2(conf_path, conf_path + ".bak")
-            
-        with open(conf_path, 'w') as f:
-            f.write(content)
+        history = self.get_history()
+        self._record_current(history)
+        atomic_write(conf_path, content, backup=False)
+        self.config_cache.invalidate()
+        self._record_current(history, "write config")
+
+    # Incremental edits: only the affected peer section is rewritten, the
+    # rest of the file is kept byte for byte and committed atomically.
+
+    def add_peer(self, name, public_key, allowed_ips, **extra):
+        values = {"PublicKey": public_key, "AllowedIPs": allowed_ips}
+        values.update(extra)
+        record = self.config_cache.edit(self.settings.get("conf_path"), lambda doc: doc.add_peer(name, values),
+                                        self.get_history(), f"add {name}")
+        self._sync_indexes(added=[record])
+        return record
+
+    def add_peers(self, peers):
+        # peers: iterable of (name, values) tuples, committed in a single write
+        peers = list(peers)
+
+        def operation(doc):
+            return [doc.add_peer(name, values) for name, values in peers]
+        records = self.config_cache.edit(self.settings.get("conf_path"), operation,
+                                         self.get_history(), f"add {len(peers)} peers")
+        self._sync_indexes(added=records)
+        return records
+
+    def remove_peer(self, public_key):
+        record = self.get_config().peer_by_public_key(public_key)
+        removed = self.config_cache.edit(self.settings.get("conf_path"), lambda doc: doc.remove_peer(public_key),
+                                         self.get_history(),
+                                         f"remove {record.display_name() if record is not None else public_key}")
+        if removed and record is not None:
+            self._sync_indexes(removed=[record])
+        return removed
+
+    def rename_peer(self, public_key, new_name):
+        return self.config_cache.edit(self.settings.get("conf_path"),
+                                      lambda doc: doc.rename_peer(public_key, new_name),
+                                      self.get_history(), f"rename {public_key} to {new_name}")
+
+    # Config history: every write is recorded in <AppData>/history/<interface>
+    # (wg_history), which replaces the wg0.conf.bak copy.
+
+    def get_history(self):
+        from wg_history import ConfigHistory, DEFAULT_MAX_REVISIONS, DEFAULT_MAX_DAYS
+
+        # Follows the settings: another interface gets its own history
+        directory = os.path.join(self.app_data_dir, "history", self.settings.get("interface_name", "wg0"))
+        if self._history is None or self._history.directory != directory:
+            self._history = ConfigHistory(directory)
+        self._history.max_revisions = self.settings.get("history_max_revisions", DEFAULT_MAX_REVISIONS)
+        self._history.max_days = self.settings.get("history_max_days", DEFAULT_MAX_DAYS)
+        return self._history
+
+    def _record_current(self, history, message=None):
+        from wg_config import record_history
+
+        # Before a full rewrite: keep the file as it is now, e.g. after a hand edit.
+        # After one (with a message): record what was written.
+        conf_path = self.settings.get("conf_path")
+        if message is None:
+            if not os.path.exists(conf_path):
+                return
+            message = "external edit" if history.latest() else "initial"
+        record_history(history, self.config_cache.get_document(conf_path), message)
+
+    def restore_revision(self, revision_id):
+        """ Write a previous revision back to the config; KeyError if it isn't kept """
+        from wg_config import atomic_write
+
+        history = self.get_history()
+        content = history.read(revision_id)
+        self._record_current(history)
+        atomic_write(self.settings.get("conf_path"), content, backup=False)
+        self.config_cache.invalidate()
+        self._record_current(history, f"restore {revision_id}")
+        return content
+
+    # Traffic history: per-peer byte counts in <AppData>/traffic/<interface> (wg_traffic)
+
+    def get_traffic_store(self):
+        from wg_traffic import TrafficStore
+
+        # Follows the settings like get_history()
+        directory = os.path.join(self.app_data_dir, "traffic", self.settings.get("interface_name", "wg0"))
+        if self._traffic is None or self._traffic.directory != directory:
+            if self._traffic is not None:
+                self._traffic.close()
+            self._traffic = TrafficStore(directory)
+        return self._traffic
+
+    def record_traffic(self, peers=None, timestamp=None):
+        """
+        Add the current rx/tx counters of every peer to the traffic history.
+        peers: PeerTable from read_wg_dump(), read now if not given. Returns
+        the number of peers with traffic since the last sample, None if wg failed.
+        """
+        if peers is None:
+            dump = self.read_wg_dump()
+            if dump is None:
+                return None
+            peers = dump[1]
+        return self.get_traffic_store().record(peers.counters(), timestamp)
+
+    def _sync_indexes(self, added=(), removed=()):
+        # Only patch an allocator or prefix index that tracks the model we just
+        # edited, anything else is rebuilt lazily by get_allocator()/get_prefix_index()
+        model = self.get_config()
+        if self._prefix_index is not None and self._prefix_index_model is model:
+            for record in removed:
+                self._prefix_index.remove(record.allowed_ips, record)
+            for record in added:
+                self._prefix_index.add(record.allowed_ips, record)
+        if self._allocator is None or self._allocator_model is not model:
+            return
+        if removed:
+            from wg_prefix import parse_allowed_ips
+
+            index = self.get_prefix_index()
+        for record in removed:
+            self._allocator.release(record.allowed_ips)
+            # Other peers may still hold addresses inside (or around) the released ranges
+            for _, network in parse_allowed_ips(record.allowed_ips):
+                if network is not None:
+                    for _, owner in index.overlaps(network):
+                        self._allocator.mark_used(owner.allowed_ips)
+        for record in added:
+            self._allocator.mark_used(record.allowed_ips)
 
     def generate_keys(self):
-        wg_exe = self.settings.get("wg_path").replace("wireguard.exe", "wg.exe")
-        if not os.path.exists(wg_exe):
-             wg_exe = os.path.join(os.path.dirname(self.settings.get("wg_path")), "wg.exe")
+        import wg_keys
 
         try:
-            # shell=False is safer
-            priv_key = subprocess.check_output([wg_exe, "genkey"], shell=False).decode().strip()
-            pub_key = subprocess.check_output([wg_exe, "pubkey"], input=priv_key.encode(), shell=False).decode().strip()
-            return priv_key, pub_key
+            return wg_keys.generate_keypair()
         except Exception as e:
             print(f"Error generating keys: {e}")
             return None, None
 
+    def generate_keypairs(self, count):
+        import wg_keys
+
+        # Batch variant for bulk provisioning, one call for N clients
+        try:
+            return wg_keys.generate_keypairs(count)
+        except Exception as e:
+            print(f"Error generating keys: {e}")
+            return []
+
     def get_public_key(self, private_key):
-        wg_exe = self.settings.get("wg_path").replace("wireguard.exe", "wg.exe")
-        if not os.path.exists(wg_exe):
-             wg_exe = os.path.join(os.path.dirname(self.settings.get("wg_path")), "wg.exe")
-        
+        import wg_keys
+
+        private_key = private_key.strip()
+        if private_key in self._public_key_cache:
+            return self._public_key_cache[private_key]
         try:
-            pub_key = subprocess.check_output([wg_exe, "pubkey"], input=private_key.encode(), shell=False).decode().strip()
-            return pub_key
+            pub_key = wg_keys.derive_public_key(private_key)
         except Exception as e:
             print(f"Error deriving public key: {e}")
             return None
+        self._public_key_cache[private_key] = pub_key
+        return pub_key
 
-    def control_service(self, action):
+    def get_server_public_key(self, interface_data):
+        # Prefer an explicit PublicKey, otherwise derive (memoized) from PrivateKey
+        server_pub_key = interface_data.get('PublicKey', '')
+        if not server_pub_key and interface_data.get('PrivateKey'):
+            server_pub_key = self.get_public_key(interface_data.get('PrivateKey'))
+        return server_pub_key or ''
+
+    def build_client_config(self, private_key, address, interface_data=None):
+        # Text of the .conf handed to a client
+        if interface_data is None:
+            interface_data = self.get_config().interface
+        server_pub_key = self.get_server_public_key(interface_data)
+        endpoint = self.settings.get('endpoint', 'YOUR_SERVER_IP:51820')
+        return f"[Interface]\nPrivateKey = {private_key}\nAddress = {address}\nDNS = 1.1.1.1\n\n[Peer]\nPublicKey = {server_pub_key}\nEndpoint = {endpoint}\nAllowedIPs = 0.0.0.0/0"
+
+    def get_service_watcher(self):
+        from wg_service import ServiceStatusWatcher, create_backend
+
+        # One watcher for the app lifetime so subscriptions survive settings changes
         interface = self.settings.get("interface_name", "wg0")
-        service_name = f"WireGuardTunnel${interface}"
-        
+        backend_name = self.settings.get("service_backend", "auto")
+        if self._service_watcher is None:
+            self._service_watcher = ServiceStatusWatcher(create_backend(backend_name, self.runner), interface)
+            self._service_backend_name = backend_name
+        elif self._service_backend_name != backend_name or self._service_watcher.interface != interface:
+            if self._service_backend_name != backend_name:
+                self._service_watcher.backend = create_backend(backend_name, self.runner)
+                self._service_backend_name = backend_name
+            self._service_watcher.interface = interface
+            self._service_watcher.invalidate()
+        return self._service_watcher
+
+    def control_service(self, action):
+        from wg_service import ServiceError
+
+        watcher = self.get_service_watcher()
         try:
             if action == "restart":
-                # Stop the service
-                subprocess.run(["sc", "stop", service_name], check=False, capture_output=True)
-                
-                # Wait for it to stop (max 10 seconds)
-                for _ in range(10):
-                    status = self.get_service_status()
-                    if status == "Stopped":
-                        break
-                    time.sleep(1)
-                
-                # Start the service
-                subprocess.run(["sc", "start", service_name], check=True, capture_output=True)
+                watcher.restart()
+            elif action == "start":
+                watcher.start()
+            elif action == "stop":
+                watcher.stop()
             else:
-                subprocess.run(["sc", action, service_name], check=True, capture_output=True)
-            return True
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr.decode() if e.stderr else str(e)
-            print(f"Service control error: {error_msg}")
+                raise ServiceError(f"Unsupported service action: {action}")
+        except ServiceError as e:
+            print(f"Service control error: {e}")
             return False
+        if action != "stop" and (self._session_scheduler is not None or os.path.exists(self.sessions_path)):
+            # The tunnel comes back with only the wg0.conf peers; switch live
+            # Gatekeeper sessions on again
+            sessions = self.get_session_scheduler()
+            if len(sessions) and not sessions.resync():
+                print("Could not restore Gatekeeper sessions after the restart")
+                return False
+        return True
 
-    def get_service_status(self):
-        interface = self.settings.get("interface_name", "wg0")
-        service_name = f"WireGuardTunnel${interface}"
-        try:
-            output = subprocess.check_output(["sc", "query", service_name], shell=False).decode()
-            if "RUNNING" in output:
-                return "Running"
-            if "STOPPED" in output:
-                return "Stopped"
-            return "Unknown"
-        except:
-            return "Not Installed"
-
-    def get_next_ip(self):
-        config = self.parse_config()
-        used_ips = []
-        
-        # Check interface IP
-        if 'Address' in config['interface']:
-            addr = config['interface']['Address'].split(',')[0].strip().split('/')[0]
+    def get_service_status(self, max_age=None):
+        return self.get_service_watcher().status(max_age)
+
+    def get_allocator(self):
+        from wg_allocator import AddressAllocator
+
+        # Built once per parsed config and then kept in sync by the peer
+        # edit methods, so handing out addresses never rescans the peers
+        model = self.get_config()
+        if self._allocator is None or self._allocator_model is not model:
+            self._allocator = AddressAllocator.from_config(model, self.settings.get("reserved_ranges", []))
+            self._allocator_model = model
+        return self._allocator
+
+    def get_prefix_index(self):
+        from wg_prefix import PrefixIndex
+
+        # Radix tree over every peer's AllowedIPs, kept in sync like the allocator
+        model = self.get_config()
+        if self._prefix_index is None or self._prefix_index_model is not model:
+            self._prefix_index = PrefixIndex.from_config(model)
+            self._prefix_index_model = model
+        return self._prefix_index
+
+    def peer_for_address(self, address):
+        """ The peer whose AllowedIPs route address (longest prefix), or None """
+        return self.get_prefix_index().owner(address)
+
+    def check_allowed_ips(self, allowed_ips, exclude=None):
+        """
+        Problems with giving a peer allowed_ips, as messages: bad entries,
+        overlaps with other peers (other than exclude) and ranges covering the
+        interface's own address. Empty when they can be used.
+        """
+        from wg_prefix import parse_network, parse_allowed_ips
+
+        problems = self.get_prefix_index().conflicts(allowed_ips, exclude)
+        own_addresses = []
+        for own in self.get_config().interface.get('Address', '').split(','):
             try:
-                parts = list(map(int, addr.split('.')))
-                if len(parts) == 4:
-                    used_ips.append(parts)
-            except:
-                pass
-                
-        # Check peers
-        for peer in config['peers']:
-            allowed_ips = peer.get('AllowedIPs', '')
-            if allowed_ips:
-                first_ip = allowed_ips.split(',')[0].strip().split('/')[0]
-                try:
-                    parts = list(map(int, first_ip.split('.')))
-                    if len(parts) == 4:
-                        used_ips.append(parts)
-                except:
-                    pass
-        
-        if not used_ips:
-            return "10.0.0.2/32"
-            
-        # Sort and find max
-        used_ips.sort()
-        last_ip = used_ips[-1]
-        
-        # Simple increment of 4th octet
-        # (Real implementation handles subnet overflow, but this covers 99% of basic WG setups)
-        next_val = last_ip[3] + 1
-        
-        return f"{last_ip[0]}.{last_ip[1]}.{last_ip[2]}.{next_val}/32"
+                own_addresses.append((own.split('/')[0].strip(), parse_network(own.split('/')[0])))
+            except ValueError:
+                continue
+        for entry, network in parse_allowed_ips(allowed_ips):
+            if network is None:
+                continue
+            version, value, length = network
+            for own, (own_version, own_value, width) in own_addresses:
+                if version == own_version and own_value >> (width - length) << (width - length) == value:
+                    problems.append(f"{entry} covers the interface address {own}")
+        return problems
 
-    def get_wg_show_dump(self):
-        interface = self.settings.get("interface_name", "wg0")
-        wg_exe = self.settings.get("wg_path", "C:\\Program Files\\WireGuard\\wireguard.exe").replace("wireguard.exe", "wg.exe")
-        if not os.path.exists(wg_exe):
-             wg_exe = os.path.join(os.path.dirname(self.settings.get("wg_path", "C:\\Program Files\\WireGuard\\wireguard.exe")), "wg.exe")
+    def lint_config(self):
+        from wg_lint import lint_document
+
+        # [wg_lint.LintIssue] for the whole config, errors first
+        return lint_document(self.config_cache.get_document(self.settings.get("conf_path")))
 
+    def get_next_ip(self, version=4):
         try:
-            output = subprocess.check_output([wg_exe, "show", interface, "dump"], shell=False).decode('utf-8')
-            lines = output.strip().split('\n')
-            peers = []
-            for line in lines[1:]: # skip first line which is interface
-                parts = line.split('\t')
-                if len(parts) >= 8:
-                    peers.append({
-                        "public_key": parts[0],
-                        "preshared_key": parts[1],
-                        "endpoint": parts[2],
-                        "allowed_ips": parts[3],
-                        "latest_handshake": int(parts[4]),
-                        "transfer_rx": int(parts[5]),
-                        "transfer_tx": int(parts[6]),
-                        "persistent_keepalive": parts[7]
-                    })
-            return peers
-        except Exception as e:
-            print(f"Error running wg show: {e}")
+            return self.get_allocator().next_free(version)
+        except ValueError as e:
+            print(f"Error allocating address: {e}")
+            return None
+
+    def allocate_ips(self, count, version=4):
+        # Reserve `count` addresses at once for bulk provisioning. Addresses that
+        # end up unused should be handed back with release_ips().
+        return self.get_allocator().allocate_many(count, version)
+
+    def release_ips(self, addresses):
+        allocator = self.get_allocator()
+        for address in addresses:
+            allocator.release(address)
+
+    def _wg_exe(self):
+        # wg.exe next to wireguard.exe, else `wg` on PATH; resolved once per wg_path
+        wg_path = self.settings.get("wg_path", "C:\\Program Files\\WireGuard\\wireguard.exe")
+        candidates = (wg_path.replace("wireguard.exe", "wg.exe"), os.path.join(os.path.dirname(wg_path), "wg.exe"))
+        return self.runner.resolve("wg", candidates)
+
+    def run_wg(self, *args, **kwargs):
+        """ Run wg with the resolved path; returns a wg_runner.CommandResult """
+        return self.runner.run([self._wg_exe()] + list(args), **kwargs)
+
+    def get_uapi(self):
+        """
+        wg_uapi.UapiClient for the tunnel, or None to use wg. settings["wg_backend"]:
+        "auto" (UAPI when the tunnel's socket or pipe accepts a connection, the
+        default), "uapi" or "wg". settings["uapi_path"] overrides where the socket is.
+        """
+        from wg_uapi import UapiClient, socket_path
+
+        mode = self.settings.get("wg_backend", "auto")
+        if mode == "wg":
             return None
+        path = self.settings.get("uapi_path") or socket_path(self.settings.get("interface_name", "wg0"))
+        if self._uapi is None or self._uapi.path != path:
+            if self._uapi is not None:
+                self._uapi.close()
+            self._uapi = UapiClient(path)
+        if mode == "auto" and not self._uapi.available():
+            return None
+        return self._uapi
+
+    def read_wg_dump(self):
+        """
+        (DumpInterface or None, PeerTable) of the running tunnel, or None if it
+        can't be read. Over UAPI when available, otherwise from `wg show <iface>
+        dump`, parsed as the output streams in (see wg_dump).
+        """
+        from wg_dump import DumpParser
+
+        uapi = self.get_uapi()
+        if uapi is not None:
+            try:
+                return uapi.get()
+            except Exception as e:
+                print(f"UAPI get error: {e}")
+                if self.settings.get("wg_backend", "auto") == "uapi":
+                    return None
+
+        interface = self.settings.get("interface_name", "wg0")
+        parser = DumpParser()
+        result = self.runner.stream([self._wg_exe(), "show", interface, "dump"], parser.feed)
+        if not result.ok:
+            print(f"Error running wg show: {result.message}")
+            return None
+        dump = parser.close()
+        if parser.skipped:
+            print(f"wg show dump: skipped {parser.skipped} malformed peer lines")
+        return dump
+
+    def get_wg_show_dump(self):
+        # List of peer dicts, for callers that don't need the compact table
+        result = self.read_wg_dump()
+        return None if result is None else result[1].as_dicts()
+
+    def set_peers(self, groups):
+        """
+        Apply `wg set` argument groups (see wg_apply.set_groups, preshared keys
+        given as keys) to the running tunnel: one UAPI request when available,
+        otherwise as few `wg set` calls as fit on a command line. Returns
+        (ok, number of requests or wg calls).
+        """
+        import tempfile
+
+        uapi = self.get_uapi()
+        if uapi is not None:
+            from wg_uapi import UapiError, UnsupportedArgument
+
+            try:
+                uapi.set(groups)
+                return True, 1
+            except UapiError as e:
+                print(f"UAPI set error: {e}")
+                return False, 1
+            except UnsupportedArgument as e:
+                # Nothing was sent; wg can apply it
+                print(f"UAPI set error: {e}, using wg")
+            except ValueError as e:
+                # A malformed key or value, wg would refuse it too
+                print(f"UAPI set error: {e}")
+                return False, 0
+            except OSError as e:
+                print(f"UAPI set error: {e}")
+                if self.settings.get("wg_backend", "auto") == "uapi":
+                    return False, 1
+
+        if any("preshared-key" in group for group in groups):
+            with tempfile.TemporaryDirectory(prefix="wgm-") as tmp:
+                psk_files = {}
+                return self._wg_set([self._psk_files(group, tmp, psk_files) for group in groups])
+        return self._wg_set(groups)
+
+    def _wg_set(self, groups):
+        from wg_apply import pack_commands
+
+        commands = pack_commands(self.settings.get("interface_name", "wg0"), groups)
+        for args in commands:
+            result = self.run_wg(*args)
+            if not result.ok:
+                print(f"wg set error: {result.message}")
+                return False, len(commands)
+        return True, len(commands)
+
+    @staticmethod
+    def _psk_files(group, tmp, psk_files):
+        # wg only reads preshared keys from files; one file per distinct key
+        if "preshared-key" not in group:
+            return group
+        group = list(group)
+        i = group.index("preshared-key") + 1
+        key = group[i]
+        if key not in psk_files:
+            path = os.path.join(tmp, f"psk{len(psk_files)}")
+            with open(path, 'w') as f:
+                f.write(key + "\n" if key else "")
+            psk_files[key] = path
+        group[i] = psk_files[key]
+        return group
+
+    def apply_changes(self):
+        """
+        Bring the running tunnel in line with wg0.conf. Peer additions, removals
+        and changes are sent with one `wg set` call (or UAPI request); the
+        service is only restarted when interface-level settings changed or the
+        tunnel is unreachable. Returns a dict with the mode used ("noop",
+        "delta" or "restart") and "ok".
+        """
+        from wg_apply import compute_delta, set_groups
+
+        live = self.read_wg_dump()
+        if live is None:
+            return {"mode": "restart", "ok": self.control_service("restart"), "reason": "tunnel state unavailable"}
+
+        delta = compute_delta(self.get_config(), live[0], live[1])
+        if self._session_scheduler is not None or os.path.exists(self.sessions_path):
+            # Peers switched on by a Gatekeeper session are not in wg0.conf
+            sessions = self.get_session_scheduler()
+            delta.removed = [key for key in delta.removed if not sessions.is_active(key)]
+        if delta.restart_reason:
+            return {"mode": "restart", "ok": self.control_service("restart"), "reason": delta.restart_reason}
+        if delta.is_empty():
+            return dict(delta.summary(), mode="noop", ok=True)
+
+        ok, invocations = self.set_peers(set_groups(delta))
+        return dict(delta.summary(), mode="delta", ok=ok, invocations=invocations)
+
+    def get_session_scheduler(self):
+        from wg_sessions import SessionScheduler, DEFAULT_HOURS
+
+        # Gatekeeper sessions, restored from <AppData>/sessions.journal
+        if self._session_scheduler is None:
+            self._session_scheduler = SessionScheduler(self, self.sessions_path,
+                                                       hours=self.settings.get("session_hours", DEFAULT_HOURS))
+        return self._session_scheduler
+
+    def tunnel_names(self):
+        # The tunnel from interface_name/conf_path first, then settings["tunnels"]
+        names = [self.settings.get("interface_name", "wg0")]
+        for spec in self.settings.get("tunnels", []):
+            name = spec.get("interface_name")
+            if name and name not in names:
+                names.append(name)
+        return names
+
+    def tunnel(self, name=None):
+        """
+        Manager for one tunnel: self for the main one, otherwise a manager with
+        its own config cache and service watcher sharing this one's runner.
+        Entries in settings["tunnels"] override any setting for their tunnel,
+        e.g. {"interface_name": "wg1", "conf_path": "...\\wg1.conf"}.
+        """
+        if name is None or name == self.settings.get("interface_name", "wg0"):
+            return self
+        spec = next((t for t in self.settings.get("tunnels", []) if t.get("interface_name") == name), None)
+        if spec is None:
+            raise KeyError(f"Unknown tunnel: {name}")
+        manager = self._tunnels.get(name)
+        if manager is None:
+            manager = WireGuardManager(self.app_name, runner=self.runner)
+            manager._parent = self
+            manager.sessions_path = os.path.join(self.app_data_dir, f"sessions-{name}.journal")
+            self._tunnels[name] = manager
+        # Re-derived on every call so it follows settings changes
+        manager.settings = {**self.settings, **spec, "tunnels": []}
+        return manager
+
+    def collect_tunnel_states(self, status=True, dumps=True, max_age=None):
+        """ wg_tunnels.TunnelState for every tunnel, collected in parallel """
+        from concurrent.futures import ThreadPoolExecutor
+        from wg_tunnels import collect
+
+        if self._tunnel_pool is None:
+            self._tunnel_pool = ThreadPoolExecutor(max_workers=self.runner.max_concurrent, thread_name_prefix="tunnel")
+        return collect([self.tunnel(name) for name in self.tunnel_names()], self._tunnel_pool,
+                       status=status, dumps=dumps, max_age=max_age)
+
+    def configure_instrumentation(self):
+        # Slow operations go to <AppData>/logs/slow.log
+        RECORDER.configure(log_dir=os.path.join(self.app_data_dir, "logs"),
+                           threshold_ms=self.settings.get("slow_threshold_ms", DEFAULT_SLOW_MS))
+
+    def diagnostics(self):
+        return {
+            "operations": RECORDER.snapshot(),
+            "commands": self.runner.stats(),
+            "slow_threshold_ms": RECORDER.threshold_ms,
+            "slow_log": RECORDER.log_path,
+            "profiling": PROFILER.active,
+            "uapi": None if self._uapi is None else {"path": self._uapi.path, "requests": self._uapi.requests},
+        }
+
+    def export_diagnostics(self, path=None):
+        import time
+
+        path = path or os.path.join(self.app_data_dir, "logs", time.strftime("diagnostics-%Y%m%d-%H%M%S.json"))
+        write_json(path, self.diagnostics())
+        return path
+
+
+# Every public method is timed (see wg_instrument)
+instrument_methods(WireGuardManager, "manager")
@@ -0,0 +1,191 @@
+import itertools
+import queue
+import threading
+import time
+from wg_instrument import instrument
+from wg_stats import ThroughputEngine
+
+# Background sampling for the Monitor view.
+# A MonitorSampler thread runs `wg show dump` (for all tunnels, in parallel)
+# and the config lookup off the Tk thread and hands finished snapshots to the
+# UI through a queue. Rows are already formatted, so the UI only compares
+# strings and updates labels. Every sample also goes to the tunnel's traffic
+# history on disk (wg_traffic) unless the traffic_history setting is off.
+
+DEFAULT_INTERVAL = 5
+TOP_TALKERS = 3
+# Throughput history kept per peer, in seconds
+HISTORY_SECONDS = 3600
+
+
+def format_bytes(b):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if b < 1024.0:
+            return f"{b:.2f} {unit}"
+        b /= 1024.0
+    return f"{b:.2f} PB"
+
+
+def format_handshake(handshake, now=None):
+    if handshake == 0:
+        return "Never"
+    diff = int(now if now is not None else time.time()) - handshake
+    if diff < 60:
+        return f"{diff} sec ago"
+    elif diff < 3600:
+        return f"{diff // 60} min ago"
+    elif diff < 86400:
+        return f"{diff // 3600} hr ago"
+    return f"{diff // 86400} days ago"
+
+
+def format_rate(rx_rate, tx_rate):
+    return f"Rate: {format_bytes(rx_rate)}/s in | {format_bytes(tx_rate)}/s out"
+
+
+class MonitorSnapshot:
+    __slots__ = ("taken_at", "rows", "error", "duration", "top_talkers")
+
+    def __init__(self, taken_at, rows, error=None, duration=0.0, top_talkers=None):
+        self.taken_at = taken_at
+        # rows: list of dicts keyed by public_key order, None when the dump failed
+        self.rows = rows
+        self.error = error
+        self.duration = duration
+        # (name, rx bytes/s, tx bytes/s) of the busiest peers
+        self.top_talkers = top_talkers or []
+
+
+@instrument("monitor.sample")
+def build_snapshot(manager, engine=None):
+    # Dumps of all tunnels are taken in parallel; with more than one tunnel
+    # rows are keyed "<tunnel>:<public key>" since a key may be on several
+    start = time.perf_counter()
+    states = manager.collect_tunnel_states(status=False)
+    now = time.time()
+    live = [state for state in states if state.peers is not None]
+    if not live:
+        return MonitorSnapshot(now, None, "Could not retrieve WireGuard data.\nIs the service running and is WireGuard in your PATH?",
+                               time.perf_counter() - start)
+
+    several = len(states) > 1
+    if manager.settings.get("traffic_history", True):
+        for state in live:
+            try:
+                manager.tunnel(state.name).record_traffic(state.peers, now)
+            except (OSError, ValueError) as e:
+                print(f"Could not record traffic for {state.name}: {e}")
+    if engine is not None:
+        engine.record(itertools.chain.from_iterable(
+            ((f"{state.name}:{key}", rx, tx, hs) for key, rx, tx, hs in state.peers.counters()) if several
+            else state.peers.counters() for state in live), now)
+    rows = []
+    names = {}
+    for state in live:
+        peers = state.peers
+        config = manager.tunnel(state.name).get_config()
+        for i, pubkey in enumerate(peers.public_keys):
+            key = f"{state.name}:{pubkey}" if several else pubkey
+            names[key] = config.name_for(pubkey) + (f" [{state.name}]" if several else "")
+            endpoint = peers.endpoints[i]
+            rx_rate, tx_rate = engine.rate(key) if engine is not None else (0.0, 0.0)
+            rows.append({
+                "public_key": key,
+                "name": names[key],
+                "endpoint": f"Endpoint: {endpoint if endpoint != '(none)' else 'Disconnected'}",
+                "transfer": f"Rx: {format_bytes(peers.rx[i])} | Tx: {format_bytes(peers.tx[i])}",
+                "handshake": f"Handshake: {format_handshake(peers.handshakes[i], now)}",
+                "key": f" ({pubkey[:8]}...)",
+                "rate": format_rate(rx_rate, tx_rate),
+            })
+
+    top_talkers = []
+    if engine is not None:
+        top_talkers = [(names.get(key, key), rx, tx) for key, rx, tx in engine.top_talkers(TOP_TALKERS)]
+    failed = [state.name for state in states if state.peers is None]
+    # Set alongside rows when only some tunnels could be read
+    error = f"No data from {', '.join(failed)}" if failed else None
+    return MonitorSnapshot(now, rows, error, time.perf_counter() - start, top_talkers)
+
+
+class MonitorSampler:
+    """ Samples `wg show dump` on a worker thread and queues snapshots for the UI """
+
+    def __init__(self, manager, interval=DEFAULT_INTERVAL):
+        self.manager = manager
+        self.interval = interval
+        self.auto = False
+        # Only the latest snapshot matters, older ones are dropped
+        self.snapshots = queue.Queue(maxsize=1)
+        self.engine = ThroughputEngine(capacity=self._capacity(interval))
+        self._wake = threading.Event()
+        # At most one sampling thread: stop() only asks it to exit, and a
+        # start() before it has exited keeps it running
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+
+    @staticmethod
+    def _capacity(interval):
+        return max(HISTORY_SECONDS // max(interval, 1), 2)
+
+    def start(self):
+        with self._lock:
+            self._stopping = False
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="MonitorSampler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+        self._wake.set()
+
+    def request_refresh(self):
+        self.start()
+        self._wake.set()
+
+    def set_interval(self, interval):
+        # The engine is resized by the sampling thread before its next sample
+        self.interval = max(1, interval)
+        self._wake.set()
+
+    def set_auto(self, enabled):
+        self.auto = enabled
+        if enabled:
+            self.request_refresh()
+
+    def _publish(self, snapshot):
+        while True:
+            try:
+                self.snapshots.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self.snapshots.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while True:
+            # Sleep until the next tick, or indefinitely when auto-refresh is off
+            self._wake.wait(self.interval if self.auto else None)
+            self._wake.clear()
+            with self._lock:
+                if self._stopping:
+                    self._thread = None
+                    return
+            # Keep HISTORY_SECONDS of history whatever the interval
+            self.engine.resize(self._capacity(self.interval))
+            try:
+                snapshot = build_snapshot(self.manager, self.engine)
+            except Exception as e:
+                snapshot = MonitorSnapshot(time.time(), None, f"Monitor error: {e}")
+            self._publish(snapshot)
+
+    def latest(self):
+        # Non-blocking, called from the UI thread
+        try:
+            return self.snapshots.get_nowait()
+        except queue.Empty:
+            return None
@@ -0,0 +1,257 @@
+import socket
+
+# AllowedIPs of every peer in a radix tree, one per IP version.
+#
+# The tree is path-compressed (a Patricia trie): each node is a prefix
+# (value, length) and only exists where a prefix was inserted or where two
+# branches split, so depth is bounded by the address width (32/128) and in
+# practice by log2 of the number of prefixes. Lookups and overlap checks walk
+# one path, O(k) in the address width, instead of testing every peer:
+#
+#   owner(ip)        longest-prefix match: which peer traffic to ip goes to
+#   overlaps(cidr)   every peer whose AllowedIPs contain or fall inside cidr
+#
+# parse_network() is the shared CIDR parser; it uses inet_pton rather than
+# ipaddress so that wg_lint can parse 100k entries in a fraction of a second.
+
+WIDTH = {4: 32, 6: 128}
+
+
+def parse_network(text):
+    """ (version, value, prefix length) of a CIDR or bare address, host bits cleared; ValueError if malformed """
+    address, slash, length = text.strip().partition('/')
+    if ':' in address:
+        version, family, width = 6, socket.AF_INET6, 128
+    else:
+        version, family, width = 4, socket.AF_INET, 32
+    try:
+        value = int.from_bytes(socket.inet_pton(family, address), 'big')
+    except (OSError, ValueError):
+        raise ValueError(f"Invalid address: {text.strip()}")
+    if not slash:
+        return version, value, width
+    prefix = int(length) if length.isdigit() and length.isascii() else -1
+    if not 0 <= prefix <= width:
+        raise ValueError(f"Invalid prefix length: {text.strip()}")
+    return version, value >> (width - prefix) << (width - prefix), prefix
+
+
+def parse_allowed_ips(allowed_ips):
+    """ [(entry, parsed or None)] for a comma separated AllowedIPs value """
+    entries = []
+    for entry in allowed_ips.split(','):
+        entry = entry.strip()
+        if entry:
+            try:
+                entries.append((entry, parse_network(entry)))
+            except ValueError:
+                entries.append((entry, None))
+    return entries
+
+
+def format_network(network):
+    version, value, length = network
+    family = socket.AF_INET if version == 4 else socket.AF_INET6
+    return f"{socket.inet_ntop(family, value.to_bytes(WIDTH[version] // 8, 'big'))}/{length}"
+
+
+class _Node:
+    # Children in two slots rather than a list: one object less per node
+    __slots__ = ("value", "length", "owners", "zero", "one")
+
+    def __init__(self, value, length, owners=()):
+        self.value = value
+        self.length = length
+        # Peers holding exactly this prefix; () for nodes that only branch
+        self.owners = owners
+        self.zero = None
+        self.one = None
+
+    def child(self, bit):
+        return self.one if bit else self.zero
+
+    def set_child(self, bit, node):
+        if bit:
+            self.one = node
+        else:
+            self.zero = node
+
+
+class PrefixIndex:
+    """ Radix tree over AllowedIPs; owners are whatever add() was given (PeerRecords in the manager) """
+
+    def __init__(self):
+        self._roots = {4: None, 6: None}
+        self.count = 0
+
+    @classmethod
+    def from_config(cls, model):
+        entries = []
+        for peer in model.peers:
+            for _, network in parse_allowed_ips(peer.allowed_ips):
+                if network is not None:
+                    entries.append((network, peer))
+        index = cls()
+        index.build(entries)
+        return index
+
+    def build(self, entries):
+        """
+        Bulk insert of [(network, owner)] into an empty index. Sorted, every
+        prefix comes after the prefixes containing it, so each one is placed
+        from the path of the previous one instead of a walk from the root.
+        """
+        entries.sort(key=lambda entry: entry[0])
+        stack = []
+        version = None
+        for (v, value, length), owner in entries:
+            if v != version:
+                version, width, stack = v, WIDTH[v], []
+            # Up to the deepest node on the previous path that contains this prefix
+            last = None
+            while stack and (stack[-1].length > length or (stack[-1].value ^ value) >> (width - stack[-1].length)):
+                last = stack.pop()
+            top = stack[-1] if stack else None
+            if top is not None and top.length == length:
+                top.owners = top.owners + [owner] if top.owners else [owner]
+                self.count += 1
+                continue
+            node = _Node(value, length, [owner])
+            common = -1 if last is None else min(last.length, width - (last.value ^ value).bit_length())
+            if last is None or (top is not None and common == top.length):
+                # A free child slot of top (or an empty tree)
+                self._link(version, top, (value >> (width - 1 - top.length)) & 1 if top else 0, node)
+            else:
+                branch = _Node(value >> (width - common) << (width - common), common)
+                branch.set_child((last.value >> (width - 1 - common)) & 1, last)
+                branch.set_child((value >> (width - 1 - common)) & 1, node)
+                self._link(version, top, (value >> (width - 1 - top.length)) & 1 if top else 0, branch)
+                stack.append(branch)
+            stack.append(node)
+            self.count += 1
+
+    def add(self, allowed_ips, owner):
+        for _, network in parse_allowed_ips(allowed_ips):
+            if network is not None:
+                self.insert(network, owner)
+
+    def remove(self, allowed_ips, owner):
+        for _, network in parse_allowed_ips(allowed_ips):
+            if network is not None:
+                self.delete(network, owner)
+
+    def insert(self, network, owner):
+        version, value, length = network
+        width = WIDTH[version]
+        node = self._roots[version]
+        parent = None
+        side = 0
+        while node is not None:
+            common = min(node.length, length, width - (node.value ^ value).bit_length())
+            if common < node.length:
+                # The new prefix branches off (or sits) above node
+                if common == length:
+                    new = _Node(value, length, [owner])
+                else:
+                    new = _Node(value >> (width - common) << (width - common), common)
+                    new.set_child((value >> (width - 1 - common)) & 1, _Node(value, length, [owner]))
+                new.set_child((node.value >> (width - 1 - common)) & 1, node)
+                self._link(version, parent, side, new)
+                self.count += 1
+                return
+            if node.length == length:
+                node.owners = node.owners + [owner] if node.owners else [owner]
+                self.count += 1
+                return
+            parent, side = node, (value >> (width - 1 - node.length)) & 1
+            node = node.child(side)
+        self._link(version, parent, side, _Node(value, length, [owner]))
+        self.count += 1
+
+    def _link(self, version, parent, side, node):
+        if parent is None:
+            self._roots[version] = node
+        else:
+            parent.set_child(side, node)
+
+    def delete(self, network, owner):
+        version, value, length = network
+        width = WIDTH[version]
+        node = self._roots[version]
+        path = []
+        while node is not None and node.length <= length:
+            if (node.value ^ value) >> (width - node.length):
+                return False
+            if node.length == length:
+                break
+            side = (value >> (width - 1 - node.length)) & 1
+            path.append((node, side))
+            node = node.child(side)
+        if node is None or node.length != length or not any(o is owner for o in node.owners):
+            return False
+        node.owners = [o for o in node.owners if o is not owner] or ()
+        self.count -= 1
+        # Drop nodes that neither hold a prefix nor branch any more
+        while not node.owners and (node.zero is None or node.one is None):
+            child = node.zero or node.one
+            parent, side = path.pop() if path else (None, 0)
+            self._link(version, parent, side, child)
+            if parent is None:
+                break
+            node = parent
+        return True
+
+    def owner(self, address):
+        """ Owner of the longest prefix containing address, None if no peer routes it """
+        version, value, length = parse_network(address)
+        width = WIDTH[version]
+        node = self._roots[version]
+        best = None
+        while node is not None and node.length <= length:
+            if (node.value ^ value) >> (width - node.length):
+                break
+            if node.owners:
+                best = node.owners[0]
+            if node.length == length:
+                break
+            node = node.child((value >> (width - 1 - node.length)) & 1)
+        return best
+
+    def overlaps(self, network):
+        """ [(network, owner)] for every prefix that contains or lies inside network """
+        version, value, length = network
+        width = WIDTH[version]
+        found = []
+        node = self._roots[version]
+        while node is not None:
+            if node.length >= length:
+                # Everything below node is inside network if node is
+                if (node.value ^ value) >> (width - length):
+                    break
+                stack = [node]
+                while stack:
+                    current = stack.pop()
+                    found.extend(((version, current.value, current.length), o) for o in current.owners)
+                    stack.extend(c for c in (current.zero, current.one) if c is not None)
+                break
+            if (node.value ^ value) >> (width - node.length):
+                break
+            found.extend(((version, node.value, node.length), o) for o in node.owners)
+            node = node.child((value >> (width - 1 - node.length)) & 1)
+        return found
+
+    def conflicts(self, allowed_ips, exclude=None):
+        """
+        Problems with giving a peer allowed_ips: malformed entries and overlaps
+        with other peers (exclude is the peer being edited). Empty if none.
+        """
+        problems = []
+        for entry, network in parse_allowed_ips(allowed_ips):
+            if network is None:
+                problems.append(f"{entry} is not a valid address or CIDR")
+                continue
+            for other, owner in self.overlaps(network):
+                if owner is not exclude:
+                    name = owner.display_name() if hasattr(owner, "display_name") else owner
+                    problems.append(f"{entry} overlaps {format_network(other)} of {name}")
+        return problems
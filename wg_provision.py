@@ -0,0 +1,173 @@
+import csv
+import os
+import shutil
+import tempfile
+import time
+
+from wg_prefix import PrefixIndex
+from wg_render import write_artifacts
+
+# Bulk client provisioning: CSV in, one config commit, artifacts out.
+#
+#   1. read names (and optional addresses) from a CSV
+#   2. allocate every missing address in one allocator pass
+#   3. generate all keypairs in one batch
+#   4. render each client's .conf and QR PNG (wg_render, on a process pool)
+#      into a staging directory next to the output
+#   5. commit every new [Peer] with a single config write, then move the
+#      artifacts into place; a peer is never added without its private key
+#      having been written out
+#   6. apply the new peers to the running tunnel once
+
+
+class ProvisionError(Exception):
+    pass
+
+
+class ProvisionResult:
+    def __init__(self):
+        self.clients = []
+        self.output = None
+        self.applied = None
+        self.timings = {}
+        self.elapsed = 0.0
+
+    @property
+    def clients_per_second(self):
+        return len(self.clients) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        phases = ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in self.timings.items())
+        return (f"Provisioned {len(self.clients)} clients in {self.elapsed:.2f}s "
+                f"({self.clients_per_second:.1f} clients/s). {phases}")
+
+
+def read_clients_csv(path):
+    """ Return [(name, address or None)] from a CSV with a name and optional address column """
+    clients = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for i, row in enumerate(csv.reader(f)):
+            row = [c.strip() for c in row]
+            if not row or not row[0] or row[0].startswith('#'):
+                continue
+            # Optional header row
+            if i == 0 and row[0].lower() == 'name':
+                continue
+            address = row[1] if len(row) > 1 and row[1] else None
+            clients.append((row[0], address))
+    return clients
+
+
+# Share of the total run reported after each phase
+PROGRESS = {"allocate": 0.1, "keys": 0.3, "render": 0.8, "commit": 0.9, "apply": 1.0}
+
+
+def provision_clients(manager, clients, output, with_qr=True, workers=None, apply=True, progress=None):
+    """
+    clients: [(name, address or None)]. output: directory or .zip path.
+    Returns a ProvisionResult; raises ProvisionError before anything is written
+    if the input is invalid. progress(fraction, message) is called after each
+    phase; returning False before the commit cancels without writing anything.
+    """
+    result = ProvisionResult()
+    started = time.perf_counter()
+
+    def phase(label, t0):
+        result.timings[label] = time.perf_counter() - t0
+        return time.perf_counter()
+
+    def report(label):
+        return progress is None or progress(PROGRESS[label], f"{label} done") is not False
+
+    t = time.perf_counter()
+    if not clients:
+        raise ProvisionError("No clients to provision")
+    config = manager.get_config()
+    names = set()
+    requested = PrefixIndex()
+    for name, address in clients:
+        if name in names or config.peer_by_name(name) is not None:
+            raise ProvisionError(f"Duplicate client name: {name}")
+        names.add(name)
+        if address:
+            # Overlaps with earlier rows, then with existing peers and the interface's own address
+            problems = requested.conflicts(address) or manager.check_allowed_ips(address)
+            if problems:
+                raise ProvisionError(f"Address not usable for {name}: {problems[0]}")
+            requested.add(address, name)
+
+    # Explicit addresses are taken out of the pool before the rest is allocated
+    allocator = manager.get_allocator()
+    explicit = [address for _, address in clients if address]
+    for address in explicit:
+        allocator.mark_used(address)
+    missing = len(clients) - len(explicit)
+    try:
+        allocated = manager.allocate_ips(missing) if missing else []
+    except Exception as e:
+        manager.release_ips(explicit)
+        raise ProvisionError(str(e))
+    t = phase("allocate", t)
+    if not report("allocate"):
+        manager.release_ips(explicit + allocated)
+        raise ProvisionError("Cancelled")
+
+    keypairs = manager.generate_keypairs(len(clients))
+    if len(keypairs) != len(clients):
+        manager.release_ips(explicit + allocated)
+        raise ProvisionError("Could not generate keys")
+    t = phase("keys", t)
+    if not report("keys"):
+        manager.release_ips(explicit + allocated)
+        raise ProvisionError("Cancelled")
+
+    pending = iter(allocated)
+    entries = []
+    for (name, address), (priv, pub) in zip(clients, keypairs):
+        address = address or next(pending)
+        entries.append((name, address, priv, pub))
+
+    interface_data = config.interface
+    items = [(name, manager.build_client_config(priv, address, interface_data))
+             for name, address, priv, _ in entries]
+    # Staged on the same filesystem as the output, so moving it in is a rename
+    staging = tempfile.mkdtemp(prefix=".provision-", dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        staged = os.path.join(staging, os.path.basename(os.path.normpath(output)))
+        write_artifacts(items, staged, with_qr=with_qr, workers=workers)
+        t = phase("render", t)
+        if not report("render"):
+            raise ProvisionError("Cancelled")
+        manager.add_peers([(name, {"PublicKey": pub, "AllowedIPs": address})
+                           for name, address, _, pub in entries])
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        manager.release_ips(explicit + allocated)
+        raise
+    try:
+        if os.path.isdir(staged):
+            os.makedirs(output, exist_ok=True)
+            for filename in os.listdir(staged):
+                os.replace(os.path.join(staged, filename), os.path.join(output, filename))
+        else:
+            os.replace(staged, output)
+    except OSError as e:
+        # The peers are committed: keep the staged files, they hold the only copy of the keys
+        raise ProvisionError(f"Clients added, but their configurations are still in {staged}: {e}")
+    shutil.rmtree(staging, ignore_errors=True)
+    result.output = output
+    t = phase("commit", t)
+    report("commit")
+
+    if apply:
+        result.applied = manager.apply_changes()["ok"]
+        t = phase("apply", t)
+        report("apply")
+
+    result.clients = [(name, address, pub) for name, address, _, pub in entries]
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def provision_from_csv(manager, csv_path, output, **kwargs):
+    return provision_clients(manager, read_clients_csv(csv_path), output, **kwargs)
@@ -0,0 +1,205 @@
+import hashlib
+import io
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Client artifacts: the .conf text and its QR code.
+#
+# The QR matrix is built once per config and turned straight into a PIL
+# image (no PNG encode/decode round trip). ArtifactRenderer keeps recent
+# results in a bounded LRU keyed by a hash of the config, and can render on
+# a worker thread so the UI stays responsive. write_artifacts() is the batch
+# path used by bulk provisioning.
+#
+# qrcode and PIL are imported on first use.
+
+QR_BORDER = 2
+QR_BOX_SIZE = 5
+CACHE_SIZE = 64
+# Below this many clients a process pool costs more than it saves
+PARALLEL_THRESHOLD = 32
+
+
+def config_hash(conf_text):
+    return hashlib.sha256(conf_text.encode('utf-8')).hexdigest()
+
+
+def artifact_basename(name):
+    return re.sub(r'[^\w.-]', '_', name.replace(' ', '_')) or "client"
+
+
+def qr_available():
+    # Looked up, not imported: the GUI asks before it needs either
+    from importlib.util import find_spec
+
+    return find_spec("qrcode") is not None and find_spec("PIL") is not None
+
+
+def build_matrix(conf_text, border=QR_BORDER):
+    """ QR modules as a list of rows of bools (True = dark), border included """
+    import qrcode
+
+    qr = qrcode.QRCode(border=border)
+    qr.add_data(conf_text)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def matrix_image(matrix, box_size=QR_BOX_SIZE, size=None):
+    """
+    1-bit PIL image of the matrix, box_size pixels per module, or scaled to
+    exactly size x size pixels when size is given.
+    """
+    from PIL import Image
+
+    n = len(matrix)
+    data = bytes(0 if dark else 255 for row in matrix for dark in row)
+    image = Image.frombytes('L', (n, n), data).convert('1')
+    target = size or n * box_size
+    return image.resize((target, target), Image.NEAREST)
+
+
+def png_bytes(matrix, box_size=QR_BOX_SIZE):
+    buf = io.BytesIO()
+    matrix_image(matrix, box_size).save(buf, format='PNG', optimize=False)
+    return buf.getvalue()
+
+
+class Artifact:
+    __slots__ = ("key", "conf_text", "matrix", "images")
+
+    def __init__(self, key, conf_text):
+        self.key = key
+        self.conf_text = conf_text
+        self.matrix = None
+        # Rendered display images by pixel size
+        self.images = {}
+
+    @property
+    def conf_bytes(self):
+        return self.conf_text.encode('utf-8')
+
+
+class ArtifactRenderer:
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.hits = 0
+        self.misses = 0
+
+    def artifact(self, conf_text):
+        key = config_hash(conf_text)
+        with self._lock:
+            artifact = self._cache.get(key)
+            if artifact is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return artifact
+            self.misses += 1
+            artifact = Artifact(key, conf_text)
+            self._cache[key] = artifact
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            return artifact
+
+    def matrix(self, conf_text):
+        artifact = self.artifact(conf_text)
+        if artifact.matrix is None:
+            artifact.matrix = build_matrix(conf_text)
+        return artifact.matrix
+
+    def image(self, conf_text, size=250):
+        """ QR image for display, scaled to size x size pixels """
+        artifact = self.artifact(conf_text)
+        image = artifact.images.get(size)
+        if image is None:
+            image = matrix_image(self.matrix(conf_text), size=size)
+            artifact.images[size] = image
+        return image
+
+    def png(self, conf_text, box_size=QR_BOX_SIZE):
+        return png_bytes(self.matrix(conf_text), box_size)
+
+    def render_async(self, conf_text, callback, size=250):
+        """
+        Render on a worker thread and call callback(image, error) there.
+        GUI callers should hand the result to the UI thread (TaskRunner.post),
+        Tk must not be called from the worker.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="QrRender")
+            executor = self._executor
+
+        def run():
+            try:
+                image = self.image(conf_text, size)
+            except Exception as e:
+                callback(None, e)
+                return
+            callback(image, None)
+        return executor.submit(run)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def render_files(job):
+    """ Process pool worker: (name, conf_text, with_qr, directory) -> [(filename, bytes)] """
+    name, conf_text, with_qr, directory = job
+    base = artifact_basename(name)
+    files = [(f"{base}.conf", conf_text.encode('utf-8'))]
+    if with_qr:
+        files.append((f"{base}.png", png_bytes(build_matrix(conf_text))))
+    if directory is None:
+        return files
+    # Writing from the worker saves shipping every PNG back to the parent
+    for filename, data in files:
+        with open(os.path.join(directory, filename), 'wb') as f:
+            f.write(data)
+    return []
+
+
+def write_artifacts(items, output, with_qr=True, workers=None):
+    """
+    items: [(name, conf_text)]. output: a directory, or a path ending in
+    .zip. QR codes are skipped when qrcode/PIL are not installed. Returns the
+    number of files written.
+    """
+    with_qr = with_qr and qr_available()
+    to_zip = output.lower().endswith('.zip')
+    directory = None if to_zip else output
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    jobs = [(name, conf_text, with_qr, directory) for name, conf_text in items]
+
+    if len(jobs) >= PARALLEL_THRESHOLD:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rendered = list(pool.map(render_files, jobs, chunksize=max(len(jobs) // 64, 1)))
+    else:
+        rendered = [render_files(job) for job in jobs]
+
+    if not to_zip:
+        return len(jobs) * (2 if with_qr else 1)
+    count = 0
+    with zipfile.ZipFile(output, 'w') as zf:
+        for files in rendered:
+            for filename, data in files:
+                # PNG data is already compressed
+                compress = zipfile.ZIP_STORED if filename.endswith('.png') else zipfile.ZIP_DEFLATED
+                zf.writestr(filename, data, compress_type=compress)
+                count += 1
+    return count
@@ -0,0 +1,249 @@
+import os
+import threading
+import time
+
+from wg_instrument import RECORDER
+
+# Every external command (wg, sc, systemctl, wg-quick) goes through a
+# CommandRunner. It resolves executable paths once, applies a timeout to each
+# call so a hung wg.exe can't freeze the app, caps the number of child
+# processes running at the same time and keeps a latency histogram per
+# command. The process-spawning part is a backend callable, so tests and
+# Linux machines without WireGuard can plug in wg_fake.FakeBackend.
+
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_CONCURRENT = 4
+
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+
+class CommandResult:
+    __slots__ = ("args", "returncode", "stdout", "stderr", "duration", "error", "timed_out")
+
+    def __init__(self, args, returncode=None, stdout=b"", stderr=b"", duration=0.0, error=None, timed_out=False):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        # Set when the command could not be run or did not finish
+        self.error = error
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.error is None and self.returncode == 0
+
+    @property
+    def text(self):
+        return self.stdout.decode('utf-8', errors='replace')
+
+    @property
+    def message(self):
+        """ Best description of what went wrong, for error dialogs and logs """
+        if self.error:
+            return self.error
+        output = (self.stderr or self.stdout).decode('utf-8', errors='replace').strip()
+        return output or f"{os.path.basename(self.args[0])} exited with status {self.returncode}"
+
+
+class CommandError(Exception):
+    def __init__(self, result):
+        super().__init__(result.message)
+        self.result = result
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.failures = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds, ok=True):
+        ms = seconds * 1000
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if not ok:
+            self.failures += 1
+
+    def percentile(self, p):
+        """ Upper bound (seconds) of the bucket holding the p-th percentile """
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= target:
+                return min(BUCKETS_MS[i] / 1000, self.max) if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "mean_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+def subprocess_backend(args, input=None, timeout=None):
+    """ Run a real process: (returncode, stdout, stderr); raises TimeoutError or OSError """
+    import subprocess
+
+    kwargs = {}
+    if os.name == "nt":
+        # No console window flashing up for every call from the GUI
+        kwargs["creationflags"] = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+    try:
+        result = subprocess.run(args, input=input, capture_output=True, timeout=timeout, shell=False, **kwargs)
+    except subprocess.TimeoutExpired:
+        raise TimeoutError(f"{os.path.basename(args[0])} did not finish within {timeout:g}s")
+    return result.returncode, result.stdout, result.stderr
+
+
+def subprocess_stream(args, consumer, timeout=None, chunk_size=65536):
+    """ Like subprocess_backend, but stdout is passed to consumer(bytes) as it arrives """
+    import subprocess
+
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+    proc = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            shell=False, **kwargs)
+    expired = threading.Event()
+
+    def kill():
+        expired.set()
+        proc.kill()
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer is not None:
+        timer.daemon = True
+        timer.start()
+    try:
+        with proc:
+            while True:
+                chunk = proc.stdout.read1(chunk_size)
+                if not chunk:
+                    break
+                consumer(chunk)
+            # wg only writes a line or two to stderr, and only on failure
+            stderr = proc.stderr.read()
+            proc.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+    if expired.is_set():
+        raise TimeoutError(f"{os.path.basename(args[0])} did not finish within {timeout:g}s")
+    return proc.returncode, b"", stderr
+
+
+def command_label(args):
+    # "wg show", "sc query", ... used as the histogram key
+    program = os.path.basename(args[0])
+    if program.lower().endswith(".exe"):
+        program = program[:-4]
+    return f"{program} {args[1]}" if len(args) > 1 else program
+
+
+class CommandRunner:
+    def __init__(self, backend=None, max_concurrent=DEFAULT_MAX_CONCURRENT, timeout=DEFAULT_TIMEOUT,
+                 stream_backend=None):
+        if backend is None:
+            backend, stream_backend = subprocess_backend, stream_backend or subprocess_stream
+        self.backend = backend
+        # Optional; without one stream() runs the command normally and passes all output at once
+        self.stream_backend = stream_backend
+        self.timeout = timeout
+        self.max_concurrent = max_concurrent
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._paths = {}
+        self._histograms = {}
+
+    def resolve(self, name, candidates=()):
+        """
+        First existing path among candidates, else `name` found on PATH, else
+        `name` unchanged. Cached until forget() is called.
+        """
+        key = (name, tuple(candidates))
+        path = self._paths.get(key)
+        if path is None:
+            import shutil
+
+            path = next((c for c in candidates if c and os.path.exists(c)), None) or shutil.which(name) or name
+            self._paths[key] = path
+        return path
+
+    def forget(self):
+        self._paths.clear()
+
+    def run(self, args, input=None, timeout=None, check=False, label=None):
+        """ Returns a CommandResult; with check=True raises CommandError unless it succeeded """
+        if isinstance(input, str):
+            input = input.encode('utf-8')
+        return self._call(args, lambda args, timeout: self.backend(args, input, timeout), timeout, check, label)
+
+    def stream(self, args, consumer, timeout=None, check=False, label=None):
+        """
+        Run a command passing its stdout to consumer(bytes) chunk by chunk.
+        The returned CommandResult has empty stdout.
+        """
+        if self.stream_backend is not None:
+            return self._call(args, lambda args, timeout: self.stream_backend(args, consumer, timeout),
+                              timeout, check, label)
+        result = self.run(args, timeout=timeout, check=check, label=label)
+        if result.stdout:
+            consumer(result.stdout)
+            result.stdout = b""
+        return result
+
+    def _call(self, args, call, timeout, check, label):
+        args = [str(a) for a in args]
+        timeout = self.timeout if timeout is None else timeout
+        with self._slots:
+            start = time.perf_counter()
+            try:
+                returncode, stdout, stderr = call(args, timeout)
+                result = CommandResult(args, returncode, stdout or b"", stderr or b"")
+            except TimeoutError as e:
+                result = CommandResult(args, error=str(e), timed_out=True)
+            except OSError as e:
+                result = CommandResult(args, error=str(e))
+            result.duration = time.perf_counter() - start
+
+        label = label or command_label(args)
+        with self._lock:
+            histogram = self._histograms.get(label)
+            if histogram is None:
+                histogram = self._histograms[label] = LatencyHistogram()
+            histogram.record(result.duration, result.ok)
+        RECORDER.record(f"cmd {label}", result.duration, result.error)
+        if check and not result.ok:
+            raise CommandError(result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {label: h.as_dict() for label, h in sorted(self._histograms.items())}
+
+
+_default_runner = None
+
+
+def default_runner():
+    """ Process-wide runner, so the concurrency cap covers every caller """
+    global _default_runner
+    if _default_runner is None:
+        _default_runner = CommandRunner()
+    return _default_runner
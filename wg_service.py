@@ -0,0 +1,295 @@
+import os
+import shutil
+import threading
+import time
+
+from wg_runner import default_runner
+
+# Tunnel service control and status.
+#
+# A ServiceBackend knows how to query/start/stop the tunnel on one platform
+# (Windows `sc`, systemd, plain wg-quick, or an in-memory stub for tests).
+# ServiceStatusWatcher sits in front of it: it caches the status for a short
+# TTL, waits for state transitions with exponential backoff instead of fixed
+# one-second sleeps, and notifies subscribers whenever the status changes.
+
+RUNNING = "Running"
+STOPPED = "Stopped"
+STARTING = "Starting"
+STOPPING = "Stopping"
+UNKNOWN = "Unknown"
+NOT_INSTALLED = "Not Installed"
+
+DEFAULT_TTL = 1.0
+
+
+class ServiceError(Exception):
+    pass
+
+
+class ServiceBackend:
+    name = "base"
+
+    def __init__(self, runner=None):
+        self.runner = runner or default_runner()
+
+    def _run(self, cmd, check=True):
+        # Commands go through the shared CommandRunner (timeouts, concurrency cap, timing)
+        result = self.runner.run([self.runner.resolve(cmd[0])] + cmd[1:])
+        if result.error or (check and result.returncode != 0):
+            raise ServiceError(result.message)
+        return result
+
+    def query(self, interface):
+        raise NotImplementedError
+
+    def start(self, interface):
+        raise NotImplementedError
+
+    def stop(self, interface):
+        raise NotImplementedError
+
+
+class ScServiceBackend(ServiceBackend):
+    """ WireGuard for Windows tunnel services (WireGuardTunnel$<name>) """
+    name = "sc"
+    STATES = {"RUNNING": RUNNING, "STOPPED": STOPPED, "START_PENDING": STARTING, "STOP_PENDING": STOPPING}
+
+    def __init__(self, runner=None, sc_exe="sc"):
+        super().__init__(runner)
+        self.sc_exe = sc_exe
+
+    @staticmethod
+    def service_name(interface):
+        return f"WireGuardTunnel${interface}"
+
+    def query(self, interface):
+        result = self._run([self.sc_exe, "query", self.service_name(interface)], check=False)
+        if result.returncode != 0:
+            return NOT_INSTALLED
+        output = result.stdout.decode(errors='replace')
+        for line in output.splitlines():
+            if "STATE" in line:
+                for token, state in self.STATES.items():
+                    if token in line:
+                        return state
+        return UNKNOWN
+
+    def start(self, interface):
+        self._run([self.sc_exe, "start", self.service_name(interface)])
+
+    def stop(self, interface):
+        self._run([self.sc_exe, "stop", self.service_name(interface)])
+
+
+class SystemdServiceBackend(ServiceBackend):
+    """ wg-quick@<name> units on Linux """
+    name = "systemd"
+    STATES = {"active": RUNNING, "inactive": STOPPED, "failed": STOPPED,
+              "activating": STARTING, "deactivating": STOPPING, "reloading": RUNNING}
+
+    @staticmethod
+    def unit(interface):
+        return f"wg-quick@{interface}.service"
+
+    def query(self, interface):
+        result = self._run(["systemctl", "is-active", self.unit(interface)], check=False)
+        state = result.stdout.decode(errors='replace').strip()
+        if state == "unknown":
+            return NOT_INSTALLED
+        return self.STATES.get(state, UNKNOWN)
+
+    def start(self, interface):
+        self._run(["systemctl", "start", self.unit(interface)])
+
+    def stop(self, interface):
+        self._run(["systemctl", "stop", self.unit(interface)])
+
+
+class WgQuickServiceBackend(ServiceBackend):
+    """ Bare wg-quick without a service manager; running means the interface exists """
+    name = "wg-quick"
+
+    def __init__(self, runner=None, wg_exe="wg", wg_quick="wg-quick"):
+        super().__init__(runner)
+        self.wg_exe = wg_exe
+        self.wg_quick = wg_quick
+
+    def query(self, interface):
+        try:
+            result = self._run([self.wg_exe, "show", interface], check=False)
+        except ServiceError:
+            return NOT_INSTALLED
+        return RUNNING if result.returncode == 0 else STOPPED
+
+    def start(self, interface):
+        self._run([self.wg_quick, "up", interface])
+
+    def stop(self, interface):
+        self._run([self.wg_quick, "down", interface])
+
+
+class StubServiceBackend(ServiceBackend):
+    """ In-memory service for tests; transitions take `delay` seconds """
+    name = "stub"
+
+    def __init__(self, runner=None, state=STOPPED, delay=0.0):
+        super().__init__(runner)
+        self.state = state
+        self.delay = delay
+        self._target = None
+        self._ready_at = 0.0
+        self.calls = []
+
+    def query(self, interface):
+        self.calls.append(("query", interface))
+        if self._target is not None and time.monotonic() >= self._ready_at:
+            self.state = self._target
+            self._target = None
+        return self.state
+
+    def _transition(self, pending, target):
+        self.state = pending
+        self._target = target
+        self._ready_at = time.monotonic() + self.delay
+
+    def start(self, interface):
+        self.calls.append(("start", interface))
+        if self.state == NOT_INSTALLED:
+            raise ServiceError("service not installed")
+        self._transition(STARTING, RUNNING)
+
+    def stop(self, interface):
+        self.calls.append(("stop", interface))
+        if self.state == NOT_INSTALLED:
+            raise ServiceError("service not installed")
+        self._transition(STOPPING, STOPPED)
+
+
+BACKENDS = {
+    "sc": ScServiceBackend,
+    "systemd": SystemdServiceBackend,
+    "wg-quick": WgQuickServiceBackend,
+    "stub": StubServiceBackend,
+}
+
+
+def default_backend_name():
+    if os.name == "nt":
+        return "sc"
+    if shutil.which("systemctl"):
+        return "systemd"
+    return "wg-quick"
+
+
+def create_backend(name=None, runner=None):
+    if not name or name == "auto":
+        name = default_backend_name()
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ServiceError(f"Unknown service backend: {name}")
+    return backend_class(runner)
+
+
+class ServiceStatusWatcher:
+    def __init__(self, backend, interface, ttl=DEFAULT_TTL):
+        self.backend = backend
+        self.interface = interface
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._status = None
+        self._checked_at = 0.0
+        self._subscribers = []
+        self._poll_stop = None
+
+    def status(self, max_age=None):
+        """ Cached status, refreshed when older than max_age (default: the TTL) """
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            if self._status is not None and time.monotonic() - self._checked_at < max_age:
+                return self._status
+        try:
+            status = self.backend.query(self.interface)
+        except ServiceError:
+            status = NOT_INSTALLED
+        self._set_status(status)
+        return status
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
+
+    def _set_status(self, status):
+        with self._lock:
+            changed = status != self._status
+            self._status = status
+            self._checked_at = time.monotonic()
+            subscribers = list(self._subscribers) if changed else []
+        for callback in subscribers:
+            try:
+                callback(status)
+            except Exception as e:
+                print(f"Service status subscriber error: {e}")
+
+    def subscribe(self, callback):
+        """ callback(status) runs on whichever thread saw the change; returns an unsubscribe function """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def wait_for(self, states, timeout=10.0, initial_delay=0.05, max_delay=1.0):
+        """ Poll with exponential backoff until the status is in `states`; returns the last status """
+        if isinstance(states, str):
+            states = (states,)
+        deadline = time.monotonic() + timeout
+        delay = initial_delay
+        while True:
+            status = self.status(max_age=0)
+            if status in states:
+                return status
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return status
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
+    def start(self):
+        self.backend.start(self.interface)
+        self.invalidate()
+
+    def stop(self):
+        self.backend.stop(self.interface)
+        self.invalidate()
+
+    def restart(self, timeout=10.0):
+        # Returns as soon as the service reports Stopped instead of on the next whole second
+        if self.status(max_age=0) not in (STOPPED, NOT_INSTALLED):
+            try:
+                self.backend.stop(self.interface)
+            except ServiceError as e:
+                print(f"Service stop error: {e}")
+            self.wait_for((STOPPED, NOT_INSTALLED), timeout=timeout)
+        self.start()
+
+    def start_polling(self, interval=2.0):
+        """ Background refresh so subscribers hear about changes made outside the app """
+        self.stop_polling()
+        stop = threading.Event()
+        self._poll_stop = stop
+
+        def run():
+            while not stop.wait(interval):
+                self.status(max_age=0)
+
+        threading.Thread(target=run, name="ServiceStatusPoller", daemon=True).start()
+
+    def stop_polling(self):
+        if self._poll_stop is not None:
+            self._poll_stop.set()
+            self._poll_stop = None
@@ -0,0 +1,302 @@
+import heapq
+import math
+import os
+import threading
+import time
+
+from wg_instrument import instrument
+
+# Gatekeeper sessions (docs/TECHNICAL_SPECIFICATION.md): once a user has
+# passed the OTP check their peer is switched on with
+#
+#   wg set <iface> peer <public key> allowed-ips <address>
+#
+# and switched off again (`peer <public key> remove`) when the session runs
+# out, 8-12 hours later.
+#
+# Expiry times are kept in a heap, so starting a session is O(log n) however
+# many are running. Renewing or ending a session leaves its old heap entry in
+# place; entries are checked against the live session when they are popped.
+# Everything due within the same `resolution` window is switched off with one
+# `wg set`, split only when the command line would get too long.
+#
+# Every change is appended to a journal, one short line per event:
+#
+#   A <expires> <public key> <address> [label]
+#   R <public key>
+#
+# which is replayed on start, so a restart neither drops live sessions nor
+# lets expired ones linger. Once dead lines outnumber the live sessions the
+# journal is rewritten with just the live ones.
+#
+# Peers with a session are not expected to be in wg0.conf; apply_changes()
+# leaves them alone.
+
+DEFAULT_HOURS = 8
+# Expiries this close together go out in the same `wg set`
+DEFAULT_RESOLUTION = 1.0
+# Delay before retrying expiries whose `wg set` failed
+RETRY_SECONDS = 30
+# Never compact journals shorter than this
+COMPACT_MIN_LINES = 1024
+
+
+def normalize_address(address):
+    """
+    "10.0.0.5, fd00::5" -> "10.0.0.5/32,fd00::5/128", so it stays one word
+    of a journal line. Raises ValueError for anything that isn't a network.
+    """
+    import ipaddress
+
+    entries = [entry.strip() for entry in address.split(",") if entry.strip()]
+    if not entries:
+        raise ValueError("no address")
+    return ",".join(str(ipaddress.ip_network(entry, strict=False)) for entry in entries)
+
+
+class Session:
+    __slots__ = ("public_key", "address", "expires_at", "label")
+
+    def __init__(self, public_key, address, expires_at, label=""):
+        self.public_key = public_key
+        self.address = address
+        self.expires_at = expires_at
+        self.label = label
+
+    def journal_line(self):
+        return f"A {int(self.expires_at)} {self.public_key} {self.address}{' ' + self.label if self.label else ''}\n"
+
+    def as_dict(self):
+        return {"public_key": self.public_key, "address": self.address,
+                "expires_at": self.expires_at, "label": self.label}
+
+
+class SessionScheduler:
+    def __init__(self, manager, journal_path=None, hours=DEFAULT_HOURS, resolution=DEFAULT_RESOLUTION):
+        self.manager = manager
+        self.journal_path = journal_path
+        self.duration = hours * 3600
+        self.resolution = resolution
+        self._sessions = {}
+        # (expires_at, sequence, Session); the sequence keeps ties from comparing sessions
+        self._heap = []
+        self._sequence = 0
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._journal = None
+        self._journal_lines = 0
+        self._stop = None
+        self._thread = None
+        if journal_path:
+            self._replay()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, public_key):
+        return self._sessions.get(public_key)
+
+    def is_active(self, public_key):
+        return public_key in self._sessions
+
+    def sessions(self):
+        with self._lock:
+            return sorted(self._sessions.values(), key=lambda s: s.expires_at)
+
+    def next_expiry(self):
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def activate(self, public_key, address, hours=None, label="", expires_at=None):
+        """ Switch the peer on for `hours` (or until expires_at); returns the Session or None """
+        sessions = self.activate_many([(public_key, address, label)], hours, expires_at)
+        return sessions[0] if sessions else None
+
+    def activate_many(self, entries, hours=None, expires_at=None):
+        """
+        Start or renew sessions for (public_key, address, label) entries with a
+        single `wg set`. Returns the new Sessions, or [] if wg failed.
+        """
+        if expires_at is None:
+            expires_at = time.time() + (self.duration if hours is None else hours * 3600)
+        new = []
+        for key, address, label in entries:
+            # Every field must stay one word of the journal line; labels (usually the user's email) are joined up
+            try:
+                if not key or len(key.split()) != 1:
+                    raise ValueError("bad public key")
+                address = normalize_address(address)
+            except ValueError as e:
+                print(f"Session for {key} not started: {e}")
+                continue
+            new.append(Session(key, address, expires_at, " ".join(label.split())))
+        if not new:
+            return []
+        with self._lock:
+            if not self._wg_set([["peer", s.public_key, "allowed-ips", s.address] for s in new]):
+                return []
+            for session in new:
+                self._sessions[session.public_key] = session
+                self._push(expires_at, session)
+            self._append("".join(s.journal_line() for s in new))
+            self._changed.notify_all()
+        return new
+
+    def revoke(self, public_key):
+        """ End a session now; returns False if there is none or wg failed """
+        with self._lock:
+            if public_key not in self._sessions:
+                return False
+            if not self._wg_set([["peer", public_key, "remove"]]):
+                return False
+            del self._sessions[public_key]
+            self._append(f"R {public_key}\n")
+            self._changed.notify_all()
+        return True
+
+    @instrument("sessions.expire")
+    def expire_due(self, now=None):
+        """ Switch off every session due by `now` with one `wg set`; returns the expired Sessions """
+        now = time.time() if now is None else now
+        with self._lock:
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                _, _, session = heapq.heappop(self._heap)
+                if self._sessions.get(session.public_key) is session:
+                    due.append(session)
+            if not due:
+                return []
+            if not self._wg_set([["peer", s.public_key, "remove"] for s in due]):
+                for session in due:
+                    self._push(now + RETRY_SECONDS, session)
+                return []
+            for session in due:
+                del self._sessions[session.public_key]
+            self._append("".join(f"R {s.public_key}\n" for s in due))
+        return due
+
+    def resync(self):
+        """
+        Switch all live sessions on again, e.g. after the tunnel service was
+        restarted and came back with only the peers from wg0.conf.
+        """
+        with self._lock:
+            return self._wg_set([["peer", s.public_key, "allowed-ips", s.address]
+                                 for s in self._sessions.values()])
+
+    def start(self, resync=True):
+        """ Expire sessions on a background thread until stop() """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if resync and self._sessions:
+            self.resync()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name="SessionScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+            with self._lock:
+                self._changed.notify_all()
+        self._thread = None
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def _run(self, stop):
+        while not stop.is_set():
+            with self._lock:
+                due = self.next_expiry()
+                now = time.time()
+                if due is None or due > now:
+                    # Wake at the end of the resolution window holding the next expiry
+                    wake = None if due is None else math.ceil(due / self.resolution) * self.resolution - now
+                    self._changed.wait(wake)
+                    continue
+            try:
+                self.expire_due()
+            except Exception as e:
+                print(f"Session expiry error: {e}")
+                stop.wait(RETRY_SECONDS)
+
+    def _push(self, expires_at, session):
+        self._sequence += 1
+        heapq.heappush(self._heap, (expires_at, self._sequence, session))
+        # Renewals leave dead entries behind; drop them once they dominate
+        if len(self._heap) > 2 * len(self._sessions) + 64:
+            self._heap = [entry for entry in self._heap if self._sessions.get(entry[2].public_key) is entry[2]]
+            heapq.heapify(self._heap)
+
+    def _drop_stale(self):
+        while self._heap and self._sessions.get(self._heap[0][2].public_key) is not self._heap[0][2]:
+            heapq.heappop(self._heap)
+
+    def _wg_set(self, groups):
+        if not groups:
+            return True
+        return self.manager.set_peers(groups)[0]
+
+    def _replay(self):
+        sessions = {}
+        lines = 0
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    parts = line.rstrip("\n").split(" ", 4)
+                    # A torn last line from a crash is skipped
+                    if parts[0] == "A" and len(parts) >= 4 and line.endswith("\n"):
+                        try:
+                            expires_at = int(parts[1])
+                        except ValueError:
+                            continue
+                        sessions[parts[2]] = Session(parts[2], parts[3], expires_at,
+                                                     parts[4] if len(parts) > 4 else "")
+                    elif parts[0] == "R" and len(parts) == 2:
+                        sessions.pop(parts[1], None)
+        except FileNotFoundError:
+            pass
+        self._sessions = sessions
+        self._heap = [(s.expires_at, i, s) for i, s in enumerate(sessions.values())]
+        heapq.heapify(self._heap)
+        self._sequence = len(self._heap)
+        self._journal_lines = lines
+
+    def _append(self, text):
+        if not self.journal_path:
+            return
+        try:
+            if self._journal is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+                self._journal = open(self.journal_path, "a", encoding="utf-8", newline="\n")
+            # Flushed, not fsynced: losing the last lines to a power cut only
+            # means a user logs in again or an expiry is sent twice
+            self._journal.write(text)
+            self._journal.flush()
+        except OSError as e:
+            print(f"Session journal error: {e}")
+            return
+        self._journal_lines += text.count("\n")
+        if self._journal_lines > max(COMPACT_MIN_LINES, 2 * len(self._sessions)):
+            self.compact()
+
+    def compact(self):
+        """ Rewrite the journal with only the live sessions """
+        from wg_config import atomic_write
+
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            try:
+                atomic_write(self.journal_path, "".join(s.journal_line() for s in self.sessions()), backup=False)
+            except OSError as e:
+                print(f"Session journal error: {e}")
+                return
+            self._journal_lines = len(self._sessions)
@@ -0,0 +1,206 @@
+import heapq
+import time
+from array import array
+
+# Per-peer live throughput from successive `wg show dump` samples.
+#
+# Samples live in flat struct-of-arrays ring buffers instead of per-sample
+# dicts: one shared timestamp ring, and for every peer slot a fixed window
+# of `capacity` entries in the rx/tx/handshake arrays. Counters are stored
+# made monotonic (a restart of the tunnel that resets rx/tx is folded into a
+# per-peer offset), so any rate over any window is just the difference of
+# two entries, O(1) per peer.
+#
+# Memory bound: each sample costs 8 (rx) + 8 (tx) + 4 (handshake) = 20 bytes
+# per peer, plus 8 bytes per tick for the shared timestamp. Per peer there
+# are ~50 more bytes of fixed state (offsets, last raw counters, rates).
+# 10k peers x 1 hour at 5 s resolution (capacity=720):
+#     10,000 * 720 * 20 B  = 144,000,000 B  (~137 MiB)
+#     + 720 * 8 B + 10,000 * ~50 B (<1 MiB)
+# Memory grows linearly with capacity and with the number of peers seen.
+
+DEFAULT_CAPACITY = 720
+DEFAULT_AVERAGE_WINDOW = 12
+
+
+class ThroughputEngine:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.ticks = 0
+        # Oldest tick still in the rings; only moves on its own once they wrap, or on resize()
+        self._kept_from = 0
+        self.slots = {}
+        self.keys = []
+        self._ts = array('d', [0.0]) * capacity
+        self._rx = array('Q')
+        self._tx = array('Q')
+        self._hs = array('I')
+        # Per slot state
+        self._first_tick = array('q')
+        self._rx_offset = array('Q')
+        self._tx_offset = array('Q')
+        self._rx_last = array('Q')
+        self._tx_last = array('Q')
+        self.rx_rate = array('d')
+        self.tx_rate = array('d')
+
+    def memory_bytes(self):
+        arrays = (self._ts, self._rx, self._tx, self._hs, self._first_tick, self._rx_offset,
+                  self._tx_offset, self._rx_last, self._tx_last, self.rx_rate, self.tx_rate)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    def _slot(self, public_key):
+        slot = self.slots.get(public_key)
+        if slot is not None:
+            return slot
+        slot = len(self.keys)
+        self.slots[public_key] = slot
+        self.keys.append(public_key)
+        cap = self.capacity
+        self._rx.extend(array('Q', [0]) * cap)
+        self._tx.extend(array('Q', [0]) * cap)
+        self._hs.extend(array('I', [0]) * cap)
+        for a in (self._rx_offset, self._tx_offset, self._rx_last, self._tx_last):
+            a.append(0)
+        self._first_tick.append(self.ticks)
+        self.rx_rate.append(0.0)
+        self.tx_rate.append(0.0)
+        return slot
+
+    def resize(self, capacity):
+        """ Change the window to `capacity` ticks, keeping the newest samples that fit """
+        old = self.capacity
+        if capacity == old:
+            return
+        keep = min(self.ticks, old, capacity)
+        first = self.ticks - keep
+
+        def move(src, dst, src_base, dst_base):
+            # Tick t sits at t % capacity, so the kept ticks may wrap in both rings
+            start = first % old
+            n = min(keep, old - start)
+            linear = src[src_base + start:src_base + start + n] + src[src_base:src_base + keep - n]
+            start = first % capacity
+            n = min(keep, capacity - start)
+            dst[dst_base + start:dst_base + start + n] = linear[:n]
+            dst[dst_base:dst_base + keep - n] = linear[n:]
+
+        ts = array('d', [0.0]) * capacity
+        move(self._ts, ts, 0, 0)
+        resized = []
+        for a in (self._rx, self._tx, self._hs):
+            b = array(a.typecode, [0]) * (capacity * len(self.keys))
+            for slot in range(len(self.keys)):
+                move(a, b, slot * old, slot * capacity)
+            resized.append(b)
+        self._ts = ts
+        self._rx, self._tx, self._hs = resized
+        self.capacity = capacity
+        self._kept_from = first
+
+    @staticmethod
+    def _monotonic(raw, last, offset):
+        # A counter that went backwards means the tunnel restarted
+        if raw < last:
+            offset += last
+        return raw + offset, offset
+
+    def record(self, peers, timestamp=None):
+        """ Add one tick. peers: iterable of (public_key, rx, tx, handshake) """
+        timestamp = time.time() if timestamp is None else timestamp
+        cap = self.capacity
+        head = self.ticks % cap
+        prev = (self.ticks - 1) % cap
+        self._ts[head] = timestamp
+        elapsed = timestamp - self._ts[prev] if self.ticks else 0.0
+
+        rx, tx, hs = self._rx, self._tx, self._hs
+        seen = bytearray(len(self.keys))
+        for public_key, rx_raw, tx_raw, handshake in peers:
+            slot = self._slot(public_key)
+            if slot >= len(seen):
+                seen.extend(b'\0' * (slot + 1 - len(seen)))
+            seen[slot] = 1
+            base = slot * cap
+
+            rx_val, self._rx_offset[slot] = self._monotonic(rx_raw, self._rx_last[slot], self._rx_offset[slot])
+            tx_val, self._tx_offset[slot] = self._monotonic(tx_raw, self._tx_last[slot], self._tx_offset[slot])
+            self._rx_last[slot] = rx_raw
+            self._tx_last[slot] = tx_raw
+
+            fresh = self._first_tick[slot] == self.ticks
+            if not fresh and elapsed > 0:
+                self.rx_rate[slot] = (rx_val - rx[base + prev]) / elapsed
+                self.tx_rate[slot] = (tx_val - tx[base + prev]) / elapsed
+            rx[base + head] = rx_val
+            tx[base + head] = tx_val
+            hs[base + head] = handshake
+
+        # Peers missing from this dump carry their last value forward
+        for slot in range(len(self.keys)):
+            if slot < len(seen) and seen[slot]:
+                continue
+            base = slot * cap
+            if self._first_tick[slot] < self.ticks:
+                rx[base + head] = rx[base + prev]
+                tx[base + head] = tx[base + prev]
+                hs[base + head] = hs[base + prev]
+            self.rx_rate[slot] = 0.0
+            self.tx_rate[slot] = 0.0
+
+        self.ticks += 1
+
+    def record_dump(self, dump, timestamp=None):
+        # Convenience for the list of dicts returned by get_wg_show_dump()
+        self.record(((p['public_key'], p['transfer_rx'], p['transfer_tx'], p['latest_handshake']) for p in dump),
+                    timestamp)
+
+    def _oldest(self, slot):
+        # First tick with a sample of this slot in the rings
+        return max(self._first_tick[slot], self.ticks - self.capacity, self._kept_from)
+
+    def rate(self, public_key):
+        """ Current (rx, tx) bytes/s, measured over the last tick """
+        slot = self.slots.get(public_key)
+        if slot is None:
+            return 0.0, 0.0
+        return self.rx_rate[slot], self.tx_rate[slot]
+
+    def average_rate(self, public_key, window=DEFAULT_AVERAGE_WINDOW):
+        """ Mean (rx, tx) bytes/s over the last `window` ticks """
+        slot = self.slots.get(public_key)
+        if slot is None or self.ticks < 2:
+            return 0.0, 0.0
+        # Limited by the samples held and by how long the peer has been tracked
+        window = min(window, self.ticks - 1 - self._oldest(slot))
+        if window <= 0:
+            return 0.0, 0.0
+        cap = self.capacity
+        head = (self.ticks - 1) % cap
+        old = (self.ticks - 1 - window) % cap
+        elapsed = self._ts[head] - self._ts[old]
+        if elapsed <= 0:
+            return 0.0, 0.0
+        base = slot * cap
+        return ((self._rx[base + head] - self._rx[base + old]) / elapsed,
+                (self._tx[base + head] - self._tx[base + old]) / elapsed)
+
+    def history(self, public_key):
+        """ List of (timestamp, rx, tx, handshake) for the retained window, oldest first """
+        slot = self.slots.get(public_key)
+        if slot is None:
+            return []
+        cap = self.capacity
+        count = self.ticks - self._oldest(slot)
+        base = slot * cap
+        samples = []
+        for t in range(self.ticks - count, self.ticks):
+            i = t % cap
+            samples.append((self._ts[i], self._rx[base + i], self._tx[base + i], self._hs[base + i]))
+        return samples
+
+    def top_talkers(self, n=5):
+        """ The n peers with the highest current rx+tx rate, as (public_key, rx, tx) """
+        rx_rate, tx_rate = self.rx_rate, self.tx_rate
+        best = heapq.nlargest(n, range(len(self.keys)), key=lambda s: rx_rate[s] + tx_rate[s])
+        return [(self.keys[s], rx_rate[s], tx_rate[s]) for s in best if rx_rate[s] + tx_rate[s] > 0]
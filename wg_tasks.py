@@ -0,0 +1,253 @@
+import queue
+import threading
+import time
+from collections import deque
+
+# Background execution of blocking manager calls for the GUI.
+#
+# Tasks run on a small thread pool. Each task is in a lane, normally the
+# tunnel name: tasks in one lane run one after the other, in the order they
+# were submitted, so an edit is written before the restart that follows it;
+# different lanes run in parallel. A task submitted with a key replaces a
+# task with the same key still waiting in its lane. It goes to the end of
+# the lane and the replaced task's callbacks move over to it. Five quick
+# edits that each ask for an apply therefore run the five edits and then one
+# apply. Every caller gets that apply's result, once per distinct set of
+# callbacks, so the GUI passing the same bound method five times shows one
+# message box.
+#
+# Nothing here touches Tk. Results, errors and progress are queued, and
+# pump() delivers them on the thread that calls it; post() queues any other
+# call from a worker thread the same way. App calls pump() from an
+# after() loop, so callbacks run on the Tk thread and the main loop never
+# waits on sc, wg or a config write.
+
+DEFAULT_WORKERS = 4
+PENDING, RUNNING, DONE, FAILED, CANCELLED = "pending", "running", "done", "failed", "cancelled"
+
+_current = threading.local()
+
+
+def current_task():
+    """ The Task running on this thread, None outside of a TaskRunner worker """
+    return getattr(_current, "task", None)
+
+
+class Task:
+    __slots__ = ("label", "lane", "key", "fn", "args", "state", "progress", "message", "result", "error",
+                 "submitted_at", "started_at", "finished_at", "callbacks", "_cancel", "_runner", "_notified")
+
+    def __init__(self, runner, fn, args, lane, key, label):
+        self.label = label
+        self.lane = lane
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.state = PENDING
+        # 0..1 or None when the task doesn't report any
+        self.progress = None
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        # (on_done, on_error, on_progress) of every caller this task stands for
+        self.callbacks = []
+        self._cancel = threading.Event()
+        self._runner = runner
+        self._notified = False
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    def cancel(self):
+        """
+        Ask the task to stop. A waiting task is dropped; a running one only
+        stops if it checks `cancelled` (or report()'s return value).
+        """
+        self._cancel.set()
+        self._runner._drop(self)
+
+    def report(self, fraction=None, message=None):
+        """ Progress from inside the task; returns False once it has been cancelled """
+        if fraction is not None:
+            self.progress = max(0.0, min(1.0, fraction))
+        if message is not None:
+            self.message = message
+        self._runner._notify(self)
+        return not self.cancelled
+
+    def describe(self):
+        text = self.label or getattr(self.fn, "__name__", "task")
+        if self.message:
+            text += f": {self.message}"
+        if self.progress is not None and self.state == RUNNING:
+            text += f" ({self.progress * 100:.0f}%)"
+        return text
+
+
+class TaskRunner:
+    def __init__(self, max_workers=DEFAULT_WORKERS, on_change=None):
+        self.max_workers = max_workers
+        # on_change(task) after pump() delivered anything about task, e.g. to redraw a status line
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._lanes = {}
+        self._busy_lanes = set()
+        self._running = set()
+        self._executor = None
+        self._events = queue.SimpleQueue()
+        self.coalesced = 0
+
+    def submit(self, fn, *args, lane=None, key=None, label="", on_done=None, on_error=None, on_progress=None):
+        """
+        Run fn(*args) in the background. on_done(result), on_error(exception)
+        and on_progress(task) are called from pump(). Without a lane the task
+        only waits for a free worker.
+        """
+        with self._lock:
+            task = Task(self, fn, args, lane, key, label)
+            if lane is None:
+                task.lane = lane = task
+            pending = self._lanes.setdefault(lane, deque())
+            if key is not None:
+                for earlier in [t for t in pending if t.key == key]:
+                    pending.remove(earlier)
+                    task.callbacks.extend(earlier.callbacks)
+                    earlier.state = CANCELLED
+                    self.coalesced += 1
+            if (on_done, on_error, on_progress) not in task.callbacks:
+                task.callbacks.append((on_done, on_error, on_progress))
+            pending.append(task)
+            self._schedule(lane)
+        return task
+
+    def _schedule(self, lane):
+        # With self._lock held
+        pending = self._lanes.get(lane)
+        if lane in self._busy_lanes or not pending:
+            if not pending:
+                self._lanes.pop(lane, None)
+            return
+        task = pending.popleft()
+        self._busy_lanes.add(lane)
+        self._running.add(task)
+        task.state = RUNNING
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="task")
+        self._executor.submit(self._run, task)
+
+    def _run(self, task):
+        _current.task = task
+        task.started_at = time.monotonic()
+        try:
+            if task.cancelled:
+                task.state = CANCELLED
+            else:
+                task.result = task.fn(*task.args)
+                task.state = CANCELLED if task.cancelled else DONE
+        except Exception as e:
+            task.error = e
+            # A task stopping because it was cancelled isn't reported as a failure
+            task.state = CANCELLED if task.cancelled else FAILED
+        finally:
+            _current.task = None
+            task.finished_at = time.monotonic()
+            with self._lock:
+                self._running.discard(task)
+                self._busy_lanes.discard(task.lane)
+                self._schedule(task.lane)
+            self._events.put((task, True))
+
+    def _drop(self, task):
+        with self._lock:
+            pending = self._lanes.get(task.lane)
+            if task.state != PENDING or pending is None or task not in pending:
+                return
+            pending.remove(task)
+            task.state = CANCELLED
+            if not pending and task.lane not in self._busy_lanes:
+                self._lanes.pop(task.lane, None)
+        self._events.put((task, True))
+
+    def _notify(self, task):
+        # Progress is delivered once per pump(), however often the task reports
+        with self._lock:
+            if task._notified:
+                return
+            task._notified = True
+        self._events.put((task, False))
+
+    def post(self, fn, *args):
+        """ Call fn(*args) from the next pump(); safe from any thread, e.g. a watcher's callback """
+        self._events.put((None, (fn, args)))
+
+    def pump(self):
+        """ Deliver queued results, progress and posted calls; call from the UI thread. Returns how many were delivered. """
+        delivered = 0
+        while True:
+            try:
+                task, final = self._events.get_nowait()
+            except queue.Empty:
+                return delivered
+            delivered += 1
+            if task is None:
+                # From post(): final is (fn, args)
+                fn, args = final
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print(f"Error in posted call {getattr(fn, '__name__', fn)}: {e}")
+                continue
+            if not final:
+                with self._lock:
+                    task._notified = False
+                if task.finished:
+                    # The result is queued behind this
+                    continue
+            for on_done, on_error, on_progress in task.callbacks:
+                try:
+                    if not final:
+                        if on_progress is not None:
+                            on_progress(task)
+                    elif task.state == DONE and on_done is not None:
+                        on_done(task.result)
+                    elif task.state == FAILED and on_error is not None:
+                        on_error(task.error)
+                    elif task.state == FAILED:
+                        print(f"Background task {task.describe()} failed: {task.error}")
+                except Exception as e:
+                    print(f"Error in task callback for {task.describe()}: {e}")
+            if self.on_change is not None:
+                self.on_change(task)
+
+    def active(self):
+        """ Running tasks, then waiting ones, oldest first """
+        with self._lock:
+            waiting = [t for pending in self._lanes.values() for t in pending]
+            return sorted(self._running, key=lambda t: t.started_at or 0) + sorted(waiting, key=lambda t: t.submitted_at)
+
+    def cancel_all(self):
+        for task in self.active():
+            task.cancel()
+
+    def wait(self, timeout=None):
+        """ Block until nothing is running or waiting (for scripts and benchmarks) """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.active():
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def shutdown(self):
+        self.cancel_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
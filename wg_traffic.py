@@ -0,0 +1,365 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+from wg_config import FileLock
+
+# Per-peer traffic history on disk, round-robin style.
+#
+# Every sample of the rx/tx counters from `wg show dump` is turned into
+# bytes transferred since the previous sample, and that is added to the
+# current bucket of four archives at once:
+#
+#   archive  bucket   rows   covers
+#   raw      10 s      360   1 hour
+#   1m       1 min    1440   1 day
+#   1h       1 hour    840   35 days
+#   1d       1 day     400   400 days
+#
+# Each archive is one fixed-record file, memory-mapped: a header, one
+# bucket number per row (which bucket the row holds now), then per peer slot
+# `rows` rx totals followed by `rows` tx totals, 8 bytes each. A row is
+# reused when its bucket comes round again, so the files never grow with
+# time, only with the number of peers ever seen (slots are added 256 at a
+# time and are not reclaimed when a peer is removed).
+#
+# Size: 3,040 rows x 16 bytes = 48,640 bytes per slot, plus 24 KB of bucket
+# numbers and a few bytes per peer for its key and last counters:
+#
+#   1,000 peers (1,024 slots)    ~50 MB
+#   5,000 peers (5,120 slots)   ~249 MB
+#
+# The last raw counters of every peer are kept in a one-row archive
+# ("counters"), so traffic between two runs of the app is still counted.
+# A counter lower than last time means the tunnel restarted: the new value
+# is all traffic since then. A peer's first sample only sets its baseline.
+#
+# Range queries sum the rows of one archive, the finest one that still holds
+# the start of the range, so their resolution is that archive's bucket. All
+# processes using one directory (the GUI and a scheduled `wg_cli.py traffic
+# record`) take a lock file while reading or writing.
+#
+# Windows can't resize a file that another process has mapped, so adding
+# slots moves an archive to a new file, <name>-<slots>.rra, and marks the
+# old one with the new capacity; other processes notice that and map the
+# newest file. Old files are removed once nobody has them mapped.
+
+ARCHIVES = (("raw", 10, 360), ("1m", 60, 1440), ("1h", 3600, 840), ("1d", 86400, 400))
+SLOT_CHUNK = 256
+MAGIC = b"WGRRA1\0\0"
+HEADER = struct.Struct("<8sQQQ")
+
+
+def store_size(peers, archives=ARCHIVES):
+    """ Bytes on disk for this many peers, excluding the list of keys """
+    slots = -(-max(peers, 1) // SLOT_CHUNK) * SLOT_CHUNK
+    return sum(HEADER.size + rows * 8 + slots * rows * 16 for _, _, rows in archives + (("counters", 0, 1),))
+
+
+class _Archive:
+    __slots__ = ("directory", "name", "step", "rows", "capacity", "path", "_file", "_map", "_view", "buckets", "data")
+
+    def __init__(self, directory, name, step, rows, capacity):
+        self.directory = directory
+        self.name = name
+        self.step = step
+        self.rows = rows
+        self.path = None
+        self._file = self._map = self._view = None
+        if not self._files():
+            with open(os.path.join(directory, f"{name}.rra"), "wb") as f:
+                f.write(HEADER.pack(MAGIC, step, rows, capacity))
+                f.truncate(self._size(capacity))
+        self._open()
+        if self.capacity < capacity:
+            self.grow(capacity)
+
+    def _size(self, capacity):
+        return HEADER.size + self.rows * 8 + capacity * self.rows * 16
+
+    def _files(self):
+        # {number in the name: file name}; the first file has none
+        files = {}
+        prefix = self.name + "-"
+        for entry in os.listdir(self.directory):
+            if entry == self.name + ".rra":
+                files[0] = entry
+            elif entry.startswith(prefix) and entry.endswith(".rra") and entry[len(prefix):-4].isdigit():
+                files[int(entry[len(prefix):-4])] = entry
+        return files
+
+    def _open(self):
+        files = self._files()
+        self.path = os.path.join(self.directory, files.pop(max(files)))
+        for entry in files.values():
+            try:
+                os.remove(os.path.join(self.directory, entry))
+            except OSError:
+                # Still mapped by another process (Windows); a later open removes it
+                pass
+        self._file = open(self.path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, step, rows, capacity = HEADER.unpack_from(self._map)
+        if magic != MAGIC or (step, rows) != (self.step, self.rows) or len(self._map) < self._size(capacity):
+            self.close()
+            raise ValueError(f"{self.path} is not a {self.name} traffic archive")
+        self.capacity = capacity
+        self._view = memoryview(self._map)
+        # Views on the mapping: a row r of slot s is data[2 * s * rows + r] (rx)
+        # and data[(2 * s + 1) * rows + r] (tx), so data[r::rows] is row r of every slot
+        ring_end = HEADER.size + self.rows * 8
+        self.buckets = self._view[HEADER.size:ring_end].cast('q')
+        self.data = self._view[ring_end:self._size(capacity)].cast('Q')
+
+    def close(self):
+        for view in (self.buckets, self.data, self._view):
+            if view is not None:
+                view.release()
+        self.buckets = self.data = self._view = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stale(self):
+        # Another process added slots, see grow()
+        return HEADER.unpack_from(self._map)[3] != self.capacity
+
+    def reopen(self):
+        self.close()
+        self._open()
+
+    def grow(self, capacity):
+        # With the file lock held. Slots are laid out one after another, so the
+        # new file is this one plus zeroed slots; the old file is not resized,
+        # other processes may have it mapped.
+        path = os.path.join(self.directory, f"{self.name}-{capacity}.rra")
+        with open(path + ".tmp", "wb") as f:
+            f.write(HEADER.pack(MAGIC, self.step, self.rows, capacity))
+            f.write(self._view[HEADER.size:self._size(self.capacity)])
+            f.truncate(self._size(capacity))
+        os.replace(path + ".tmp", path)
+        # Makes stale() true for every process that has the old file mapped
+        HEADER.pack_into(self._map, 0, MAGIC, self.step, self.rows, capacity)
+        self.reopen()
+
+    def row(self, bucket):
+        """ Row holding bucket, taken over and zeroed if it held an older one """
+        r = bucket % self.rows
+        if self.buckets[r] != bucket:
+            self.buckets[r] = bucket
+            self.data[r::self.rows] = array('Q', [0]) * (2 * self.capacity)
+        return r
+
+    def runs(self, first, last):
+        """ [(start row, end row)] of the rows holding buckets first..last, as contiguous runs """
+        runs = []
+        rows, buckets = self.rows, self.buckets
+        start = end = None
+        for bucket in range(max(first, last - rows + 1), last + 1):
+            r = bucket % rows
+            if buckets[r] != bucket:
+                # Never written, or overwritten by a later bucket
+                continue
+            if r != end:
+                if start is not None:
+                    runs.append((start, end))
+                start = r
+            end = r + 1
+        if start is not None:
+            runs.append((start, end))
+        return runs
+
+    def slot_totals(self, slot, runs):
+        base = 2 * slot * self.rows
+        data = self.data
+        rx = sum(sum(data[base + a:base + b]) for a, b in runs)
+        base += self.rows
+        tx = sum(sum(data[base + a:base + b]) for a, b in runs)
+        return rx, tx
+
+
+class TrafficStore:
+    def __init__(self, directory, archives=ARCHIVES):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(os.path.join(directory, "lock"))
+        self._peers_path = os.path.join(directory, "peers")
+        self.keys = []
+        self.slots = {}
+        self._peers_size = 0
+        with self._file_lock:
+            self._load_keys()
+            capacity = max(-(-len(self.keys) // SLOT_CHUNK) * SLOT_CHUNK, SLOT_CHUNK)
+            self.archives = [_Archive(directory, name, step, rows, capacity) for name, step, rows in archives]
+            self._counters = _Archive(directory, "counters", 0, 1, capacity)
+
+    def close(self):
+        with self._lock:
+            for archive in self.archives + [self._counters]:
+                archive.close()
+
+    def _load_keys(self):
+        # Slot n is line n of the peers file; other processes only ever append
+        size = os.path.getsize(self._peers_path) if os.path.exists(self._peers_path) else 0
+        if size == self._peers_size:
+            return
+        with open(self._peers_path, "rb") as f:
+            f.seek(self._peers_size)
+            # Up to the last complete line
+            data = f.read(size - self._peers_size)
+            data = data[:data.rfind(b"\n") + 1]
+        for line in data.decode().splitlines():
+            self.slots[line] = len(self.keys)
+            self.keys.append(line)
+        self._peers_size += len(data)
+
+    def _sync(self):
+        # Catch up with what other processes wrote
+        self._load_keys()
+        for archive in self.archives + [self._counters]:
+            if archive.stale():
+                archive.reopen()
+
+    def _add_slots(self, keys):
+        with open(self._peers_path, "ab") as f:
+            f.write("".join(key + "\n" for key in keys).encode())
+            self._peers_size = f.tell()
+        for key in keys:
+            self.slots[key] = len(self.keys)
+            self.keys.append(key)
+        if len(self.keys) > self._counters.capacity:
+            capacity = -(-len(self.keys) // SLOT_CHUNK) * SLOT_CHUNK
+            for archive in self.archives + [self._counters]:
+                archive.grow(capacity)
+
+    @property
+    def last_sample(self):
+        """ Time of the newest sample, 0 if nothing was recorded yet """
+        return self._counters.buckets[0]
+
+    def record(self, counters, timestamp=None):
+        """
+        Add one sample. counters: iterable of (public_key, rx, tx, ...) raw
+        totals, e.g. PeerTable.counters(). Returns how many peers had traffic.
+        """
+        counters = [(c[0], c[1], c[2]) for c in counters]
+        with self._lock, self._file_lock:
+            self._sync()
+            new = [key for key, _, _ in counters if key not in self.slots]
+            if new:
+                self._add_slots(list(dict.fromkeys(new)))
+            last = self._counters
+            # Never earlier than the previous sample, so a clock going back can't reuse newer rows
+            timestamp = max(int(time.time() if timestamp is None else timestamp), last.buckets[0])
+            rows = [(a.data, a.rows, a.row(timestamp // a.step)) for a in self.archives]
+            slots, known, active = self.slots, last.data, 0
+            first = set(new)
+            for key, rx, tx in counters:
+                slot = slots[key]
+                i = 2 * slot
+                rx_delta = rx - known[i] if rx >= known[i] else rx
+                tx_delta = tx - known[i + 1] if tx >= known[i + 1] else tx
+                known[i], known[i + 1] = rx, tx
+                if key in first or not (rx_delta or tx_delta):
+                    continue
+                active += 1
+                for data, n, r in rows:
+                    data[i * n + r] += rx_delta
+                    data[(i + 1) * n + r] += tx_delta
+            last.buckets[0] = timestamp
+            return active
+
+    def _archive_for(self, start, resolution=None):
+        if resolution is not None:
+            for archive in self.archives:
+                if archive.name == resolution:
+                    return archive
+            raise ValueError(f"Unknown resolution {resolution!r}, use one of {', '.join(a.name for a in self.archives)}")
+        newest = self.last_sample
+        for archive in self.archives:
+            if start is not None and start >= (newest // archive.step - archive.rows + 1) * archive.step:
+                return archive
+        return self.archives[-1]
+
+    def _range(self, start, end, resolution):
+        # (archive, first bucket, last bucket) for [start, end)
+        self._sync()
+        end = self.last_sample + 1 if end is None else end
+        archive = self._archive_for(start, resolution)
+        first = 0 if start is None else int(start) // archive.step
+        return archive, first, (int(end) - 1) // archive.step
+
+    def usage(self, public_key, start=None, end=None, resolution=None):
+        """ (rx, tx) bytes of one peer in [start, end), to the archive's resolution """
+        with self._lock, self._file_lock:
+            slot = self.slots.get(public_key)
+            if slot is None:
+                return 0, 0
+            archive, first, last = self._range(start, end, resolution)
+            return archive.slot_totals(slot, archive.runs(first, last))
+
+    def totals(self, start=None, end=None, resolution=None):
+        """ {public_key: (rx, tx)} for every peer with traffic in [start, end) """
+        with self._lock, self._file_lock:
+            archive, first, last = self._range(start, end, resolution)
+            runs = archive.runs(first, last)
+            totals = {}
+            for slot, key in enumerate(self.keys):
+                rx, tx = archive.slot_totals(slot, runs)
+                if rx or tx:
+                    totals[key] = (rx, tx)
+            return totals
+
+    def series(self, public_key, start=None, end=None, resolution=None):
+        """ [(bucket start time, rx, tx)] of one peer, oldest first; buckets without samples are left out """
+        return [(t, rx, tx) for t, _, rx, tx in self.iter_rows(start, end, resolution, [public_key], skip_idle=False)]
+
+    def iter_rows(self, start=None, end=None, resolution=None, keys=None, skip_idle=True):
+        """
+        Yield (bucket start time, public key, rx, tx) bucket by bucket, without
+        building the result in memory. Only the rows of one bucket are read at
+        a time, so a store can be exported while it is being recorded into.
+        """
+        with self._lock, self._file_lock:
+            archive, first, last = self._range(start, end, resolution)
+            slots = list(range(len(self.keys))) if keys is None else [self.slots[k] for k in keys if k in self.slots]
+            keys = [self.keys[s] for s in slots]
+        rows, step = archive.rows, archive.step
+        for bucket in range(max(first, last - rows + 1), last + 1):
+            with self._lock, self._file_lock:
+                if archive.stale():
+                    archive.reopen()
+                r = bucket % rows
+                if archive.buckets[r] != bucket:
+                    continue
+                column = archive.data[r::rows].tolist()
+            for key, slot in zip(keys, slots):
+                rx, tx = column[2 * slot], column[2 * slot + 1]
+                if rx or tx or not skip_idle:
+                    yield bucket * step, key, rx, tx
+
+    def export_csv(self, out, start=None, end=None, resolution=None, names=None):
+        """ Stream rows to the text file out as CSV; names maps public keys to client names. Returns the row count. """
+        import csv
+
+        writer = csv.writer(out)
+        writer.writerow(["time", "name", "public_key", "rx_bytes", "tx_bytes"])
+        count = 0
+        names = names or {}
+        current = stamp = None
+        for t, key, rx, tx in self.iter_rows(start, end, resolution):
+            if t != current:
+                current, stamp = t, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+            writer.writerow((stamp, names.get(key, ""), key, rx, tx))
+            count += 1
+        return count
+
+    def disk_usage(self):
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory))
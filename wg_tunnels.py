@@ -0,0 +1,62 @@
+import time
+
+# Collecting status and `wg show dump` for several tunnels at once.
+#
+# Every tunnel has its own WireGuardManager (see WireGuardManager.tunnel),
+# so config caches, allocators and service watchers are per tunnel while the
+# command runner is shared. collect() puts each tunnel's status query and
+# dump on a bounded thread pool, so a refresh takes about as long as the
+# slowest tunnel instead of the sum of all of them. The pool is sized to the
+# runner's process cap; more threads would only wait on its semaphore.
+
+
+class TunnelState:
+    __slots__ = ("name", "status", "interface", "peers", "error", "duration")
+
+    def __init__(self, name):
+        self.name = name
+        self.status = None
+        # wg_dump.DumpInterface / PeerTable, None when not collected or wg failed
+        self.interface = None
+        self.peers = None
+        self.error = None
+        self.duration = 0.0
+
+    def summary(self):
+        connected = sum(1 for handshake in self.peers.handshakes if handshake) if self.peers is not None else None
+        return {"name": self.name, "status": self.status, "error": self.error,
+                "peers": len(self.peers) if self.peers is not None else None, "connected": connected,
+                "duration_ms": round(self.duration * 1000, 1)}
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args), None, time.perf_counter() - start
+    except Exception as e:
+        return None, str(e), time.perf_counter() - start
+
+
+def collect(managers, executor, status=True, dumps=True, max_age=None):
+    """ [TunnelState] in the order of managers; status and dumps are gathered in parallel """
+    pending = []
+    for manager in managers:
+        state = TunnelState(manager.settings.get("interface_name", "wg0"))
+        status_job = executor.submit(_timed, manager.get_service_status, max_age) if status else None
+        dump_job = executor.submit(_timed, manager.read_wg_dump) if dumps else None
+        pending.append((state, status_job, dump_job))
+
+    states = []
+    for state, status_job, dump_job in pending:
+        if status_job is not None:
+            state.status, state.error, duration = status_job.result()
+            state.duration = duration
+        if dump_job is not None:
+            dump, error, duration = dump_job.result()
+            if dump is not None:
+                state.interface, state.peers = dump
+            else:
+                state.error = state.error or error or "Could not retrieve WireGuard data"
+            state.duration = max(state.duration, duration)
+        states.append(state)
+    return states
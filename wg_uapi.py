@@ -0,0 +1,347 @@
+import base64
+import os
+import socket
+import threading
+import time
+
+from wg_dump import DumpInterface, PeerTable
+
+# Talking to a running tunnel over the WireGuard cross-platform userspace API
+# (UAPI) instead of spawning wg for every poll and change.
+#
+# Userspace implementations (wireguard-go, boringtun) listen on
+# /var/run/wireguard/<iface>.sock, wireguard-go on Windows on a named pipe.
+# A request is "get=1" or "set=1" followed by key=value lines and a blank
+# line; the answer is key=value lines ending in "errno=N" and a blank line.
+# Keys are hex instead of base64. The connection is kept open between
+# requests, so a Monitor poll costs one round trip, not a process start.
+#
+# Kernel WireGuard on Linux and WireGuardNT on Windows don't offer UAPI; the
+# manager falls back to wg when nothing is listening (see
+# WireGuardManager.get_uapi()).
+
+DEFAULT_TIMEOUT = 10.0
+# After a failed connect, wait this long before trying UAPI again
+RETRY_SECONDS = 30.0
+ZERO_KEY = "0" * 64
+
+
+class UapiError(Exception):
+    """ The tunnel answered with a non-zero errno """
+
+
+class UnsupportedArgument(ValueError):
+    """ A `wg set` argument that has no UAPI equivalent here; wg can still apply it """
+
+
+def socket_path(interface):
+    if os.name == "nt":
+        return f"\\\\.\\pipe\\ProtectedPrefix\\Administrators\\WireGuard\\{interface}"
+    return f"/var/run/wireguard/{interface}.sock"
+
+
+def to_hex(key):
+    # ValueError (binascii.Error) for anything that isn't a base64 32-byte key
+    raw = base64.b64decode(key, validate=True)
+    if len(raw) != 32:
+        raise ValueError(f"Not a WireGuard key: {key}")
+    return raw.hex()
+
+
+def to_base64(hex_key):
+    return base64.b64encode(bytes.fromhex(hex_key)).decode()
+
+
+def _endpoint(value):
+    # UAPI only takes addresses; wg resolves host names itself, so do the same
+    import ipaddress
+
+    host, _, port = value.strip().rpartition(":")
+    host = host.strip("[]")
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        host = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0][4][0]
+    return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+
+def set_request(groups):
+    """
+    set=1 request for `wg set` argument groups (wg_apply.set_groups), with
+    preshared keys given as keys ("" clears it) instead of files. Raises
+    UnsupportedArgument, or ValueError for a malformed key or value.
+    """
+    lines = ["set=1"]
+    for group in groups:
+        i = 0
+        while i < len(group):
+            arg = group[i]
+            if arg == "remove":
+                lines.append("remove=true")
+                i += 1
+                continue
+            value = group[i + 1]
+            if arg == "peer":
+                lines.append(f"public_key={to_hex(value)}")
+            elif arg == "allowed-ips":
+                lines.append("replace_allowed_ips=true")
+                lines.extend(f"allowed_ip={ip.strip()}" for ip in value.split(",") if ip.strip())
+            elif arg == "persistent-keepalive":
+                lines.append(f"persistent_keepalive_interval={0 if value in ('', 'off') else int(value)}")
+            elif arg == "endpoint":
+                lines.append(f"endpoint={_endpoint(value)}")
+            elif arg == "preshared-key":
+                lines.append(f"preshared_key={to_hex(value) if value else ZERO_KEY}")
+            else:
+                raise UnsupportedArgument(f"Unsupported wg set argument for UAPI: {arg}")
+            i += 2
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+# Where each per-peer key goes in a row being parsed, in wg show dump column
+# order; 8 collects the keys that aren't needed. A dict lookup per line keeps
+# the ~12 lines per peer cheap.
+_SLOTS = {"rx_bytes": 5, "tx_bytes": 6, "last_handshake_time_sec": 4, "endpoint": 2, "preshared_key": 1,
+          "persistent_keepalive_interval": 7, "protocol_version": 8, "last_handshake_time_nsec": 8}
+
+
+class UapiParser:
+    """
+    Incremental parser for the answer to get=1, producing the same
+    (DumpInterface, PeerTable) as wg_dump.DumpParser. keys: hex -> base64
+    from the previous poll, so known peers don't get converted again.
+    """
+
+    def __init__(self, keys=None):
+        self.peers = PeerTable()
+        self.private_key = "(none)"
+        self.listen_port = "0"
+        self.fwmark = "off"
+        self.errno = None
+        # Peers left out because a number in them didn't parse, as in DumpParser
+        self.skipped = 0
+        # hex -> base64 of every key in this answer, the cache for the next poll
+        self.keys = {}
+        self._known = keys or {}
+        self._peer = None
+        self._pending = b""
+
+    def _key(self, hex_key):
+        key = self._known.get(hex_key)
+        if key is None:
+            key = to_base64(hex_key)
+        self.keys[hex_key] = key
+        return key
+
+    def feed(self, chunk):
+        data = self._pending + chunk if self._pending else chunk
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._pending = data
+            return
+        self._pending = data[end + 1:]
+        self._lines(data[:end].decode('utf-8', errors='replace').split('\n'))
+
+    def _lines(self, lines):
+        peer = self._peer
+        slot_of = _SLOTS.get
+        for line in lines:
+            key, _, value = line.partition('=')
+            slot = slot_of(key)
+            if slot is not None:
+                peer[slot] = value
+            elif key == "allowed_ip":
+                peer[3].append(value)
+            elif key == "public_key":
+                self._flush(peer)
+                peer = [value, ZERO_KEY, "(none)", [], "0", "0", "0", "0", None]
+            elif key == "errno":
+                self._flush(peer)
+                peer = None
+                self.errno = int(value)
+            elif peer is None:
+                if key == "private_key":
+                    self.private_key = self._key(value)
+                elif key == "listen_port":
+                    self.listen_port = value
+                elif key == "fwmark":
+                    self.fwmark = value if value != "0" else "off"
+        self._peer = peer
+
+    def _flush(self, peer):
+        if peer is None:
+            return
+        # Same values and placeholders as a `wg show dump` line
+        try:
+            self.peers.append([self._key(peer[0]), "(none)" if peer[1] == ZERO_KEY else self._key(peer[1]),
+                               peer[2], ",".join(peer[3]) or "(none)", peer[4], peer[5], peer[6],
+                               "off" if peer[7] == "0" else peer[7]])
+        except ValueError:
+            self.skipped += 1
+
+    def close(self):
+        if self._pending:
+            self._lines(self._pending.decode('utf-8', errors='replace').split('\n'))
+            self._pending = b""
+        self._flush(self._peer)
+        self._peer = None
+        if self.errno is None:
+            raise ConnectionError("UAPI answer ended without errno")
+        if self.errno:
+            raise UapiError(f"get failed with errno {self.errno}")
+
+
+class _SocketConnection:
+    def __init__(self, path, timeout):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.settimeout(timeout)
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def read(self):
+        return self.sock.recv(65536)
+
+    def close(self):
+        self.sock.close()
+
+
+class _PipeConnection:
+    # A client end of a named pipe opens like a file, but its reads can't time
+    # out: wait with PeekNamedPipe until data arrives or the deadline passes.
+    def __init__(self, path, timeout):
+        import msvcrt
+        import _winapi
+
+        self._peek = _winapi.PeekNamedPipe
+        self.timeout = timeout
+        self.pipe = open(path, "r+b", buffering=0)
+        self.handle = msvcrt.get_osfhandle(self.pipe.fileno())
+
+    def send(self, data):
+        self.pipe.write(data)
+
+    def read(self):
+        # PeekNamedPipe raises BrokenPipeError once the tunnel closed its end
+        deadline = time.monotonic() + self.timeout
+        delay = 0.0005
+        while True:
+            available = self._peek(self.handle, 0)[0]
+            if available:
+                return self.pipe.read(min(available, 65536))
+            if time.monotonic() >= deadline:
+                raise TimeoutError("UAPI read timed out")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.01)
+
+    def close(self):
+        self.pipe.close()
+
+
+class UapiClient:
+    """
+    One tunnel's UAPI socket. Requests from several threads (Monitor, task
+    runner) are serialized on the one connection.
+    """
+
+    def __init__(self, path, timeout=DEFAULT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.requests = 0
+        self._conn = None
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
+        self._keys = {}
+        self._public_keys = {}
+
+    def available(self):
+        """ True when connected or a connect succeeds; failures are retried after RETRY_SECONDS """
+        with self._lock:
+            if self._conn is not None:
+                return True
+            if time.monotonic() < self._retry_at:
+                return False
+            try:
+                self._connect()
+            except OSError:
+                return False
+            return True
+
+    def _connect(self):
+        try:
+            self._conn = (_PipeConnection if os.name == "nt" else _SocketConnection)(self.path, self.timeout)
+        except OSError:
+            self._retry_at = time.monotonic() + RETRY_SECONDS
+            raise
+
+    def _request(self, payload, consumer):
+        # With self._lock held. A connection the tunnel closed (e.g. it was
+        # restarted) is replaced once, unless part of the answer already arrived
+        # or the tunnel just didn't answer in time.
+        for attempt in (0, 1):
+            if self._conn is None:
+                self._connect()
+            received = False
+            try:
+                self._conn.send(payload)
+                tail = b""
+                while True:
+                    chunk = self._conn.read()
+                    if not chunk:
+                        raise ConnectionError("UAPI connection closed")
+                    received = True
+                    consumer(chunk)
+                    tail = (tail + chunk)[-2:]
+                    if tail == b"\n\n":
+                        self.requests += 1
+                        return
+            except BaseException as e:
+                # Whatever failed, the rest of this answer may still be on its
+                # way; the next request must not read it as its own.
+                self._conn.close()
+                self._conn = None
+                if not isinstance(e, OSError):
+                    raise
+                if attempt or received or isinstance(e, TimeoutError):
+                    self._retry_at = time.monotonic() + RETRY_SECONDS
+                    raise
+
+    def get(self):
+        """ (DumpInterface, PeerTable) of the running tunnel; raises OSError or UapiError """
+        with self._lock:
+            parser = UapiParser(self._keys)
+            self._request(b"get=1\n\n", parser.feed)
+            parser.close()
+            self._keys = parser.keys
+        return DumpInterface(parser.private_key, self._public_key(parser.private_key),
+                             parser.listen_port, parser.fwmark), parser.peers
+
+    def _public_key(self, private_key):
+        if private_key == "(none)":
+            return "(none)"
+        if private_key not in self._public_keys:
+            import wg_keys
+            self._public_keys = {private_key: wg_keys.derive_public_key(private_key)}
+        return self._public_keys[private_key]
+
+    def set(self, groups):
+        """ Apply `wg set` argument groups in one request; raises OSError, UapiError or ValueError (see set_request) """
+        payload = set_request(groups)
+        answer = []
+        with self._lock:
+            self._request(payload, answer.append)
+        status = b"".join(answer).decode('utf-8', errors='replace')
+        errno = next((line[6:] for line in status.split('\n') if line.startswith("errno=")), None)
+        if errno != "0":
+            raise UapiError(f"set failed with errno {errno}")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None